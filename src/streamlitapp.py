@@ -14,7 +14,7 @@ from views import (
     sidebar,
     header,
 )
-from utils import database, api
+from utils import database, api, timing
 from utils.api import UniprotACCType
 from utils.protein_visualization import ColorScheme, VizFilter, Style
 from utils.database import DBFilter
@@ -125,6 +125,7 @@ def initialize_session_state():
         "user_display": "",
         "database_filter": DBFilter(),
         "visualization_filter": VizFilter(style=Style(), selected_id="Q9NVH1"),
+        "active_tab": TABS[0],
     }
     for key, value in default_state.items():
         if key not in st.session_state:
@@ -159,6 +160,34 @@ def handle_list_tab(db_conn):
             "text/csv",
             key="download-csv",
         )
+        protein_list.display_page_navigation(database_filter, st.session_state.data)
+
+
+class IncompleteProteinInfo(Exception):
+    def __init__(self, protein_info: ProteinInfo):
+        super().__init__(protein_info.failed_sources)
+        self.protein_info = protein_info
+
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def cached_protein_info(selected_id: str) -> ProteinInfo:
+    """
+    Caches the protein data, so changing styles or annotation layers only
+    re-renders the viewer instead of refetching the structure. Raises for
+    data with failed upstream requests, which st.cache_data does not store.
+    """
+    protein_info = ProteinInfo.collect_for_id(selected_id)
+    if protein_info.failed_sources:
+        raise IncompleteProteinInfo(protein_info)
+    return protein_info
+
+
+def collect_protein_info(selected_id: str) -> ProteinInfo:
+    """Cached protein data; incomplete data is shown but fetched again next time."""
+    try:
+        return cached_protein_info(selected_id)
+    except IncompleteProteinInfo as e:
+        return e.protein_info
 
 
 def show_3d_visualization(visualization_filter: VizFilter):
@@ -166,7 +195,7 @@ def show_3d_visualization(visualization_filter: VizFilter):
     Display 3D visualization of the protein.
     """
     try:
-        protein_info = ProteinInfo.collect_for_id(visualization_filter.selected_id)
+        protein_info = collect_protein_info(visualization_filter.selected_id)
         protein_detail.create_visualization_for_id(
             protein_info, visualization_filter.style
         )
@@ -180,6 +209,89 @@ def show_3d_visualization(visualization_filter: VizFilter):
         )
 
 
+@st.fragment
+@timing.timed("fragment protein table")
+def protein_table_fragment(db_conn):
+    handle_list_tab(db_conn)
+
+
+@st.fragment
+@timing.timed("fragment database viewer")
+def database_viewer_fragment():
+    """
+    Viewer below the protein table; choosing another protein only reruns this
+    fragment.
+    """
+    if st.session_state.data.empty:
+        return
+
+    options = st.session_state.data[
+        ["UniProt Accession", "UniProt ID"]
+    ].drop_duplicates()
+    options_dict = dict(zip(options["UniProt ID"], options["UniProt Accession"]))
+
+    local_id = st.selectbox(
+        "Choose an ID to visualize predicted transmembrane topology below",
+        options=options["UniProt ID"],
+        format_func=lambda x: f"{x} ({options_dict[x]})",
+        index=0,
+    )
+
+    filter = VizFilter(
+        style=Style(color_scheme=ColorScheme.TRANSMEMBRANE_PREDICTION),
+        selected_id=options_dict[local_id],
+    )
+
+    with st.spinner("Loading Protein Data"):
+        show_3d_visualization(filter)
+
+
+@st.fragment
+@timing.timed("fragment visualization tab")
+def visualization_fragment():
+    # TODO Move Sidebar filter here
+    show_3d_visualization(st.session_state.visualization_filter)
+    st.markdown("---")
+
+
+def database_tab(db_conn):
+    protein_table_fragment(db_conn)
+
+    st.markdown("---")
+    database_viewer_fragment()
+    st.markdown("---")
+
+
+# Unlike st.tabs, only the body of the selected tab is executed
+TABS = ["Overview", "Database", "Visualization", "FAQ", "About"]
+
+
+def display_active_tab(db_conn):
+    """
+    Render the tab bar and the body of the selected tab only, so the
+    visualization is not fetched while another tab is open.
+    """
+    active_tab = st.radio(
+        "Tab",
+        TABS,
+        horizontal=True,
+        label_visibility="collapsed",
+        key="active_tab",
+    )
+
+    if active_tab == "Overview":
+        overview.intro()
+        overview.statistics_dashboard()
+    elif active_tab == "Database":
+        database_tab(db_conn)
+    elif active_tab == "Visualization":
+        visualization_fragment()
+    elif active_tab == "FAQ":
+        faq.quest()
+    elif active_tab == "About":
+        about.handle_about()
+
+
 def maintenance_mode():
     st.title("We'll be back soon!")
     st.image(
@@ -215,6 +327,7 @@ def _setup_logging():
     logging.basicConfig(level=numeric_log_level)
 
 
+@timing.timed("app rerun")
 def main():
     st.set_page_config(page_title="TMvisDB", page_icon="⚛️", layout="wide")
 
@@ -239,52 +352,7 @@ def main():
         # Sidebar
         sidebar.display_sidebar()
 
-        tab_overview, tab_database, tab_visualization, tab_faq, tab_about = st.tabs(
-            ["Overview", "Database", "Visualization", "FAQ", "About"]
-        )
-
-        # Tabs handling
-        with tab_overview:
-            overview.intro()
-
-        with tab_database:
-            handle_list_tab(db_conn)
-
-            st.markdown("---")
-            if not st.session_state.data.empty:
-                options = st.session_state.data[
-                    ["UniProt Accession", "UniProt ID"]
-                ].drop_duplicates()
-                options_dict = dict(
-                    zip(options["UniProt ID"], options["UniProt Accession"])
-                )
-
-                local_id = st.selectbox(
-                    "Choose an ID to visualize predicted transmembrane topology below",
-                    options=options["UniProt ID"],
-                    format_func=lambda x: f"{x} ({options_dict[x]})",
-                    index=0,
-                )
-
-                filter = VizFilter(
-                    style=Style(color_scheme=ColorScheme.TRANSMEMBRANE_PREDICTION),
-                    selected_id=options_dict[local_id],
-                )
-
-                with st.spinner("Loading Protein Data"):
-                    show_3d_visualization(filter)
-            st.markdown("---")
-
-        with tab_visualization:
-            # TODO Move Sidebar filter here
-            show_3d_visualization(st.session_state.visualization_filter)
-            st.markdown("---")
-
-        with tab_faq:
-            faq.quest()
-
-        with tab_about:
-            about.handle_about()
+        display_active_tab(db_conn)
 
     finally:
         if db_conn is not None and not db_conn.is_closed():
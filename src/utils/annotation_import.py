@@ -0,0 +1,255 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Bulk importers for membrane annotations that are otherwise fetched live.
+
+UniProt transmembrane features and TmAlphaFold (TMDET) regions are parsed from
+local dumps and stored in the ``Annotation`` table, so that
+``protein_info.fetch_membrane_annotations`` can serve them without contacting
+the upstream services.
+"""
+import gzip
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from datetime import date
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from utils import api
+from utils.database import DATABASE, Annotation, Sequence
+from utils.membrane_annotation import AnnotationSource, ResidueAnnotation
+
+
+UNIPROT_XML_NS = "{http://uniprot.org/uniprot}"
+FLAT_FILE_RANGE_RE = re.compile(r"^[<>?]?(\d+)\.\.[<>?]?(\d+)$")
+
+
+def _open_text(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt")
+    return path.open("r")
+
+
+def _uniprot_label(description: str | None):
+    return "BS" if description and "Beta" in description else "AH"
+
+
+def parse_uniprot_flat(lines: Iterable[str]):
+    """
+    Parses a UniProtKB flat file (``.dat``) and yields
+    ``(accession, name, annotations)`` for every entry.
+    """
+    name, accession, annotations = None, None, []
+    in_transmem = False
+
+    for line in lines:
+        code = line[:2]
+        if code == "ID":
+            name = line[5:].split()[0]
+        elif code == "AC" and accession is None:
+            accession = line[5:].split(";")[0].strip()
+        elif code == "FT":
+            key = line[5:21].strip()
+            value = line[21:].strip()
+            if key:
+                in_transmem = False
+                if key == "TRANSMEM":
+                    match = FLAT_FILE_RANGE_RE.match(value)
+                    if match:
+                        annotations.append(
+                            ResidueAnnotation(
+                                int(match.group(1)), int(match.group(2)), "AH"
+                            )
+                        )
+                        in_transmem = True
+            elif in_transmem and value.startswith("/note="):
+                annotations[-1].label = _uniprot_label(value)
+        elif code == "//":
+            if accession is not None:
+                yield accession, name, annotations
+            name, accession, annotations = None, None, []
+            in_transmem = False
+
+
+def parse_uniprot_xml(source):
+    """
+    Parses a UniProtKB XML dump and yields ``(accession, name, annotations)``
+    for every entry. Entries are cleared after parsing to keep memory flat.
+    """
+    for _, element in ET.iterparse(source, events=("end",)):
+        if element.tag != f"{UNIPROT_XML_NS}entry":
+            continue
+
+        accession = element.findtext(f"{UNIPROT_XML_NS}accession")
+        name = element.findtext(f"{UNIPROT_XML_NS}name")
+        annotations = []
+        for feature in element.iterfind(f"{UNIPROT_XML_NS}feature"):
+            if feature.get("type") != "transmembrane region":
+                continue
+            begin = feature.find(f"{UNIPROT_XML_NS}location/{UNIPROT_XML_NS}begin")
+            end = feature.find(f"{UNIPROT_XML_NS}location/{UNIPROT_XML_NS}end")
+            if begin is None or end is None:
+                continue
+            if begin.get("position") is None or end.get("position") is None:
+                continue
+            annotations.append(
+                ResidueAnnotation(
+                    int(begin.get("position")),
+                    int(end.get("position")),
+                    _uniprot_label(feature.get("description")),
+                )
+            )
+
+        if accession is not None:
+            yield accession, name, annotations
+        element.clear()
+
+
+def parse_uniprot_json(lines: Iterable[str]):
+    """
+    Parses UniProtKB REST JSON, either one entry per line (JSON Lines) or a
+    single ``{"results": [...]}`` document, and yields
+    ``(accession, name, annotations)``.
+    """
+    lines = iter(lines)
+    first = next(lines, "")
+    if first.lstrip().startswith("{") and first.rstrip().endswith("}"):
+        documents = (json.loads(line) for line in [first, *lines] if line.strip())
+    else:
+        documents = [json.loads(first + "".join(lines))]
+
+    for document in documents:
+        entries = document.get("results", [document])
+        for entry in entries:
+            response = api.uniprot_parse_response({"results": [entry]})
+            if response is not None:
+                yield response.accession, response.name, response.membrane_annotations
+
+
+def parse_tmalphafold_dir(directory: Path):
+    """
+    Parses a directory of TMDET results as served by the TmAlphaFold API
+    (``<UniProt name or accession>.json``) and yields
+    ``(identifier, annotations)``; results without membrane regions yield no
+    annotations, files without a TMDET result are skipped.
+    """
+    for path in sorted(directory.glob("*.json*")):
+        with _open_text(path) as f:
+            try:
+                body = json.load(f)
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping malformed TMDET file: {path}")
+                continue
+        identifier = path.name.split(".")[0]
+        annotations = api.tmalphafold_parse_response(body)
+        if annotations is not None:
+            yield identifier, annotations
+
+
+def _batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def _resolve_sequence_ids(identifiers: list[str]) -> dict[str, int]:
+    query = Sequence.select(
+        Sequence.id, Sequence.uniprot_accession, Sequence.uniprot_id
+    ).where(
+        Sequence.uniprot_accession.in_(identifiers)
+        | Sequence.uniprot_id.in_(identifiers)
+    )
+    resolved = {}
+    for row in query.tuples():
+        resolved[row[1]] = row[0]
+        resolved[row[2]] = row[0]
+    return resolved
+
+
+def import_annotations(
+    records: Iterator[tuple[str, list[ResidueAnnotation]]],
+    source: AnnotationSource,
+    reference_url,
+    date_added: date | None = None,
+    batch_size: int = 10000,
+):
+    """
+    Bulk-loads ``(identifier, annotations)`` records into the ``Annotation``
+    table. Existing annotations of ``source`` are replaced per sequence, so
+    re-running an import is idempotent; a record without annotations removes
+    those of an earlier import.
+
+    Returns the number of sequences and annotations written.
+    """
+    date_added = date_added or date.today()
+    num_sequences, num_annotations, num_missing = 0, 0, 0
+
+    for batch in _batched(records, batch_size):
+        sequence_ids = _resolve_sequence_ids([identifier for identifier, _ in batch])
+        rows = []
+        updated = set()
+        for identifier, annotations in batch:
+            sequence_id = sequence_ids.get(identifier)
+            if sequence_id is None:
+                num_missing += 1
+                continue
+            updated.add(sequence_id)
+            rows.extend(
+                {
+                    "sequence": sequence_id,
+                    "start": annotation.start,
+                    "end": annotation.end,
+                    "label": annotation.label,
+                    "date_added": date_added,
+                    "source_db": source.value,
+                    "source_db_ref": identifier,
+                    "source_db_url": reference_url(identifier),
+                }
+                for annotation in annotations
+            )
+
+        with DATABASE.atomic():
+            Annotation.delete().where(
+                (Annotation.source_db == source.value)
+                & Annotation.sequence.in_(list(updated))
+            ).execute()
+            for chunk in _batched(rows, 500):
+                Annotation.insert_many(chunk).execute()
+
+        num_sequences += len(updated)
+        num_annotations += len(rows)
+        logging.info(
+            f"Imported {num_annotations} {source.value} annotations "
+            f"for {num_sequences} sequences ({num_missing} not in TMvisDB)"
+        )
+
+    return num_sequences, num_annotations
+
+
+def import_uniprot(path: Path, file_format: str, **kwargs):
+    parsers = {
+        "flat": parse_uniprot_flat,
+        "xml": parse_uniprot_xml,
+        "json": parse_uniprot_json,
+    }
+    with _open_text(path) as f:
+        # Entries without transmembrane features are kept, so features
+        # removed from UniProt are removed from TMvisDB too
+        records = (
+            (accession, annotations)
+            for accession, _, annotations in parsers[file_format](f)
+        )
+        return import_annotations(
+            records, AnnotationSource.UNIPROT, api.uniprot_entry_url, **kwargs
+        )
+
+
+def import_tmalphafold(directory: Path, **kwargs):
+    return import_annotations(
+        parse_tmalphafold_dir(directory),
+        AnnotationSource.TMALPHAFOLD,
+        api.tmalphafold_entry_url,
+        **kwargs,
+    )
@@ -1,13 +1,35 @@
 import httpx
+import os
 import re
 from enum import Enum
 import logging
 from dataclasses import dataclass
 
+from utils import timing
 from utils.membrane_annotation import ResidueAnnotation
+from utils.singleflight import SingleFlight
+
+UPSTREAM_FLIGHT = SingleFlight("upstream")
+
+# API base URLs, pointed at utils.upstream_stub in benchmarks
+UNIPROT_API_URL = os.getenv("UNIPROT_API_URL", "https://rest.uniprot.org")
+TMALPHAFOLD_API_URL = os.getenv("TMALPHAFOLD_API_URL", "https://tmalphafold.ttk.hu")
+ALPHAFOLD_API_URL = os.getenv("ALPHAFOLD_API_URL", "https://www.alphafold.ebi.ac.uk")
+
+
+class UpstreamError(Exception):
+    """A failed upstream request, unlike an entry the API does not have."""
 
 
 def _fetch_api_data(url):
+    """
+    Fetches data from a remote API; concurrent requests for the same URL are
+    coalesced into a single upstream request.
+    """
+    return UPSTREAM_FLIGHT.do(url, _fetch_api_data_uncoalesced, url)
+
+
+def _fetch_api_data_uncoalesced(url):
     """
     Fetches data from a remote API and determines the response type based on the Content-Type header.
 
@@ -15,7 +37,11 @@ def _fetch_api_data(url):
         url (str): The URL to fetch data from.
 
     Returns:
-        The response data in the appropriate format (JSON or text), or None if an error occurs.
+        The response data in the appropriate format (JSON or text), or None if the
+        API has no such entry or an unsupported response.
+
+    Raises:
+        UpstreamError: If the request failed, e.g. timed out or a server error.
     """
     try:
         response = httpx.get(url)
@@ -30,8 +56,14 @@ def _fetch_api_data(url):
             logging.error(f"Unsupported Content-Type: {content_type}")
             return None
     except httpx.HTTPStatusError as e:
-        logging.error(f"HTTP error occurred while fetching data from {url}: {e}")
-        return None
+        status = e.response.status_code
+        # Missing or malformed entries are answers; throttling is a failure
+        if 400 <= status < 500 and status not in (408, 429):
+            logging.info(f"HTTP error occurred while fetching data from {url}: {e}")
+            return None
+        raise UpstreamError(f"Fetching data from {url} failed: {e}") from e
+    except httpx.HTTPError as e:
+        raise UpstreamError(f"Fetching data from {url} failed: {e}") from e
     except Exception:
         logging.exception(
             f"An unexpected error occurred while fetching data from {url}"
@@ -84,7 +116,7 @@ def uniprot_query_url(selected_id, input_type):
         "unknown": selected_id,
     }
 
-    return f"https://rest.uniprot.org/uniprotkb/search?query={query_prefix.get(input_type, selected_id)} AND active:true&fields=id,accession,length,ft_transmem&format=json&size=1"
+    return f"{UNIPROT_API_URL}/uniprotkb/search?query={query_prefix.get(input_type, selected_id)} AND active:true&fields=id,accession,length,ft_transmem&format=json&size=1"
 
 
 def uniprot_entry_url(selected_id):
@@ -95,6 +127,33 @@ def uniprot_taxonomy_url(taxon_id):
     return f"https://www.uniprot.org/taxonomy/{taxon_id}"
 
 
+def uniprot_taxonomy_api_url(taxon_id):
+    return f"{UNIPROT_API_URL}/taxonomy/{taxon_id}.json"
+
+
+def uniprot_parse_taxonomy(body):
+    """
+    Parses a UniProt taxonomy entry into (taxon id, name, (super kingdom,
+    clade)); the clade is the first one of the lineage, as in
+    tools/convert_mongodp.ipynb.
+    """
+    if not body or "scientificName" not in body:
+        return None
+    super_kingdom = None
+    clade = None
+    for entry in body.get("lineage", []):
+        # NCBI renamed the rank superkingdom to domain
+        if entry["rank"] in ("superkingdom", "domain"):
+            super_kingdom = entry["scientificName"]
+        elif entry["rank"] == "clade" and clade is None:
+            clade = entry["scientificName"]
+    return (
+        str(body["taxonId"]),
+        body["scientificName"],
+        (super_kingdom or "Unknown", clade),
+    )
+
+
 def uniprot_parse_response(body):
     """
     Parses the UniProt API response and extracts relevant information.
@@ -123,6 +182,7 @@ def uniprot_parse_response(body):
         return None
 
 
+@timing.timed("uniprot request")
 def uniprot_fetch_annotation(selected_id):
     """
     Fetches the transmembrane vector information for a given ID from the UniProt database.
@@ -141,7 +201,7 @@ def tmalphafold_query_url(up_name):
     """
     Constructs the URL for querying the TmAlphaFold database.
     """
-    return f"https://tmalphafold.ttk.hu/api/tmdet/{up_name}.json"
+    return f"{TMALPHAFOLD_API_URL}/api/tmdet/{up_name}.json"
 
 
 def tmalphafold_entry_url(up_name):
@@ -168,6 +228,7 @@ def tmalphafold_parse_response(body):
     return annotations if len(annotations) > 0 else None
 
 
+@timing.timed("tmalphafold request")
 def tmalphafold_fetch_annotation(up_name):
     """
     Fetches transmembrane annotation for a given protein name from TmAlphaFold.
@@ -185,12 +246,13 @@ def tmalphafold_fetch_annotation(up_name):
     return tmaf_annotations
 
 
+@timing.timed("alphafold request")
 def alphafolddb_fetch_structure(selected_id):
     """
     Fetches the AlphaFold structure for a given ID from the AlphaFold DB API.
     Returns the sequence and the associated PDB file content.
     """
-    afdb_api_path = f"https://www.alphafold.ebi.ac.uk/api/prediction/{selected_id}"
+    afdb_api_path = f"{ALPHAFOLD_API_URL}/api/prediction/{selected_id}"
     afdb_json = _fetch_api_data(afdb_api_path)
 
     if not afdb_json:
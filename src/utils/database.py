@@ -1,10 +1,21 @@
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from datetime import datetime
+from enum import Enum
+import json
+import logging
 import os
 from functools import reduce
 from operator import and_
+from pathlib import Path
 import random
+import threading
+import uuid
 
 from peewee import (
+    Expression,
+    Node,
+    Ordering,
     SqliteDatabase,
     Model,
     CharField,
@@ -13,11 +24,24 @@ from peewee import (
     AutoField,
     TextField,
     DateField,
+    DateTimeField,
+    CompositeKey,
     FloatField,
     BooleanField,
     fn,
+    Field,
+    OperationalError,
+    Tuple,
+    NodeList,
+    SQL,
+    Value,
 )
 
+try:
+    import duckdb
+except ImportError:  # Optional, only needed for the analytics engine
+    duckdb = None
+
 import utils.lineage_definitions as lineage_definitions
 from .lineage_definitions import (
     TaxaSelectionCriterion,
@@ -34,6 +58,11 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///data/tmvis.db")
 # Database connection
 DATABASE = SqliteDatabase(DATABASE_URL.split("///")[-1])
 
+# Parquet snapshot written by tools/export_parquet.py, used with DuckDB
+PARQUET_DIR = os.getenv("PARQUET_DIR")
+# Build id and proteins of the database a snapshot was exported from
+SNAPSHOT_MANIFEST = "snapshot.json"
+
 
 def set_pragma_settings(db):
     db.execute_sql(f"PRAGMA cache_size = {-1024 * 64}")  # Set cache size to 64MB
@@ -44,12 +73,22 @@ def set_pragma_settings(db):
         "PRAGMA mmap_size = 268435456"
     )  # Use memory-mapped I/O for performance
     db.execute_sql("PRAGMA read_uncommitted = true")  # Allow read uncommitted
-    db.execute_sql("PRAGMA optimize")  # Run the optimize pragma
+
+
+def database_version(path: str):
+    """Changes whenever the database file is replaced or written to."""
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
 
 
 def initialize_database_connection():
     DATABASE.connect()
     set_pragma_settings(DATABASE)
+    # Once at startup; set_pragma_settings runs for every new connection
+    DATABASE.execute_sql("PRAGMA optimize")
     return DATABASE
 
 
@@ -76,12 +115,20 @@ class Organism(BaseModel):
 
 class Sequence(BaseModel):
     id = AutoField(primary_key=True)
-    uniprot_id = CharField()
+    uniprot_id = CharField(index=True)
     uniprot_accession = CharField(index=True, unique=True)
     organism = ForeignKeyField(Organism, backref="sequences", index=True)
     sequence = TextField()
     seq_length = IntegerField(index=True)
 
+    class Meta:
+        indexes = (
+            (
+                ("organism", "seq_length"),
+                False,
+            ),  # Proteins of an organism ordered by length
+        )
+
 
 class TMInfo(BaseModel):
     id = AutoField(primary_key=True)
@@ -103,6 +150,13 @@ class TMInfo(BaseModel):
                 ("has_alpha_helix", "has_beta_strand", "has_signal"),
                 False,
             ),  # Composite index
+            # Sort keys; the sequence breaks ties for stable keyset paging
+            (("tm_helix_count", "sequence"), False),
+            (("tm_strand_count", "sequence"), False),
+            (("signal_count", "sequence"), False),
+            (("tm_helix_percent", "sequence"), False),
+            (("tm_strand_percent", "sequence"), False),
+            (("signal_percent", "sequence"), False),
         )
 
 
@@ -115,7 +169,9 @@ class Annotation(BaseModel):
         max_length=100,
     )
     date_added = DateField()
-    source_db = CharField(choices=["topdb", "membranome", "tmbed"])
+    source_db = CharField(
+        choices=["topdb", "membranome", "tmbed", "uniprot", "tmalphafold"]
+    )
     source_db_ref = CharField(null=True)
     source_db_url = CharField(max_length=400, null=True)
 
@@ -128,6 +184,122 @@ class Annotation(BaseModel):
         )
 
 
+class NumericHistogram(BaseModel):
+    """Equi-depth histogram buckets of the numeric TMInfo columns."""
+
+    id = AutoField(primary_key=True)
+    column = CharField(index=True)
+    bucket = IntegerField()
+    low = FloatField()
+    high = FloatField()
+    count = IntegerField()
+
+
+class ImportedChunk(BaseModel):
+    """TMbed prediction chunks and run dates loaded into the database."""
+
+    chunk = IntegerField()
+    run_on = DateField()
+    sequences = IntegerField()
+    imported_at = DateTimeField()
+
+    class Meta:
+        primary_key = CompositeKey("chunk", "run_on")
+        without_rowid = True
+
+
+class ImportCheckpoint(BaseModel):
+    """Lines of an export file committed by an incremental import."""
+
+    export = CharField(primary_key=True)
+    lines = IntegerField()
+    completed = BooleanField(default=False)
+    updated_at = DateTimeField()
+
+    class Meta:
+        without_rowid = True
+
+
+class DatabaseBuild(BaseModel):
+    """
+    Id of the proteins in the database, renewed by every import that writes
+    them. Copies of the file keep it, so it identifies data derived from the
+    proteins, like the Parquet snapshot, independent of the file.
+    """
+
+    build_id = CharField(primary_key=True)
+    built_at = DateTimeField()
+
+    class Meta:
+        without_rowid = True
+
+
+def build_id() -> str | None:
+    try:
+        return DatabaseBuild.select(DatabaseBuild.build_id).scalar()
+    except OperationalError:
+        return None
+
+
+def renew_build_id() -> str:
+    """Records a new build id after the proteins of the database changed."""
+    DatabaseBuild.create_table(safe=True)
+    new_id = uuid.uuid4().hex
+    with DATABASE.atomic():
+        DatabaseBuild.delete().execute()
+        DatabaseBuild.create(build_id=new_id, built_at=datetime.now())
+    return new_id
+
+
+class OrganismCount(BaseModel):
+    """Number of proteins per organism, computed with the statistics."""
+
+    organism = ForeignKeyField(Organism, primary_key=True)
+    count = IntegerField()
+
+
+class LineageTopologyCount(BaseModel):
+    """Proteins per lineage and topology signature, computed with the statistics."""
+
+    super_kingdom = CharField()
+    clade = CharField(null=True)
+    topology = IntegerField()
+    proteins = IntegerField()
+
+
+class DistributionBucket(BaseModel):
+    """Fixed-width histograms per topology signature, computed with the statistics."""
+
+    column = CharField()
+    topology = IntegerField()
+    low = IntegerField()
+    proteins = IntegerField()
+
+
+class DatabaseShard(BaseModel):
+    """
+    Shard files of a sharded database, only present in its catalog. The path
+    is relative to the catalog, the ids are those of the unsharded database.
+    """
+
+    super_kingdom = CharField(primary_key=True)
+    path = CharField()
+    proteins = IntegerField()
+    max_id = IntegerField()
+
+
+class ProteinShard(BaseModel):
+    """
+    Super kingdom, and so the shard, of every protein of a sharded database,
+    only present in its catalog. The ids are those of the unsharded database.
+    """
+
+    id = IntegerField(primary_key=True)
+    uniprot_accession = CharField(unique=True)
+    uniprot_id = CharField(index=True)
+    super_kingdom = CharField()
+
+
 SEQUENCE_INFO = [
     Sequence.uniprot_id,
     Sequence.uniprot_accession,
@@ -145,6 +317,80 @@ SEQUENCE_INFO = [
 ]
 
 
+# Signature by has_alpha_helix + 2 * has_beta_strand + 4 * has_signal
+TOPOLOGY_SIGNATURES = ["-", "H", "B", "HB", "S", "HS", "BS", "HBS"]
+
+
+def topology_code():
+    """Index of the topology signature of a TMInfo row."""
+    return (
+        TMInfo.has_alpha_helix.cast("INTEGER")
+        + TMInfo.has_beta_strand.cast("INTEGER") * 2
+        + TMInfo.has_signal.cast("INTEGER") * 4
+    )
+
+
+class SortKey(Enum):
+    NONE = "None"
+    SEQUENCE_LENGTH = "Sequence length"
+    TM_HELIX_COUNT = "Transmembrane helix residues"
+    TM_STRAND_COUNT = "Transmembrane strand residues"
+    SIGNAL_COUNT = "Signal peptide residues"
+    TM_HELIX_PERCENT = "Transmembrane helix percentage"
+    TM_STRAND_PERCENT = "Transmembrane strand percentage"
+    SIGNAL_PERCENT = "Signal peptide percentage"
+
+
+SORT_COLUMNS = {
+    SortKey.SEQUENCE_LENGTH: Sequence.seq_length,
+    SortKey.TM_HELIX_COUNT: TMInfo.tm_helix_count,
+    SortKey.TM_STRAND_COUNT: TMInfo.tm_strand_count,
+    SortKey.SIGNAL_COUNT: TMInfo.signal_count,
+    SortKey.TM_HELIX_PERCENT: TMInfo.tm_helix_percent,
+    SortKey.TM_STRAND_PERCENT: TMInfo.tm_strand_percent,
+    SortKey.SIGNAL_PERCENT: TMInfo.signal_percent,
+}
+
+
+class RangeColumn(Enum):
+    TM_HELIX_COUNT = "Transmembrane helix residues"
+    TM_STRAND_COUNT = "Transmembrane strand residues"
+    SIGNAL_COUNT = "Signal peptide residues"
+    TM_HELIX_PERCENT = "Transmembrane helix percentage"
+    TM_STRAND_PERCENT = "Transmembrane strand percentage"
+    SIGNAL_PERCENT = "Signal peptide percentage"
+
+
+RANGE_COLUMNS = {
+    RangeColumn.TM_HELIX_COUNT: TMInfo.tm_helix_count,
+    RangeColumn.TM_STRAND_COUNT: TMInfo.tm_strand_count,
+    RangeColumn.SIGNAL_COUNT: TMInfo.signal_count,
+    RangeColumn.TM_HELIX_PERCENT: TMInfo.tm_helix_percent,
+    RangeColumn.TM_STRAND_PERCENT: TMInfo.tm_strand_percent,
+    RangeColumn.SIGNAL_PERCENT: TMInfo.signal_percent,
+}
+
+
+@dataclass(frozen=True)
+class NumericRange:
+    column: RangeColumn
+    low: float | None = None
+    high: float | None = None
+    # Unselective ranges are evaluated per row instead of via their index
+    use_index: bool = True
+
+    def expression(self):
+        column = RANGE_COLUMNS[self.column]
+        if not self.use_index:
+            # The unary plus keeps SQLite from using the index on the column
+            column = NodeList((SQL("+"), column), glue="")
+        if self.low is not None and self.high is not None:
+            return column.between(self.low, self.high)
+        if self.low is not None:
+            return column >= self.low
+        return column <= self.high
+
+
 @dataclass
 class DBFilter:
     taxonomy_selection: TaxaSelectionCriterion = TaxaSelectionCriterion.ORGANISM
@@ -156,15 +402,28 @@ class DBFilter:
     sequence_lengths: tuple[int, int] = (16, 5500)
     num_sequences: int = 1000
     random_selection: bool = True
-
-    def construct_query(self):
-        query = Sequence.select(*SEQUENCE_INFO)
+    sort_key: SortKey = SortKey.NONE
+    sort_descending: bool = True
+    # (sort value, sequence id) of the last row of the previous page
+    cursor: tuple | None = None
+    ranges: tuple[NumericRange, ...] = ()
+
+    @property
+    def is_sorted(self):
+        return not self.random_selection and self.sort_key != SortKey.NONE
+
+    def construct_query(self, max_id: int | None = None):
+        if self.is_sorted:
+            query = Sequence.select(*self.sorted_columns())
+        else:
+            query = Sequence.select(*SEQUENCE_INFO)
 
         if not self.random_selection:
             filters = (
                 self.sequence_length_filter()
                 + self.topology_filter()
                 + self.taxonomy_filter()
+                + self.range_filter()
             )
 
             if filters:
@@ -173,17 +432,112 @@ class DBFilter:
 
         query = query.join(TMInfo).switch(Sequence).join(Organism)
 
+        if self.is_sorted:
+            query = self.sort(query)
+
         if self.random_selection:
-            max_id = Sequence.select(fn.Max(Sequence.id)).scalar()
+            if max_id is None:
+                max_id = Sequence.select(fn.Max(Sequence.id)).scalar()
             random_ids = random.sample(
                 range(1, max_id + 1), min(self.num_sequences * 2, max_id)
             )
 
-            query = query.where(Sequence.id.in_(random_ids))
+            # The limit must not prefer low ids, which are clustered by organism
+            query = query.where(Sequence.id.in_(random_ids)).order_by(fn.Random())
 
         query = query.limit(self.num_sequences)
         return query
 
+    def cache_key(self) -> tuple:
+        """
+        Canonical form of the filter: filters that construct the same query
+        share a key, e.g. the signal peptide flag only matters for beta
+        strands and the domain is ignored when selecting by organism.
+        """
+        if self.random_selection:
+            return ("random", self.num_sequences)
+
+        if self.is_sorted:
+            sort = (self.sort_key.value, self.sort_descending, self.cursor)
+        else:
+            sort = None
+
+        taxonomy = self.taxonomy_key()
+
+        signal_peptide = (
+            self.signal_peptide if self.topology == Topology.BETA_STRAND else None
+        )
+        sequence_lengths = (
+            None
+            if self.sequence_lengths == (16, 5500)
+            else tuple(self.sequence_lengths)
+        )
+
+        ranges = tuple(
+            sorted(
+                (r.column.value, r.low, r.high)
+                for r in self.ranges
+                if r.low is not None or r.high is not None
+            )
+        )
+
+        return (
+            "filter",
+            taxonomy,
+            self.topology.value,
+            signal_peptide,
+            sequence_lengths,
+            ranges,
+            self.num_sequences,
+            sort,
+        )
+
+    def taxonomy_key(self) -> tuple:
+        """("organism", taxon id) or ("lineage", domain, kingdom), None for all."""
+        if (
+            self.taxonomy_selection == TaxaSelectionCriterion.ORGANISM
+            and self.organism_id is not None
+        ):
+            return ("organism", str(self.organism_id))
+        kingdom_type = lineage_definitions.get_kingdom_for_domain(self.domain)
+        return (
+            "lineage",
+            None if self.domain == Domain.ALL else self.domain.value,
+            None if self.kingdom == kingdom_type.ALL else self.kingdom.value,
+        )
+
+    def sorted_columns(self):
+        """Sorted results include the sort column and the id for the cursor."""
+        sort_column = SORT_COLUMNS[self.sort_key]
+        columns = [Sequence.id] + SEQUENCE_INFO
+        if not any(column is sort_column for column in SEQUENCE_INFO):
+            columns.append(sort_column)
+        return columns
+
+    def sort(self, query):
+        """
+        Orders by the sort column and breaks ties by the sequence id, which
+        matches the (column, sequence) indexes, so a top-k query reads the
+        first k index entries instead of sorting all matches. Paging uses
+        the cursor instead of an offset.
+        """
+        sort_column = SORT_COLUMNS[self.sort_key]
+        # TMInfo.sequence equals Sequence.id and is part of the TMInfo indexes
+        tiebreak = Sequence.id if sort_column.model is Sequence else TMInfo.sequence
+        key = Tuple(sort_column, tiebreak)
+
+        if self.cursor is not None:
+            cursor = Tuple(*self.cursor)
+            query = query.where(key < cursor if self.sort_descending else key > cursor)
+
+        if self.sort_descending:
+            return query.order_by(sort_column.desc(), tiebreak.desc())
+        return query.order_by(sort_column.asc(), tiebreak.asc())
+
+    def next_page(self, sort_value, sequence_id: int):
+        """Returns the filter for the page after the row with these values."""
+        return replace(self, cursor=(sort_value, sequence_id))
+
     def sequence_length_filter(self):
         filters = []
         if self.sequence_lengths != (16, 5500):
@@ -194,6 +548,13 @@ class DBFilter:
             )
         return filters
 
+    def range_filter(self):
+        return [
+            numeric_range.expression()
+            for numeric_range in self.ranges
+            if numeric_range.low is not None or numeric_range.high is not None
+        ]
+
     def topology_filter(self):
         filters = []
         if self.topology != Topology.ALL:
@@ -225,8 +586,313 @@ class DBFilter:
         return filters
 
 
+class ShardRouter:
+    """
+    Routes queries of a sharded database. ``DATABASE`` is then bound to the
+    catalog, which holds the organisms, the statistics and the shard table
+    but no proteins. A shard is attached to a connection as ``shard``; as
+    the catalog has no sequence, TMInfo or annotation tables, the unqualified
+    table names of all queries resolve to the attached shard while organisms
+    are joined from the catalog.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._shards: dict[str, DatabaseShard] = {}
+
+    def shards(self) -> dict[str, DatabaseShard]:
+        """Shards by super kingdom, empty for an unsharded database."""
+        version = database_version(DATABASE.database)
+        with self._lock:
+            if version == self._version:
+                return self._shards
+        try:
+            shards = {shard.super_kingdom: shard for shard in DatabaseShard.select()}
+        except OperationalError:
+            shards = {}
+        with self._lock:
+            self._version, self._shards = version, shards
+        return shards
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.shards())
+
+    def max_id(self) -> int | None:
+        return max((shard.max_id for shard in self.shards().values()), default=None)
+
+    def path(self, shard: DatabaseShard) -> str:
+        return (Path(DATABASE.database).parent / shard.path).as_posix()
+
+    def paths_for(self, db_filter: DBFilter) -> list[str]:
+        """Shard files that can hold proteins matching the filter."""
+        shards = self.shards()
+        super_kingdoms = None
+        if not db_filter.random_selection:
+            taxonomy = db_filter.taxonomy_key()
+            if taxonomy[0] == "organism":
+                super_kingdom = (
+                    Organism.select(Organism.super_kingdom)
+                    .where(Organism.taxon_id == taxonomy[1])
+                    .scalar()
+                )
+                # Unknown organisms still get the empty result of one shard
+                super_kingdoms = [super_kingdom] if super_kingdom in shards else None
+            elif taxonomy[1] is not None:
+                super_kingdoms = [taxonomy[1]] if taxonomy[1] in shards else None
+        if super_kingdoms is None:
+            super_kingdoms = list(shards)
+        return list(dict.fromkeys(self.path(shards[name]) for name in super_kingdoms))
+
+    def merge(
+        self, db_filter: DBFilter, columns: list[str], row_lists: list[list[tuple]]
+    ) -> list[tuple]:
+        """
+        Combines the results of the shards into the result of the unsharded
+        database. Shards keep the global ids, so sorted results merge on the
+        (sort value, id) key of the cursor, and random selections, which
+        query the same random ids in all shards, are a uniform sample of the
+        union.
+        """
+        rows = [row for shard_rows in row_lists for row in shard_rows]
+        if db_filter.random_selection:
+            random.shuffle(rows)
+        elif db_filter.is_sorted and rows:
+            value = columns.index(SORT_COLUMNS[db_filter.sort_key].column_name)
+            sequence_id = columns.index(Sequence.id.column_name)
+            rows.sort(
+                key=lambda row: (row[value], row[sequence_id]),
+                reverse=db_filter.sort_descending,
+            )
+        return rows[: db_filter.num_sequences]
+
+    @contextmanager
+    def attached(self, path: str):
+        """Attaches the shard to the connection of the current thread."""
+        DATABASE.execute_sql("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            yield
+        finally:
+            DATABASE.execute_sql("DETACH DATABASE shard")
+
+    @contextmanager
+    def protein_shard(self, selected_id: str):
+        """
+        Attaches the shard holding the protein, as found in the catalog, for
+        the detail queries; for an unknown protein any shard, so the queries
+        find nothing as usual. Does nothing for an unsharded database.
+        """
+        shards = self.shards()
+        if not shards:
+            yield
+            return
+        super_kingdom = (
+            ProteinShard.select(ProteinShard.super_kingdom)
+            .where(
+                (ProteinShard.uniprot_accession == selected_id)
+                | (ProteinShard.uniprot_id == selected_id)
+            )
+            .scalar()
+        )
+        shard = shards.get(super_kingdom) or next(iter(shards.values()))
+        with self.attached(self.path(shard)):
+            yield
+
+
+SHARD_ROUTER = ShardRouter()
+
+
+class ProteinRow(Model):
+    """
+    Row of the Parquet snapshot: the browse columns of a protein in one flat
+    table, partitioned by super kingdom. ``topology`` is one of the
+    ``TOPOLOGY_SIGNATURES``, e.g. "HS" for alpha helices and a signal peptide.
+    """
+
+    id = IntegerField(primary_key=True)
+    uniprot_id = CharField()
+    uniprot_accession = CharField()
+    seq_length = IntegerField()
+    taxon_id = CharField()
+    organism_name = CharField()
+    super_kingdom = CharField()
+    clade = CharField()
+    has_alpha_helix = BooleanField()
+    has_beta_strand = BooleanField()
+    has_signal = BooleanField()
+    tm_helix_count = IntegerField()
+    tm_strand_count = IntegerField()
+    signal_count = IntegerField()
+    tm_helix_percent = FloatField()
+    tm_strand_percent = FloatField()
+    signal_percent = FloatField()
+    topology = CharField()
+
+    class Meta:
+        table_name = "proteins"
+
+
+# Source column of every column of the snapshot except the topology signature
+FLAT_COLUMNS = {
+    Sequence.id: ProteinRow.id,
+    Sequence.uniprot_id: ProteinRow.uniprot_id,
+    Sequence.uniprot_accession: ProteinRow.uniprot_accession,
+    Sequence.seq_length: ProteinRow.seq_length,
+    Organism.taxon_id: ProteinRow.taxon_id,
+    Organism.name: ProteinRow.organism_name,
+    Organism.super_kingdom: ProteinRow.super_kingdom,
+    Organism.clade: ProteinRow.clade,
+    **{
+        getattr(TMInfo, name): getattr(ProteinRow, name)
+        for name in [
+            "has_alpha_helix",
+            "has_beta_strand",
+            "has_signal",
+            "tm_helix_count",
+            "tm_strand_count",
+            "signal_count",
+            "tm_helix_percent",
+            "tm_strand_percent",
+            "signal_percent",
+        ]
+    },
+}
+# TMInfo is joined on its sequence, which equals the id of the protein
+FLAT_ALIASES = {TMInfo.sequence: ProteinRow.id}
+
+
+def flatten(node):
+    """Rewrites an expression on the joined tables for the snapshot."""
+    if isinstance(node, Field):
+        for columns in (FLAT_COLUMNS, FLAT_ALIASES):
+            for column, flat_column in columns.items():
+                if column is node:
+                    return flat_column
+        raise ValueError(f"{node.model.__name__}.{node.name} is not in the snapshot")
+    if isinstance(node, Expression):
+        return Expression(flatten(node.lhs), node.op, flatten(node.rhs), node.flat)
+    if isinstance(node, Ordering):
+        return Ordering(flatten(node.node), node.direction, node.collation, node.nulls)
+    if isinstance(node, NodeList):
+        return NodeList([flatten(n) for n in node.nodes], node.glue, node.parens)
+    if isinstance(node, (SQL, Value)):
+        return node
+    if isinstance(node, Node):
+        raise ValueError(f"Cannot rewrite {type(node).__name__} for the snapshot")
+    return node
+
+
+class AnalyticsEngine:
+    """
+    DuckDB over the Parquet snapshot. Broad filters and aggregates are
+    scanned column-wise on all cores; point lookups and random selections
+    stay on SQLite. Unavailable without DuckDB or a snapshot, or if the
+    snapshot was exported from another build of the database.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._connection = None
+        self._version = None
+        self._manifest = None
+
+    def manifest(self) -> dict | None:
+        """The manifest of the snapshot if it matches the bound database."""
+        version = database_version(DATABASE.database)
+        with self._lock:
+            if version == self._version:
+                return self._manifest
+        manifest = self._read_manifest()
+        with self._lock:
+            self._version, self._manifest = version, manifest
+        return manifest
+
+    def _read_manifest(self) -> dict | None:
+        path = Path(self.directory) / SNAPSHOT_MANIFEST
+        try:
+            manifest = json.loads(path.read_text())
+        except (OSError, ValueError):
+            logging.warning(f"No manifest in {self.directory}, export it again")
+            return None
+        current = build_id()
+        if current is None or manifest.get("build_id") != current:
+            logging.warning(
+                f"The snapshot in {self.directory} is of build "
+                f"{manifest.get('build_id')}, the database of build {current}; "
+                "export it again"
+            )
+            return None
+        if not any(Path(self.directory).glob("**/*.parquet")):
+            logging.warning(f"No Parquet files in {self.directory}")
+            return None
+        return manifest
+
+    @property
+    def available(self) -> bool:
+        return (
+            duckdb is not None
+            and self.directory is not None
+            and self.manifest() is not None
+        )
+
+    @property
+    def proteins(self) -> int | None:
+        """Proteins of the snapshot, if it is available."""
+        manifest = self.manifest() if self.available else None
+        return manifest["proteins"] if manifest is not None else None
+
+    def cursor(self):
+        """A cursor of the shared connection, one per thread and query."""
+        with self._lock:
+            if self._connection is None:
+                files = (Path(self.directory) / "**" / "*.parquet").as_posix()
+                files = files.replace("'", "''")
+                connection = duckdb.connect()
+                connection.execute(
+                    "CREATE VIEW proteins AS SELECT * FROM "
+                    f"read_parquet('{files}', hive_partitioning = true)"
+                )
+                self._connection = connection
+            return self._connection.cursor()
+
+    def filter_query(self, db_filter: DBFilter):
+        """The query of the filter on the snapshot, with the same columns."""
+        query = db_filter.construct_query()
+        columns = []
+        for column in query._returning:
+            flat_column = flatten(column)
+            # SQLite returns booleans as integers
+            if isinstance(flat_column, BooleanField):
+                flat_column = flat_column.cast("INTEGER")
+            columns.append(flat_column.alias(column.column_name))
+        flat_query = ProteinRow.select(*columns)
+        if query._where is not None:
+            flat_query = flat_query.where(flatten(query._where))
+        if query._order_by:
+            flat_query = flat_query.order_by(*map(flatten, query._order_by))
+        return flat_query.limit(query._limit)
+
+    def histogram(self, column: Field, width: int, group_by: Field, where=None):
+        """
+        The query of (group, bucket start, proteins) rows of a snapshot column
+        in buckets of ``width``, e.g. TM helix residues per clade.
+        """
+        bucket = (fn.FLOOR(column / width) * width).cast("BIGINT")
+        query = ProteinRow.select(
+            group_by.alias("group"), bucket.alias("bucket"), fn.COUNT(SQL("*"))
+        )
+        if where is not None:
+            query = query.where(where)
+        return query.group_by(SQL("1"), SQL("2")).order_by(SQL("1"), SQL("2"))
+
+
+ANALYTICS = AnalyticsEngine(PARQUET_DIR)
+
+
 def get_sequence_data(db_filter: DBFilter):
-    query = db_filter.construct_query()
+    query = db_filter.construct_query(max_id=SHARD_ROUTER.max_id())
     return query
 
 
@@ -242,6 +908,13 @@ def get_sequence_data_for_id(selected_id: str):
     )
 
 
+def get_sequence_for_id(selected_id: str):
+    return Sequence.get_or_none(
+        (Sequence.uniprot_accession == selected_id)
+        | (Sequence.uniprot_id == selected_id)
+    )
+
+
 def get_membrane_annotation_for_id(selected_id: str):
     sequence = Sequence.get_or_none(Sequence.uniprot_accession == selected_id)
 
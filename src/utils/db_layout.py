@@ -0,0 +1,400 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Read-optimized physical layout of TMvisDB.
+
+The database is copied into a new file with a larger page size. Proteins are
+written in the order of the (organism, length) index and get new consecutive
+ids, and their TMInfo and annotations follow in the same order. A filter on
+an organism then reads a contiguous range of pages in every table, and random
+selections no longer hit gaps in the ids. Indexes are created once the rows
+are written and the planner statistics are collected last.
+
+A database can also be split into one shard file per super kingdom plus a
+catalog with the organisms and statistics, which ``database.ShardRouter``
+queries when ``DATABASE_URL`` points to the catalog.
+"""
+
+import logging
+import os
+import re
+import statistics as stats
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from peewee import fn
+
+from utils import database, statistics, tmvis_import
+from utils.database import (
+    DATABASE,
+    Annotation,
+    DatabaseShard,
+    DBFilter,
+    DistributionBucket,
+    Domain,
+    ImportCheckpoint,
+    ImportedChunk,
+    LineageTopologyCount,
+    NumericHistogram,
+    Organism,
+    OrganismCount,
+    ProteinShard,
+    Sequence,
+    SortKey,
+    TaxaSelectionCriterion,
+    TMInfo,
+    Topology,
+)
+from utils.lineage_definitions import get_kingdom_for_domain
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "8192"))
+
+# Rows of the copied tables in the order they are written
+CLUSTER_ORDER = "s.organism_id, s.seq_length, s.id"
+
+CATALOG_NAME = "catalog.db"
+# Tables copied to the catalog of a sharded database
+CATALOG_MODELS = [
+    Organism,
+    NumericHistogram,
+    OrganismCount,
+    LineageTopologyCount,
+    DistributionBucket,
+]
+
+
+def benchmark_filters() -> dict[str, DBFilter]:
+    """Typical app filters on the bound database, with its largest organism."""
+    top_organisms = statistics.load_top_organisms()
+    organism_id = int(top_organisms[0][1]) if top_organisms else DBFilter.organism_id
+    return {
+        "organism": DBFilter(organism_id=organism_id, random_selection=False),
+        "domain and topology": DBFilter(
+            taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+            domain=Domain.BACTERIA,
+            kingdom=get_kingdom_for_domain(Domain.BACTERIA).ALL,
+            topology=Topology.ALPHA_HELIX,
+            random_selection=False,
+        ),
+        "sorted": DBFilter(
+            taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+            random_selection=False,
+            sort_key=SortKey.TM_HELIX_COUNT,
+        ),
+        "random": DBFilter(),
+    }
+
+
+@dataclass
+class LayoutReport:
+    path: Path
+    page_size: int
+    file_size: int
+    stat4: bool
+    # Median seconds per benchmark query
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def log(self):
+        logging.info(
+            f"{self.path}: {self.file_size / 2**20:,.1f} MiB, "
+            f"page size {self.page_size}, "
+            f"{'with' if self.stat4 else 'without'} sqlite_stat4"
+        )
+        for name, seconds in self.timings.items():
+            logging.info(f"  {name}: {seconds * 1000:,.1f} ms")
+
+
+def columns(model, **replacements) -> str:
+    """Column list of the model, with expressions replacing some columns."""
+    return ", ".join(
+        replacements.get(f.column_name, f"t.{f.column_name}")
+        for f in model._meta.sorted_fields
+    )
+
+
+def table_name(model) -> str:
+    return f'"{model._meta.table_name}"'
+
+
+def has_table(schema: str, model) -> bool:
+    return bool(
+        DATABASE.execute_sql(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+            (model._meta.table_name,),
+        ).fetchone()
+    )
+
+
+def copy_clustered(source: Path):
+    """
+    Copies the tables of the database at ``source`` into the empty database
+    bound to ``DATABASE``, clustered by organism and sequence length.
+    """
+    DATABASE.execute_sql("ATTACH DATABASE ? AS source", (source.as_posix(),))
+    DATABASE.execute_sql(
+        "CREATE TEMP TABLE id_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)"
+    )
+    with DATABASE.atomic():
+        DATABASE.execute_sql(
+            "INSERT INTO temp.id_map "
+            f"SELECT s.id, ROW_NUMBER() OVER (ORDER BY {CLUSTER_ORDER}) "
+            f"FROM source.{table_name(Sequence)} s"
+        )
+        DATABASE.execute_sql(
+            f"INSERT INTO {table_name(Organism)} "
+            f"SELECT {columns(Organism)} FROM source.{table_name(Organism)} t "
+            "ORDER BY t.id"
+        )
+        logging.info("Copying sequences")
+        DATABASE.execute_sql(
+            f"INSERT INTO {table_name(Sequence)} "
+            f"SELECT {columns(Sequence, id='m.new_id')} "
+            f"FROM source.{table_name(Sequence)} t "
+            "JOIN temp.id_map m ON m.old_id = t.id ORDER BY m.new_id"
+        )
+        # Dependent rows get new ids in the order of their sequence
+        for model, order in [
+            (TMInfo, "m.new_id, t.id"),
+            (Annotation, "m.new_id, t.start, t.id"),
+        ]:
+            logging.info(f"Copying {model._meta.table_name}")
+            DATABASE.execute_sql(
+                f"INSERT INTO {table_name(model)} "
+                "SELECT "
+                + columns(
+                    model,
+                    id=f"ROW_NUMBER() OVER (ORDER BY {order})",
+                    sequence_id="m.new_id",
+                )
+                + f" FROM source.{table_name(model)} t "
+                f"JOIN temp.id_map m ON m.old_id = t.sequence_id ORDER BY {order}"
+            )
+        for model in [ImportedChunk, ImportCheckpoint]:
+            if has_table("source", model):
+                DATABASE.execute_sql(
+                    f"INSERT INTO {table_name(model)} "
+                    f"SELECT {columns(model)} FROM source.{table_name(model)} t"
+                )
+    DATABASE.execute_sql("DROP TABLE temp.id_map")
+    DATABASE.execute_sql("DETACH DATABASE source")
+
+
+def stat4_available() -> bool:
+    options = {row[0] for row in DATABASE.execute_sql("PRAGMA compile_options")}
+    return "ENABLE_STAT4" in options
+
+
+def benchmark(repeat: int = 5) -> dict[str, float]:
+    """Median time of typical app queries on the bound database."""
+    timings = {}
+    for name, db_filter in benchmark_filters().items():
+        timings[name] = _median_time(
+            lambda f=db_filter: list(
+                database.get_sequence_data(statistics.plan_ranges(f)).tuples()
+            ),
+            repeat,
+        )
+
+    middle = (Sequence.select(fn.MAX(Sequence.id)).scalar() or 0) // 2
+    accession = (
+        Sequence.select(Sequence.uniprot_accession)
+        .where(Sequence.id >= middle)
+        .order_by(Sequence.id)
+        .scalar()
+    )
+    if accession is not None:
+        timings["protein details"] = _median_time(
+            lambda: (
+                database.get_sequence_data_for_id(accession),
+                list(database.get_membrane_annotation_for_id(accession)),
+            ),
+            repeat,
+        )
+    return timings
+
+
+def _median_time(run, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - started)
+    return stats.median(durations)
+
+
+def report(path: Path, repeat: int = 5) -> LayoutReport:
+    """File size, layout and benchmark of the bound database at ``path``."""
+    return LayoutReport(
+        path=path,
+        page_size=DATABASE.execute_sql("PRAGMA page_size").fetchone()[0],
+        file_size=path.stat().st_size,
+        stat4=bool(
+            DATABASE.execute_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat4'"
+            ).fetchone()
+        ),
+        timings=benchmark(repeat),
+    )
+
+
+def write_optimized(
+    source: Path,
+    target: Path,
+    page_size: int = PAGE_SIZE,
+    num_buckets: int = statistics.NUM_BUCKETS,
+    repeat: int = 5,
+) -> LayoutReport:
+    """
+    Writes the read-optimized copy of ``source`` to ``target``. The copy is
+    built next to the target and only moved into place once it is complete,
+    so an app reading ``target`` never sees a partial file.
+    """
+    if target.exists() and target.samefile(source):
+        raise ValueError("The optimized copy must not replace its source")
+    partial = target.with_name(target.name + ".partial")
+    partial.unlink(missing_ok=True)
+
+    started = time.monotonic()
+    DATABASE.init(partial.as_posix())
+    with DATABASE.connection_context():
+        # The page size is fixed once the first table is created
+        DATABASE.execute_sql(f"PRAGMA page_size = {page_size}")
+        for pragma in tmvis_import.LOAD_PRAGMAS:
+            DATABASE.execute_sql(pragma)
+        tmvis_import.create_tables()
+        copy_clustered(source)
+        # The proteins have new ids
+        database.renew_build_id()
+        logging.info(f"Copied rows in {time.monotonic() - started:,.0f}s")
+        tmvis_import.create_indexes()
+        if not stat4_available():
+            logging.info("SQLite is built without STAT4, ANALYZE writes stat1 only")
+        statistics.build_statistics(num_buckets)
+
+    os.replace(partial, target)
+    DATABASE.init(target.as_posix())
+    with DATABASE.connection_context():
+        return report(target, repeat)
+
+
+def shard_name(super_kingdom: str) -> str:
+    return re.sub(r"\W+", "_", super_kingdom.lower()).strip("_") + ".db"
+
+
+def copy_shard(super_kingdom: str):
+    """
+    Copies the proteins of one super kingdom from the attached source into
+    the empty database bound to ``DATABASE``. Ids are kept, so they stay
+    unique across all shards.
+    """
+    with DATABASE.atomic():
+        DATABASE.execute_sql(
+            f"INSERT INTO {table_name(Organism)} "
+            f"SELECT {columns(Organism)} FROM source.{table_name(Organism)} t "
+            "WHERE t.super_kingdom = ? ORDER BY t.id",
+            (super_kingdom,),
+        )
+        DATABASE.execute_sql(
+            f"INSERT INTO {table_name(Sequence)} "
+            f"SELECT {columns(Sequence)} FROM source.{table_name(Sequence)} t "
+            f"WHERE t.organism_id IN (SELECT id FROM main.{table_name(Organism)}) "
+            "ORDER BY t.id"
+        )
+        for model in [TMInfo, Annotation]:
+            DATABASE.execute_sql(
+                f"INSERT INTO {table_name(model)} "
+                f"SELECT {columns(model)} FROM source.{table_name(model)} t "
+                f"WHERE t.sequence_id IN (SELECT id FROM main.{table_name(Sequence)}) "
+                "ORDER BY t.id"
+            )
+
+
+def write_catalog(source: Path, shards: list[tuple[str, str, int, int]]):
+    """
+    Organisms, statistics and shards of ``source`` for the bound database,
+    and the shard of every protein, so a detail view attaches only that one.
+    """
+    for model in CATALOG_MODELS + [DatabaseShard, ProteinShard]:
+        model._schema.create_table(safe=True)
+        model._schema.create_indexes(safe=True)
+    DATABASE.execute_sql("ATTACH DATABASE ? AS source", (source.as_posix(),))
+    with DATABASE.atomic():
+        for model in CATALOG_MODELS:
+            if not has_table("source", model):
+                continue
+            DATABASE.execute_sql(
+                f"INSERT INTO {table_name(model)} "
+                f"SELECT {columns(model)} FROM source.{table_name(model)} t"
+            )
+        DatabaseShard.insert_many(
+            shards,
+            fields=[
+                DatabaseShard.super_kingdom,
+                DatabaseShard.path,
+                DatabaseShard.proteins,
+                DatabaseShard.max_id,
+            ],
+        ).execute()
+        DATABASE.execute_sql(
+            f"INSERT INTO {table_name(ProteinShard)} "
+            "SELECT s.id, s.uniprot_accession, s.uniprot_id, o.super_kingdom "
+            f"FROM source.{table_name(Sequence)} s "
+            f"JOIN source.{table_name(Organism)} o ON o.id = s.organism_id "
+            "ORDER BY s.id"
+        )
+    DATABASE.execute_sql("DETACH DATABASE source")
+
+
+def split_database(
+    source: Path, directory: Path, page_size: int = PAGE_SIZE
+) -> list[tuple[str, str, int, int]]:
+    """
+    Writes one shard per super kingdom of ``source`` and the catalog to
+    ``directory``. The statistics of ``source`` are copied to the catalog,
+    so they have to be built before splitting. The catalog is written last;
+    until then the directory holds no usable database.
+    """
+    DATABASE.init(source.as_posix())
+    with DATABASE.connection_context():
+        if not has_table("main", NumericHistogram):
+            raise ValueError("Build the statistics of the database before splitting")
+        super_kingdoms = [
+            super_kingdom
+            for (super_kingdom,) in Organism.select(Organism.super_kingdom)
+            .distinct()
+            .tuples()
+        ]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    catalog = directory / CATALOG_NAME
+    catalog.unlink(missing_ok=True)
+
+    shards = []
+    for super_kingdom in super_kingdoms:
+        path = directory / shard_name(super_kingdom)
+        path.unlink(missing_ok=True)
+        DATABASE.init(path.as_posix())
+        with DATABASE.connection_context():
+            DATABASE.execute_sql(f"PRAGMA page_size = {page_size}")
+            for pragma in tmvis_import.LOAD_PRAGMAS:
+                DATABASE.execute_sql(pragma)
+            tmvis_import.create_tables()
+            DATABASE.execute_sql("ATTACH DATABASE ? AS source", (source.as_posix(),))
+            copy_shard(super_kingdom)
+            DATABASE.execute_sql("DETACH DATABASE source")
+            proteins = Sequence.select().count()
+            max_id = Sequence.select(fn.MAX(Sequence.id)).scalar()
+            if proteins:
+                tmvis_import.create_indexes()
+                DATABASE.execute_sql("ANALYZE")
+        if not proteins:
+            path.unlink()
+            continue
+        logging.info(f"Shard {super_kingdom}: {proteins:,} proteins in {path}")
+        shards.append((super_kingdom, path.name, proteins, max_id))
+
+    DATABASE.init(catalog.as_posix())
+    with DATABASE.connection_context():
+        write_catalog(source, shards)
+    logging.info(f"Catalog written to {catalog}")
+    return shards
@@ -2,10 +2,12 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import logging
+import threading
 from dataclasses import dataclass, field
 from collections import defaultdict
 from enum import Enum
 
+import numpy as np
 import pandas as pd
 
 from .database import Annotation
@@ -28,8 +30,50 @@ DISPLAY_NAMES = {
 }
 
 
+# Label code 0 marks residues without annotation
+NO_ANNOTATION = "*"
+LABELS: list[str] = [NO_ANNOTATION]
+LABEL_CODES: dict[str, int] = {NO_ANNOTATION: 0}
+_LABELS_LOCK = threading.Lock()
+
+SEGMENT_DTYPE = np.dtype([("start", np.int32), ("end", np.int32), ("label", np.uint16)])
+EMPTY_SEGMENTS = np.empty(0, dtype=SEGMENT_DTYPE)
+
+
+def encode_label(label: str) -> int:
+    code = LABEL_CODES.get(label)
+    if code is None:
+        with _LABELS_LOCK:
+            code = LABEL_CODES.setdefault(label, len(LABELS))
+            if code == len(LABELS):
+                LABELS.append(label)
+    return code
+
+
+def label_array() -> np.ndarray:
+    """Returns the label vocabulary, indexable by label code."""
+    return np.array(LABELS, dtype=object)
+
+
+def segments_from_arrays(starts, ends, labels) -> np.ndarray:
+    """Builds a segment array from 1-based inclusive starts/ends and labels."""
+    segments = np.empty(len(starts), dtype=SEGMENT_DTYPE)
+    segments["start"] = starts
+    segments["end"] = ends
+    segments["label"] = [encode_label(label) for label in labels]
+    return segments
+
+
+def segments_from_annotations(annotations: list["ResidueAnnotation"]) -> np.ndarray:
+    return segments_from_arrays(
+        [annotation.start for annotation in annotations],
+        [annotation.end for annotation in annotations],
+        [annotation.label for annotation in annotations],
+    )
+
+
 def annotations_from_db(annotations: list[Annotation]):
-    parsed_annotations = defaultdict(list)
+    parsed_annotations = defaultdict(lambda: ([], [], []))
     reference_urls = {}
 
     for annotation in annotations:
@@ -40,15 +84,19 @@ def annotations_from_db(annotations: list[Annotation]):
             logging.warning(f"Unrecognized annotation source: {annotation.source_db}")
             continue
 
-        parsed_annotations[source].append(
-            ResidueAnnotation(annotation.start, annotation.end, annotation.label)
-        )
+        starts, ends, labels = parsed_annotations[source]
+        starts.append(annotation.start)
+        ends.append(annotation.end)
+        labels.append(annotation.label)
 
         # Only set the reference URL if it's not already set for this source
         if source not in reference_urls and annotation.source_db_url:
             reference_urls[source] = annotation.source_db_url
 
-    return parsed_annotations, reference_urls
+    return {
+        source: segments_from_arrays(*columns)
+        for source, columns in parsed_annotations.items()
+    }, reference_urls
 
 
 @dataclass
@@ -58,60 +106,121 @@ class ResidueAnnotation:
     label: str
 
 
+def expand_segments(segments: np.ndarray, sequence_length: int) -> np.ndarray:
+    """
+    Expands segments into one label code per residue. Non-overlapping segments
+    (the normal case) are expanded with a single ``np.repeat`` over the run
+    lengths of segments and the gaps between them; overlapping segments are
+    painted in order so that later segments win.
+    """
+    order = np.argsort(segments["start"], kind="stable")
+    starts = np.clip(segments["start"][order].astype(np.int64) - 1, 0, sequence_length)
+    ends = np.clip(segments["end"][order].astype(np.int64), starts, sequence_length)
+    codes = segments["label"][order]
+
+    if len(segments) > 1 and np.any(starts[1:] < ends[:-1]):
+        vector = np.zeros(sequence_length, dtype=np.uint16)
+        for segment in segments:
+            vector[max(segment["start"] - 1, 0) : segment["end"]] = segment["label"]
+        return vector
+
+    gap_lengths = starts - np.concatenate(([0], ends[:-1]))
+    run_lengths = np.empty(2 * len(segments) + 1, dtype=np.int64)
+    run_lengths[0:-1:2] = gap_lengths
+    run_lengths[1::2] = ends - starts
+    run_lengths[-1] = sequence_length - (ends[-1] if len(ends) else 0)
+    run_codes = np.zeros(len(run_lengths), dtype=np.uint16)
+    run_codes[1::2] = codes
+    return np.repeat(run_codes, run_lengths)
+
+
+def run_length_encode(codes: np.ndarray):
+    """
+    Collapses per-residue label codes into annotated runs and returns their
+    1-based inclusive starts and ends together with the run label codes.
+    """
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(codes)]))
+    run_codes = codes[starts] if len(codes) else codes
+    annotated = run_codes != 0
+    return starts[annotated] + 1, ends[annotated], run_codes[annotated]
+
+
 @dataclass
 class MembraneAnnotation:
-    annotations: dict[AnnotationSource, list[ResidueAnnotation]] = field(
-        default_factory=dict
-    )
+    segments: dict[AnnotationSource, np.ndarray] = field(default_factory=dict)
     reference_urls: dict[AnnotationSource, str] = field(default_factory=dict)
 
     def add_annotation(
-        self, source: AnnotationSource, annotation: list[ResidueAnnotation]
+        self,
+        source: AnnotationSource,
+        annotation: list[ResidueAnnotation] | np.ndarray,
     ):
-        self.annotations[source] = annotation
+        if not isinstance(annotation, np.ndarray):
+            annotation = segments_from_annotations(annotation)
+        self.segments[source] = annotation
 
     def add_reference_url(self, source: AnnotationSource, url: str):
         self.reference_urls[source] = url
 
     def update_annotations(
-        self, new_annotations: dict[AnnotationSource, list[ResidueAnnotation]]
+        self,
+        new_annotations: dict[AnnotationSource, list[ResidueAnnotation] | np.ndarray],
     ):
-        self.annotations.update(new_annotations)
+        for source, annotation in new_annotations.items():
+            self.add_annotation(source, annotation)
 
     def update_reference_urls(self, new_urls: dict[AnnotationSource, str]):
         self.reference_urls.update(new_urls)
 
     @property
     def has_annotations(self):
-        return any(len(self.annotations[source]) > 0 for source in self.annotations)
+        return any(len(segments) > 0 for segments in self.segments.values())
+
+    @property
+    def annotated_sources(self) -> list[AnnotationSource]:
+        return [source for source, segments in self.segments.items() if len(segments)]
+
+    def label_codes(self, source: AnnotationSource, sequence_length: int):
+        return expand_segments(self.segments[source], sequence_length)
+
+    def label_vector(self, source: AnnotationSource, sequence_length: int):
+        return label_array()[self.label_codes(source, sequence_length)]
+
+    def runs(self, source: AnnotationSource, sequence_length: int | None = None):
+        """
+        Returns the sorted, non-overlapping runs of ``source`` with adjacent
+        segments of the same label merged, see ``run_length_encode``.
+        """
+        segments = self.segments[source]
+        if sequence_length is None:
+            sequence_length = int(segments["end"].max()) if len(segments) else 0
+        return run_length_encode(self.label_codes(source, sequence_length))
+
+    def residue_counts(self, source: AnnotationSource) -> dict[str, int]:
+        """Number of annotated residues per label."""
+        segments = self.segments[source]
+        counts = np.bincount(
+            segments["label"],
+            weights=segments["end"] - segments["start"] + 1,
+            minlength=len(LABELS),
+        )
+        labels = label_array()
+        return {
+            labels[code]: int(counts[code]) for code in np.flatnonzero(counts)
+        }
 
 
 def construct_df_from_annotation(annotation: MembraneAnnotation, sequence: str):
-    return pd.DataFrame(
-        zip(
-            list(sequence),
-            *[
-                construct_annotation_vector(
-                    annotation.annotations[source], len(sequence)
-                )
-                for source in annotation.annotations
-                if annotation.annotations[source] is not None
-                and len(annotation.annotations[source]) > 0
-            ],
-        ),
-        columns=["Sequence"]
-        + [
-            DISPLAY_NAMES[source]
-            for source in annotation.annotations
-            if annotation.annotations[source] is not None
-            and len(annotation.annotations[source]) > 0
-        ],
-    )
+    sequence_length = len(sequence)
+    columns = {"Sequence": np.array(list(sequence), dtype=object)}
+    for source in annotation.annotated_sources:
+        columns[DISPLAY_NAMES[source]] = annotation.label_vector(
+            source, sequence_length
+        )
+    return pd.DataFrame(columns)
 
 
-def construct_annotation_vector(annotations: list[ResidueAnnotation], seuence_len: int):
-    annotation_vector = ["*"] * seuence_len
-    for annotation in annotations:
-        for i in range(annotation.start - 1, annotation.end):
-            annotation_vector[i] = annotation.label
-    return annotation_vector
+def construct_annotation_vector(annotations: np.ndarray, sequence_length: int):
+    return label_array()[expand_segments(annotations, sequence_length)]
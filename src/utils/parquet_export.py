@@ -0,0 +1,152 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Parquet snapshot of the browse columns for ``database.AnalyticsEngine``.
+
+Every protein becomes one ``ProteinRow`` with its organism and TMInfo
+columns and a topology signature. Files are partitioned by super kingdom in
+the hive layout (``super_kingdom=Bacteria/part-0.parquet``), so filters on
+the domain only read their partition. The manifest records the build id and
+the proteins of the exported database; the app only reads a snapshot of the
+build it serves. Requires pyarrow.
+"""
+
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from peewee import BooleanField, FloatField, IntegerField
+
+from utils.database import (
+    DATABASE,
+    FLAT_COLUMNS,
+    SNAPSHOT_MANIFEST,
+    TOPOLOGY_SIGNATURES,
+    Organism,
+    ProteinRow,
+    Sequence,
+    TMInfo,
+    build_id,
+    renew_build_id,
+)
+
+BATCH_SIZE = 500000
+ROW_GROUP_SIZE = 1000000
+
+PARTITION_COLUMN = ProteinRow.super_kingdom.column_name
+
+SIGNATURES = np.array(TOPOLOGY_SIGNATURES, dtype=object)
+
+
+def arrow_type(field) -> pa.DataType:
+    if isinstance(field, BooleanField):
+        return pa.bool_()
+    if isinstance(field, IntegerField):
+        return pa.int64()
+    if isinstance(field, FloatField):
+        return pa.float64()
+    return pa.string()
+
+
+SCHEMA = pa.schema(
+    [
+        (field.column_name, arrow_type(field))
+        for field in ProteinRow._meta.sorted_fields
+        if field.column_name != PARTITION_COLUMN
+    ]
+)
+
+
+def topology_signatures(table: pa.Table) -> pa.Array:
+    codes = sum(
+        weight * table[column].to_numpy(zero_copy_only=False).astype(np.int8)
+        for weight, column in [
+            (1, "has_alpha_helix"),
+            (2, "has_beta_strand"),
+            (4, "has_signal"),
+        ]
+    )
+    return pa.array(SIGNATURES[codes], type=pa.string())
+
+
+def read_batches(batch_size: int):
+    """Snapshot rows of the bound database in id order as Arrow tables."""
+    query = (
+        Sequence.select(
+            *[
+                column.alias(flat_column.column_name)
+                for column, flat_column in FLAT_COLUMNS.items()
+            ]
+        )
+        .join(TMInfo)
+        .switch(Sequence)
+        .join(Organism)
+        .order_by(Sequence.id)
+        .limit(batch_size)
+    )
+    schema = pa.schema(
+        [
+            (flat_column.column_name, arrow_type(flat_column))
+            for flat_column in FLAT_COLUMNS.values()
+        ]
+    )
+    last_id = 0
+    while True:
+        cursor = DATABASE.execute_sql(*query.where(Sequence.id > last_id).sql())
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        # SQLite returns booleans as integers, the cast converts them
+        table = pa.Table.from_pydict(
+            {name: list(values) for name, values in zip(schema.names, zip(*rows))}
+        ).cast(schema)
+        yield table.append_column("topology", topology_signatures(table))
+        last_id = rows[-1][0]
+
+
+def export_parquet(directory: Path, batch_size: int = BATCH_SIZE) -> dict[str, int]:
+    """
+    Writes the snapshot of the database bound to ``DATABASE`` and returns the
+    proteins per partition. The snapshot is written next to ``directory`` and
+    replaces it once complete.
+    """
+    partial = directory.with_name(directory.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    # Databases built before build ids get one with their first export
+    exported_build = build_id() or renew_build_id()
+
+    writers: dict[str, pq.ParquetWriter] = {}
+    counts: dict[str, int] = {}
+    try:
+        for table in read_batches(batch_size):
+            partitions = table[PARTITION_COLUMN]
+            for partition in pc.unique(partitions).to_pylist():
+                rows = table.filter(pc.equal(partitions, partition))
+                if partition not in writers:
+                    path = (
+                        partial / f"{PARTITION_COLUMN}={partition}" / "part-0.parquet"
+                    )
+                    path.parent.mkdir(parents=True)
+                    writers[partition] = pq.ParquetWriter(
+                        path, SCHEMA, compression="zstd"
+                    )
+                writers[partition].write_table(
+                    rows.select(SCHEMA.names), row_group_size=ROW_GROUP_SIZE
+                )
+                counts[partition] = counts.get(partition, 0) + rows.num_rows
+            logging.info(f"Exported {sum(counts.values()):,} proteins")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    partial.mkdir(exist_ok=True)
+    (partial / SNAPSHOT_MANIFEST).write_text(
+        json.dumps({"build_id": exported_build, "proteins": sum(counts.values())})
+    )
+    shutil.rmtree(directory, ignore_errors=True)
+    partial.rename(directory)
+    return counts
@@ -1,16 +1,24 @@
 # Copyright 2023 RostLab.
 # SPDX-License-Identifier: 	AGPL-3.0-or-later
 from dataclasses import dataclass
+import hashlib
 import logging
+import os
 
 import pandas as pd
 from peewee import Model
 
-from utils import database, api
+from utils import database, api, timing
 from utils import membrane_annotation
 from utils.membrane_annotation import MembraneAnnotation, AnnotationSource
+from utils.singleflight import SingleFlight
 
 
+# Serve UniProt and TmAlphaFold annotations from the database instead of the web
+OFFLINE_ANNOTATIONS = os.getenv("OFFLINE_ANNOTATIONS", "false").lower() == "true"
+
+PROTEIN_INFO_FLIGHT = SingleFlight("protein_info")
+
 FIELDS = {
     "uniprot_accession": "UniProt Accession",
     "uniprot_id": "UniProt ID",
@@ -25,6 +33,9 @@ FIELDS = {
     "tm_helix_count": "Transmembrane helix residues",
     "tm_strand_count": "Transmembrane strand residues",
     "signal_count": "Signal peptide residues",
+    "tm_helix_percent": "Transmembrane helix percentage",
+    "tm_strand_percent": "Transmembrane strand percentage",
+    "signal_percent": "Signal peptide percentage",
 }
 
 
@@ -50,9 +61,54 @@ def db_to_df(query_result):
     return df
 
 
-def fetch_membrane_annotations(selected_id: str):
+def fetch_membrane_annotations_offline(selected_id: str):
+    """
+    Collects all annotations, including imported UniProt and TmAlphaFold ones,
+    from the database without any external requests.
+    """
+    annotation = MembraneAnnotation()
+    sequence = database.get_sequence_for_id(selected_id)
+    if sequence is None:
+        logging.info(f"No sequence found in TMvisDB for {selected_id}")
+        return annotation, None
+
+    db_annotations = database.Annotation.select().where(
+        database.Annotation.sequence == sequence
+    )
+    parsed_db_annotations, parsed_db_refs = membrane_annotation.annotations_from_db(
+        db_annotations
+    )
+    annotation.update_annotations(parsed_db_annotations)
+    annotation.update_reference_urls(parsed_db_refs)
+
+    uniprot_response = api.UniprotResponse(
+        accession=sequence.uniprot_accession,
+        name=sequence.uniprot_id,
+        sequence_length=sequence.seq_length,
+        membrane_annotations=parsed_db_annotations.get(AnnotationSource.UNIPROT, []),
+    )
+    return annotation, uniprot_response
+
+
+def fetch_upstream(failed_sources: set, source: str, default, function, *args):
+    """Calls an upstream fetch; a failed request is logged and added to the set."""
+    try:
+        return function(*args)
+    except api.UpstreamError:
+        logging.warning(f"{source} request failed", exc_info=True)
+        failed_sources.add(source)
+        return default
+
+
+def fetch_membrane_annotations(selected_id: str, failed_sources: set | None = None):
+    if OFFLINE_ANNOTATIONS:
+        return fetch_membrane_annotations_offline(selected_id)
+
+    failed_sources = set() if failed_sources is None else failed_sources
     annotation = MembraneAnnotation()
-    uniprot_response = api.uniprot_fetch_annotation(selected_id)
+    uniprot_response = fetch_upstream(
+        failed_sources, "uniprot", None, api.uniprot_fetch_annotation, selected_id
+    )
 
     if uniprot_response is not None:
         annotation.add_annotation(
@@ -63,10 +119,14 @@ def fetch_membrane_annotations(selected_id: str):
             api.uniprot_entry_url(uniprot_response.accession),
         )
 
-    tmalphafold_annotation = api.tmalphafold_fetch_annotation(
+    tmalphafold_annotation = fetch_upstream(
+        failed_sources,
+        "tmalphafold",
+        None,
+        api.tmalphafold_fetch_annotation,
         uniprot_response.name
         if uniprot_response is not None and uniprot_response.name is not None
-        else selected_id
+        else selected_id,
     )
 
     if tmalphafold_annotation is not None:
@@ -81,10 +141,11 @@ def fetch_membrane_annotations(selected_id: str):
             ),
         )
 
-    db_annotations = database.get_membrane_annotation_for_id(selected_id)
-    parsed_db_annotations, parsed_db_refs = membrane_annotation.annotations_from_db(
-        db_annotations
-    )
+    with timing.log_duration("annotation query"):
+        db_annotations = database.get_membrane_annotation_for_id(selected_id)
+        parsed_db_annotations, parsed_db_refs = membrane_annotation.annotations_from_db(
+            db_annotations
+        )
 
     annotation.update_annotations(parsed_db_annotations)
     annotation.update_reference_urls(parsed_db_refs)
@@ -92,6 +153,7 @@ def fetch_membrane_annotations(selected_id: str):
     return annotation, uniprot_response
 
 
+@timing.timed("sequence query")
 def fetch_sequence_data(selected_id: str):
     sequence_info_df = db_to_df(database.get_sequence_data_for_id(selected_id))
     return sequence_info_df
@@ -106,23 +168,59 @@ class ProteinInfo:
     structure: bytes
     annotation: MembraneAnnotation
     info_df: pd.DataFrame
+    # Upstream services whose request failed, so the data may be incomplete
+    failed_sources: frozenset[str] = frozenset()
 
     @property
     def has_annotations(self):
-        return len(self.annotation.annotations) > 0
+        return len(self.annotation.segments) > 0
+
+    @property
+    def fingerprint(self) -> tuple:
+        """
+        Identifies the fetched data in render cache keys, so a refetch after a
+        failed upstream request is not served the render of the failed one.
+        """
+        structure = self.structure
+        if isinstance(structure, str):
+            structure = structure.encode()
+        return (
+            None
+            if structure is None
+            else hashlib.blake2b(structure, digest_size=16).hexdigest(),
+            self.sequence is not None,
+            tuple(sorted(source.name for source in self.annotation.segments)),
+        )
 
     @staticmethod
     def collect_for_id(
         selected_id: str,
     ):
-        annotation, uniprot_info = fetch_membrane_annotations(selected_id)
-
-        sequence_info_df = fetch_sequence_data(selected_id)
+        return PROTEIN_INFO_FLIGHT.do(
+            selected_id, ProteinInfo._collect_for_id, selected_id
+        )
 
-        sequence, structure = api.alphafolddb_fetch_structure(
+    @staticmethod
+    @timing.timed("protein info")
+    def _collect_for_id(
+        selected_id: str,
+    ):
+        failed_sources = set()
+        with database.SHARD_ROUTER.protein_shard(selected_id):
+            annotation, uniprot_info = fetch_membrane_annotations(
+                selected_id, failed_sources
+            )
+
+            sequence_info_df = fetch_sequence_data(selected_id)
+
+        sequence, structure = fetch_upstream(
+            failed_sources,
+            "alphafold",
+            (None, None),
+            api.alphafolddb_fetch_structure,
             uniprot_info.accession
             if uniprot_info is not None and uniprot_info.accession is not None
-            else selected_id
+            else selected_id,
         )
 
         return ProteinInfo(
@@ -135,4 +233,5 @@ class ProteinInfo:
             structure=structure,
             annotation=annotation,
             info_df=sequence_info_df,
+            failed_sources=frozenset(failed_sources),
         )
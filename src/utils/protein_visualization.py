@@ -1,11 +1,28 @@
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import streamlit.components.v1 as components
 import py3Dmol
 
-from utils.membrane_annotation import ResidueAnnotation
+from utils import membrane_annotation
+from utils.membrane_annotation import AnnotationSource, MembraneAnnotation
+
+
+# 3Dmol.js is served from Streamlit's static folder if it was bundled (see Dockerfile)
+STATIC_3DMOL_PATH = Path(__file__).parents[1] / "static" / "3Dmol-min.js"
+VIEWER_JS_URL = os.getenv(
+    "VIEWER_JS_URL",
+    "app/static/3Dmol-min.js"
+    if STATIC_3DMOL_PATH.exists()
+    else "https://3dmol.org/build/3Dmol.js",
+)
 
 
 # Enum for Protein Styles
@@ -44,14 +61,27 @@ class Style:
     visualization_style: ProteinStyle = ProteinStyle.CARTOON
     color_scheme: ColorScheme = ColorScheme.TRANSMEMBRANE_PREDICTION
     spin: bool = False
+    # Annotation sources painted onto the structure, later layers on top
+    layers: tuple[AnnotationSource, ...] = (AnnotationSource.TMBED,)
 
 
 @dataclass
 class VizFilter:
-    style: Style = Style()
+    style: Style = field(default_factory=Style)
     selected_id: str = ""
 
 
+# Atoms 3Dmol needs to trace (and assign secondary structure for) a cartoon
+BACKBONE_ATOMS = frozenset({"N", "CA", "C", "O"})
+
+STYLE_ATOMS = {
+    ProteinStyle.CARTOON: BACKBONE_ATOMS,
+}
+
+# Records besides atoms that are relevant for rendering frames and cartoons
+STRUCTURE_RECORDS = ("MODEL", "ENDMDL", "TER", "END", "HELIX", "SHEET")
+
+
 ANNOTATION_LEGEND_DF = pd.DataFrame.from_records(
     [
         {
@@ -110,40 +140,76 @@ ALPHAFOLD_LEGEND_DF = pd.DataFrame(
 )
 
 
-def color_prediction(annotation_table):
-    tmbed_prediction = annotation_table.loc["TMbed Prediction"]
-    color_map = {
-        "S": ColorCode.SIGNAL_PEPTIDE.value,
-        "H": ColorCode.HELIX_LIGHT.value,
-        "h": ColorCode.HELIX_DARK.value,
-        "B": ColorCode.BETA_LIGHT.value,
-        "b": ColorCode.BETA_DARK.value,
-        "i": ColorCode.INSIDE.value,
-    }
-    color = color_map.get(tmbed_prediction, ColorCode.OUTSIDE.value)
-    return [f"background-color: {''.join(color.split())}"] * len(annotation_table.index)
+TOPOLOGY_COLORS = {
+    "S": ColorCode.SIGNAL_PEPTIDE.value,
+    "H": ColorCode.HELIX_LIGHT.value,
+    "h": ColorCode.HELIX_DARK.value,
+    "B": ColorCode.BETA_LIGHT.value,
+    "b": ColorCode.BETA_DARK.value,
+    "i": ColorCode.INSIDE.value,
+    "o": ColorCode.OUTSIDE.value,
+    # UniProt, TmAlphaFold and Membranome segments without orientation
+    "AH": ColorCode.HELIX_LIGHT.value,
+    "BS": ColorCode.BETA_LIGHT.value,
+}
 
 
-def map_annotation_to_color(annotations: list[ResidueAnnotation]):
-    atom_color = {}
-    color_map = {
-        "S": ColorCode.SIGNAL_PEPTIDE.value,
-        "H": ColorCode.HELIX_LIGHT.value,
-        "h": ColorCode.HELIX_DARK.value,
-        "B": ColorCode.BETA_LIGHT.value,
-        "b": ColorCode.BETA_DARK.value,
-        "i": ColorCode.INSIDE.value,
-        "o": ColorCode.OUTSIDE.value,
-    }
+# Color of residues that no annotation layer covers
+BASE_COLOR = "".join(ColorCode.OUTSIDE.value.split())
 
-    for annotation in annotations:
-        color = "".join(
-            color_map.get(annotation.label, ColorCode.OUTSIDE.value).split()
-        )
-        for i in range(annotation.start - 1, annotation.end):
-            atom_color[i] = color
 
-    return atom_color
+def label_colors(default=ColorCode.OUTSIDE.value) -> np.ndarray:
+    """Returns the (whitespace-free) color of every label code."""
+    return np.array(
+        [
+            "".join(TOPOLOGY_COLORS.get(label, default).split())
+            for label in membrane_annotation.LABELS
+        ],
+        dtype=object,
+    )
+
+
+def range_styles(
+    starts, ends, colors, visualization_style: ProteinStyle
+) -> list[tuple[dict, dict]]:
+    """
+    Groups residue ranges by color into one 3Dmol ``setStyle`` selection per
+    color, so the viewer payload scales with the number of runs.
+    """
+    ranges_by_color = defaultdict(list)
+    for start, end, color in zip(starts, ends, colors):
+        ranges_by_color[color].append(f"{start}-{end}")
+    return [
+        ({"model": -1, "resi": ranges}, {visualization_style.value: {"color": color}})
+        for color, ranges in ranges_by_color.items()
+    ]
+
+
+def annotation_layer_styles(
+    annotation: MembraneAnnotation,
+    layers: tuple[AnnotationSource, ...],
+    visualization_style: ProteinStyle,
+) -> list[tuple[dict, dict]]:
+    """
+    Returns the ``setStyle`` calls that paint the annotation runs of each layer
+    onto the structure. Residues a layer does not annotate keep the color of
+    the layers below.
+    """
+    colors = label_colors()
+    styles = []
+    for source in layers:
+        if source not in annotation.segments:
+            continue
+        starts, ends, codes = annotation.runs(source)
+        styles.extend(
+            range_styles(
+                starts.tolist(),
+                ends.tolist(),
+                colors[codes].tolist(),
+                visualization_style,
+            )
+        )
+    return styles
 
 
 def annotation_legend_coloring(value_name):
@@ -161,13 +227,44 @@ def alphafold_legend_coloring(value_name):
     return f"background-color: {color}"
 
 
+def compact_structure(structure: str, visualization_style: ProteinStyle):
+    """
+    Reduces a PDB file to the records the given style renders: metadata records
+    (REMARK, SEQRES, ...) are dropped and, for cartoons, only backbone atoms are
+    kept. Coordinates and B-factors (pLDDT) are left untouched.
+    """
+    atoms = STYLE_ATOMS.get(visualization_style)
+    lines = []
+    for line in structure.splitlines():
+        record = line[:6].rstrip()
+        if record in ("ATOM", "HETATM"):
+            if atoms is None or line[12:16].strip() in atoms:
+                lines.append(line.rstrip())
+        elif record in STRUCTURE_RECORDS:
+            lines.append(line.rstrip())
+    return "\n".join(lines) + "\n"
+
+
+def create_view(**kwargs):
+    """Creates a py3Dmol view that loads 3Dmol.js from ``VIEWER_JS_URL``."""
+    return py3Dmol.view(js=VIEWER_JS_URL, **kwargs)
+
+
+def make_viewer_html(mol_obj):
+    """Serializes a py3Dmol view; the result can be cached and passed to showmol."""
+    html = mol_obj._make_html()
+    logging.debug(f"3Dmol viewer payload: {len(html) / 1024:.1f} KiB")
+    return html
+
+
 def showmol(mol_obj, height=500, width=500):
     """Shows the Py3DMOL object.
 
     Parameters
     ----------
-    obj: Py3DMOL object
-        Already existing Py3DMOL object, which can be created using the makeobj function.
+    obj: Py3DMOL object or str
+        Already existing Py3DMOL object, which can be created using the makeobj function,
+        or its HTML as returned by make_viewer_html.
     height: Integer, default 500
         Is the height of viwer window.
     width: Integer, default 500
@@ -177,4 +274,5 @@ def showmol(mol_obj, height=500, width=500):
     -------
     None.
     """
-    components.html(mol_obj._make_html(), height=height, width=width, scrolling=False)
+    html = mol_obj if isinstance(mol_obj, str) else make_viewer_html(mol_obj)
+    components.html(html, height=height, width=width, scrolling=False)
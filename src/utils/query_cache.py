@@ -0,0 +1,228 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Process-wide cache of protein list query results.
+
+Results are stored as compact data frames under the canonical key of their
+filter (``DBFilter.cache_key``), so every session shares them. The cache
+holds at most ``QUERY_CACHE_MB`` of frames, evicts the least recently used
+ones first and is cleared whenever the database file changes.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+
+import pandas as pd
+
+from utils import database, statistics
+from utils.database import DBFilter, ProteinRow
+from utils.protein_info import FIELDS
+from utils.query_executor import QUERY_EXECUTOR, QueryResult
+from utils.singleflight import SingleFlight
+
+QUERY_CACHE_MB = int(os.getenv("QUERY_CACHE_MB", "256"))
+
+# Organism columns repeat for every protein of the organism
+CATEGORICAL_COLUMNS = ["Organism name", "Organism ID", "Domain", "Kingdom"]
+
+# Filters estimated to examine more rows run on the Parquet snapshot if any
+ANALYTICS_ROWS = int(os.getenv("ANALYTICS_ROWS", "1000000"))
+
+QUERY_FLIGHT = SingleFlight("protein_list")
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    for column in df.select_dtypes(include="integer").columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def frame_size(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+@dataclass
+class QueryCacheStats:
+    entries: int
+    size_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def check_version(self, version):
+        """Drops all entries if the database changed since they were stored."""
+        with self._lock:
+            if version == self._version:
+                return
+            if self._entries:
+                logging.info(
+                    f"Database changed, dropping {len(self._entries)} cached results"
+                )
+                self._invalidations += 1
+            self._entries.clear()
+            self._size = 0
+            self._version = version
+
+    def get(self, key: Hashable) -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, df: pd.DataFrame):
+        size = frame_size(df)
+        if size > self.max_bytes:
+            logging.info(f"Not caching result of {size} bytes for {key!r}")
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (df, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> QueryCacheStats:
+        with self._lock:
+            return QueryCacheStats(
+                entries=len(self._entries),
+                size_bytes=self._size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+            )
+
+
+QUERY_CACHE = QueryCache(QUERY_CACHE_MB * 1024 * 1024)
+
+
+def _run_query(db_filter: DBFilter) -> pd.DataFrame:
+    db_filter = statistics.plan_ranges(db_filter)
+    query = database.get_sequence_data(db_filter)
+    if _use_analytics(db_filter):
+        result = QUERY_EXECUTOR.run_analytics(
+            database.ANALYTICS.filter_query(db_filter)
+        )
+    elif database.SHARD_ROUTER.sharded:
+        result = _run_sharded(db_filter, query)
+    else:
+        result = QUERY_EXECUTOR.run(query)
+    df = pd.DataFrame.from_records(result.rows, columns=result.columns)
+    df.rename(columns=FIELDS, inplace=True)
+    # Results cut short by the query budget are shown but not cached, as
+    # are the empty results of queries that found no free worker
+    df.attrs["narrowed"] = result.narrowed
+    df.attrs["busy"] = result.busy
+    return compact_frame(df)
+
+
+def _use_analytics(db_filter: DBFilter) -> bool:
+    """
+    Broad filters run on the Parquet snapshot when it is available and holds
+    as many proteins as the statistics of the database.
+    """
+    if db_filter.random_selection or not database.ANALYTICS.available:
+        return False
+    if database.ANALYTICS.proteins != statistics.total_proteins():
+        return False
+    estimate = statistics.estimate_cost(db_filter)
+    return estimate is not None and estimate.examined_rows >= ANALYTICS_ROWS
+
+
+def _run_sharded(db_filter: DBFilter, query) -> QueryResult:
+    router = database.SHARD_ROUTER
+    results = QUERY_EXECUTOR.run_sharded(query, router.paths_for(db_filter))
+    columns = next((result.columns for result in results if result.columns), [])
+    return QueryResult(
+        columns=columns,
+        rows=router.merge(db_filter, columns, [result.rows for result in results]),
+        narrowed=any(result.narrowed for result in results),
+        busy=any(result.busy for result in results),
+        elapsed=max(result.elapsed for result in results),
+    )
+
+
+def get_sequence_frame(db_filter: DBFilter) -> pd.DataFrame:
+    """
+    Returns the proteins matching the filter as a data frame. Filtered results
+    are shared between sessions and must not be modified in place; random
+    selections are always queried.
+    """
+    if db_filter.random_selection:
+        return _run_query(db_filter)
+
+    QUERY_CACHE.check_version(database.database_version(database.DATABASE.database))
+    key = db_filter.cache_key()
+    df = QUERY_CACHE.get(key)
+    if df is None:
+        df = QUERY_FLIGHT.do(key, _run_query, db_filter)
+        if not df.attrs["narrowed"] and not df.attrs["busy"]:
+            QUERY_CACHE.put(key, df)
+    return df
+
+
+def get_clade_distribution(domain: str) -> pd.DataFrame | None:
+    """
+    Proteins per clade of the domain and TM helix residues, in the buckets of
+    the overview; only computed on the Parquet snapshot, None without it.
+    """
+    if not database.ANALYTICS.available:
+        return None
+    QUERY_CACHE.check_version(database.database_version(database.DATABASE.database))
+    key = ("clade distribution", domain)
+    df = QUERY_CACHE.get(key)
+    if df is None:
+        _, width = statistics.DISTRIBUTIONS["TM_HELIX_COUNT"]
+        result = QUERY_EXECUTOR.run_analytics(
+            database.ANALYTICS.histogram(
+                ProteinRow.tm_helix_count,
+                width,
+                ProteinRow.clade,
+                ProteinRow.super_kingdom == domain,
+            )
+        )
+        if result.narrowed or result.busy:
+            return None
+        df = pd.DataFrame.from_records(
+            result.rows, columns=["Kingdom", "TM helix residues", "Proteins"]
+        )
+        QUERY_CACHE.put(key, df)
+    return df
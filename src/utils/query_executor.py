@@ -0,0 +1,308 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Budgeted execution of database queries off the script thread.
+
+Queries run in a small thread pool. Every worker keeps its own connection,
+so the page cache survives between queries; it is opened again when the
+database file changes and closed by ``QueryExecutor.close``. A SQLite
+progress handler aborts a query once it exceeds its time budget or its step
+budget, the SQLite VM instructions it may execute, or is cancelled; rows
+fetched up to then are returned as a narrowed result instead of blocking the
+app. Unlike the time budget, the step budget bounds the rows a query examines
+regardless of the load of the machine. The time budget starts when a worker
+picks the query up; a query that waited longer than its budget for a worker
+is not run and reported as busy instead. Queries of a sharded database
+attach their shard to the connection of the worker for their run. Queries
+for the DuckDB analytics engine run in the same pool and are interrupted
+once their time budget is spent. The executor counts the queries waiting
+for a free worker and their wait, see ``QueryExecutor.stats``.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+
+from peewee import OperationalError
+
+from utils import database
+
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "5"))
+# About three steps per row examined, e.g. a join of Sequence and TMInfo
+QUERY_STEP_BUDGET = int(os.getenv("QUERY_STEP_BUDGET", "20000000"))
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+
+# Number of SQLite VM instructions (steps) between two budget checks
+PROGRESS_INTERVAL = 10000
+FETCH_SIZE = 256
+
+
+@dataclass
+class QueryResult:
+    columns: list[str]
+    rows: list[tuple] = field(default_factory=list)
+    # The query was aborted by its budget; rows holds what was found until then
+    narrowed: bool = False
+    # The query waited longer than its budget for a free worker and did not run
+    busy: bool = False
+    elapsed: float = 0.0
+
+
+class QueryHandle:
+    def __init__(self, future: Future, cancelled: threading.Event):
+        self._future = future
+        self._cancelled = cancelled
+
+    def cancel(self):
+        """Aborts the query at the next progress check."""
+        self._cancelled.set()
+        self._future.cancel()
+
+    def result(self) -> QueryResult:
+        try:
+            return self._future.result()
+        finally:
+            # A caller that stops waiting must not leave the query running
+            if not self._future.done():
+                self.cancel()
+
+
+# Database file and version the connection of a worker was opened for
+_connections = threading.local()
+
+
+def _connect():
+    """Opens the connection of this worker unless it is open on the current file."""
+    path = database.DATABASE.database
+    version = (path, database.database_version(path))
+    if not database.DATABASE.is_closed():
+        if getattr(_connections, "version", None) == version:
+            return
+        database.DATABASE.close()
+    database.DATABASE.connect()
+    database.set_pragma_settings(database.DATABASE)
+    _connections.version = version
+
+
+def _close():
+    if not database.DATABASE.is_closed():
+        database.DATABASE.close()
+    _connections.version = None
+
+
+def _execute(
+    sql: str,
+    params: list,
+    step_budget: int,
+    cancelled: threading.Event,
+    shard: str | None = None,
+    *,
+    deadline: float,
+) -> QueryResult:
+    start = time.monotonic()
+    checks = 0
+
+    def over_budget():
+        return cancelled.is_set() or time.monotonic() > deadline
+
+    def progress():
+        nonlocal checks
+        checks += 1
+        return int(checks * PROGRESS_INTERVAL > step_budget or over_budget())
+
+    result = QueryResult(columns=[])
+    if over_budget():
+        result.narrowed = True
+        return result
+
+    cursor = None
+    try:
+        _connect()
+        if shard is not None:
+            database.DATABASE.execute_sql("ATTACH DATABASE ? AS shard", (shard,))
+        database.DATABASE.connection().set_progress_handler(progress, PROGRESS_INTERVAL)
+        cursor = database.DATABASE.execute_sql(sql, params)
+        result.columns = [column[0] for column in cursor.description]
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            result.rows.extend(rows)
+    except (OperationalError, sqlite3.OperationalError) as e:
+        # peewee wraps errors of execute, fetching raises the sqlite3 error
+        if "interrupted" not in str(e):
+            _close()
+            raise
+        result.narrowed = True
+    except BaseException:
+        _close()
+        raise
+    finally:
+        if not database.DATABASE.is_closed():
+            if cursor is not None:
+                cursor.close()
+            database.DATABASE.connection().set_progress_handler(None, 0)
+            if shard is not None:
+                database.DATABASE.execute_sql("DETACH DATABASE shard")
+
+    result.elapsed = time.monotonic() - start
+    if result.narrowed:
+        logging.info(
+            f"Query exceeded its budget after {result.elapsed:.2f}s and "
+            f"{checks * PROGRESS_INTERVAL:,} steps with {len(result.rows)} rows"
+        )
+    return result
+
+
+def _execute_analytics(
+    sql: str,
+    params: list,
+    cancelled: threading.Event,
+    *,
+    deadline: float,
+) -> QueryResult:
+    start = time.monotonic()
+    result = QueryResult(columns=[])
+    if cancelled.is_set() or start > deadline:
+        result.narrowed = True
+        return result
+
+    cursor = database.ANALYTICS.cursor()
+    timer = threading.Timer(deadline - start, cursor.interrupt)
+    timer.start()
+    try:
+        cursor.execute(sql, params)
+        result.columns = [column[0] for column in cursor.description]
+        while not cancelled.is_set():
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            result.rows.extend(rows)
+        else:
+            result.narrowed = True
+    except database.duckdb.InterruptException:
+        result.narrowed = True
+    finally:
+        timer.cancel()
+        cursor.close()
+
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+@dataclass
+class QueryExecutorStats:
+    workers: int
+    queries: int = 0
+    narrowed: int = 0
+    busy: int = 0
+    # Queries waiting for a free worker, now and at most
+    queued: int = 0
+    max_queued: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    @property
+    def mean_wait_seconds(self):
+        return self.wait_seconds / self.queries if self.queries else 0.0
+
+
+class QueryExecutor:
+    def __init__(self, max_workers: int):
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="query"
+        )
+        self._lock = threading.Lock()
+        self._stats = QueryExecutorStats(workers=max_workers)
+
+    def _submit(self, function, timeout: float, *args) -> Future:
+        """Submits to the pool, counting the time the query waits for a worker."""
+        with self._lock:
+            self._stats.queued += 1
+            self._stats.max_queued = max(self._stats.max_queued, self._stats.queued)
+        future = self._pool.submit(
+            self._run, function, time.monotonic(), timeout, *args
+        )
+        # Queries cancelled before they started never reach _run
+        future.add_done_callback(lambda f: f.cancelled() and self._dequeue(0.0))
+        return future
+
+    def _dequeue(self, waited: float):
+        with self._lock:
+            self._stats.queued -= 1
+            self._stats.wait_seconds += waited
+            self._stats.max_wait_seconds = max(self._stats.max_wait_seconds, waited)
+
+    def _run(self, function, submitted: float, timeout: float, *args) -> QueryResult:
+        started = time.monotonic()
+        self._dequeue(started - submitted)
+        if started - submitted > timeout:
+            result = QueryResult(columns=[], busy=True)
+        else:
+            result = function(*args, deadline=started + timeout)
+        with self._lock:
+            self._stats.queries += 1
+            self._stats.narrowed += result.narrowed
+            self._stats.busy += result.busy
+        return result
+
+    def stats(self) -> QueryExecutorStats:
+        with self._lock:
+            return replace(self._stats)
+
+    def submit(
+        self,
+        query,
+        timeout: float = QUERY_TIMEOUT_SECONDS,
+        step_budget: int = QUERY_STEP_BUDGET,
+        shard: str | None = None,
+    ) -> QueryHandle:
+        """
+        The time budget starts when a worker picks the query up. A query that
+        waited longer than ``timeout`` for a worker is not run, its result is
+        marked busy. With ``shard``, the query runs on that shard file of the
+        database.
+        """
+        sql, params = query.sql()
+        cancelled = threading.Event()
+        future = self._submit(
+            _execute, timeout, sql, params, step_budget, cancelled, shard
+        )
+        return QueryHandle(future, cancelled)
+
+    def run(self, query, **kwargs) -> QueryResult:
+        return self.submit(query, **kwargs).result()
+
+    def run_analytics(
+        self, query, timeout: float = QUERY_TIMEOUT_SECONDS
+    ) -> QueryResult:
+        """
+        Runs a query on the Parquet snapshot, see ``database.ANALYTICS``.
+        DuckDB counts no steps, only the time budget applies.
+        """
+        sql, params = query.sql()
+        cancelled = threading.Event()
+        future = self._submit(_execute_analytics, timeout, sql, params, cancelled)
+        return QueryHandle(future, cancelled).result()
+
+    def run_sharded(self, query, shards: list[str], **kwargs) -> list[QueryResult]:
+        """Runs the query on all shards in parallel, with the same budget."""
+        handles = [self.submit(query, shard=shard, **kwargs) for shard in shards]
+        return [handle.result() for handle in handles]
+
+    def close(self):
+        """Closes the connections of the workers and stops the pool."""
+        workers = self._stats.workers
+        # Every worker waits for the others, so each closes its own connection
+        barrier = threading.Barrier(workers)
+
+        def close_connection():
+            barrier.wait()
+            _close()
+
+        for future in [self._pool.submit(close_connection) for _ in range(workers)]:
+            future.result()
+        self._pool.shutdown()
+
+
+QUERY_EXECUTOR = QueryExecutor(QUERY_WORKERS)
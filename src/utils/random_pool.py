@@ -0,0 +1,140 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Pool of precomputed random selections.
+
+A background thread keeps up to ``pool_size`` unseen random pages in memory,
+so handing one out is a deque operation instead of a database query. When
+clicks outpace the thread, recently served pages are handed out again in
+rotation; only a cold pool falls back to querying on the caller's thread.
+Pages belong to one version of the database file: a replaced or updated
+database drops the pool before the next page is handed out. Pages narrowed
+by the query budget or not run while the query workers were busy are not
+pooled.
+"""
+
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+import pandas as pd
+
+from utils import database
+from utils.database import DBFilter
+from utils.query_cache import get_sequence_frame
+
+# Wait before retrying after a failed replenish
+RETRY_SECONDS = 5
+
+
+@dataclass
+class RandomPoolStats:
+    fresh: int
+    served: int
+    reused: int
+    cold: int
+    generated: int
+
+
+class RandomSelectionPool:
+    def __init__(self, page_size: int, pool_size: int):
+        self.page_size = page_size
+        self.pool_size = pool_size
+        self._fresh: deque[pd.DataFrame] = deque()
+        self._recent: deque[pd.DataFrame] = deque(maxlen=pool_size)
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._version = None
+        self._served = 0
+        self._reused = 0
+        self._cold = 0
+        self._generated = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._replenish, name="random-selection-pool", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _check_version(self):
+        """Drops the pages of an earlier database; requires the condition."""
+        version = database.database_version(database.DATABASE.database)
+        if version != self._version:
+            self._fresh.clear()
+            self._recent.clear()
+            self._version = version
+            self._condition.notify()
+
+    def _query_page(self) -> pd.DataFrame:
+        return get_sequence_frame(
+            DBFilter(random_selection=True, num_sequences=self.page_size)
+        )
+
+    def _replenish(self):
+        database.initialize_database_connection()
+        try:
+            while not self._stopped.is_set():
+                with self._condition:
+                    self._check_version()
+                    while len(self._fresh) >= self.pool_size:
+                        self._condition.wait()
+                        if self._stopped.is_set():
+                            return
+                    version = self._version
+
+                try:
+                    page = self._query_page()
+                except Exception:
+                    logging.exception("Failed to generate a random selection")
+                    self._stopped.wait(RETRY_SECONDS)
+                    continue
+                if page.attrs["narrowed"] or page.attrs["busy"]:
+                    # Leaves the query workers to the sessions for a while
+                    self._stopped.wait(RETRY_SECONDS)
+                    continue
+
+                with self._condition:
+                    # Queried while the database was replaced
+                    if version == self._version:
+                        self._fresh.append(page)
+                        self._generated += 1
+        finally:
+            database.DATABASE.close()
+
+    def take(self, db_filter: DBFilter) -> pd.DataFrame:
+        """Returns a random selection; unseen pages are preferred."""
+        if db_filter.num_sequences == self.page_size:
+            with self._condition:
+                self._check_version()
+                if self._fresh:
+                    page = self._fresh.popleft()
+                    self._recent.append(page)
+                    self._served += 1
+                    self._condition.notify()
+                    return page
+                if self._recent:
+                    page = self._recent[0]
+                    self._recent.rotate(-1)
+                    self._reused += 1
+                    return page
+                self._cold += 1
+
+        return get_sequence_frame(db_filter)
+
+    def stats(self) -> RandomPoolStats:
+        with self._condition:
+            return RandomPoolStats(
+                fresh=len(self._fresh),
+                served=self._served,
+                reused=self._reused,
+                cold=self._cold,
+                generated=self._generated,
+            )
@@ -0,0 +1,141 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Compact residue-track view of membrane annotations.
+
+Every annotation source is drawn as one track of run-length colored segments.
+Only run boundaries are sent to the browser; the sequence and ruler are
+rendered for the visible window only, so proteins with thousands of residues
+stay cheap to transfer and to scroll.
+"""
+
+import json
+
+from utils import membrane_annotation
+from utils.membrane_annotation import DISPLAY_NAMES, MembraneAnnotation
+from utils.protein_visualization import TOPOLOGY_COLORS, ColorCode
+
+CELL_WIDTH = 12
+ROW_HEIGHT = 20
+LABEL_WIDTH = 190
+
+
+def label_css(labels: list[str]) -> str:
+    """One CSS class per label code; unknown labels use the 'outside' color."""
+    rules = []
+    for code, label in enumerate(labels):
+        color = "".join(TOPOLOGY_COLORS.get(label, ColorCode.OUTSIDE.value).split())
+        rules.append(f".l{code}{{background:{color}}}")
+    return "".join(rules)
+
+
+def track_payload(annotation: MembraneAnnotation, sequence: str | None) -> dict:
+    # Without an AlphaFold sequence, the tracks span the annotated residues
+    sequence = sequence or ""
+    sequence_length = max(
+        [len(sequence)]
+        + [
+            int(segments["end"].max())
+            for segments in annotation.segments.values()
+            if len(segments)
+        ]
+    )
+    tracks = []
+    for source in annotation.annotated_sources:
+        starts, ends, codes = annotation.runs(source, sequence_length)
+        tracks.append(
+            {
+                "name": DISPLAY_NAMES[source],
+                "runs": [starts.tolist(), ends.tolist(), codes.tolist()],
+            }
+        )
+    return {
+        "sequence": sequence,
+        "length": sequence_length,
+        "labels": list(membrane_annotation.LABELS),
+        "tracks": tracks,
+    }
+
+
+def track_height(annotation: MembraneAnnotation) -> int:
+    # ruler + sequence + one row per track + scrollbar
+    return (len(annotation.annotated_sources) + 2) * ROW_HEIGHT + 24
+
+
+def render_residue_tracks(annotation: MembraneAnnotation, sequence: str | None) -> str:
+    payload = track_payload(annotation, sequence)
+    replacements = {
+        "__CSS__": label_css(payload["labels"]),
+        "__DATA__": json.dumps(payload, separators=(",", ":")),
+        "__CELL__": str(CELL_WIDTH),
+        "__ROW__": str(ROW_HEIGHT),
+        "__LABEL__": str(LABEL_WIDTH),
+    }
+    html = TRACK_TEMPLATE
+    for placeholder, value in replacements.items():
+        html = html.replace(placeholder, value)
+    return html
+
+
+TRACK_TEMPLATE = """
+<style>
+body{margin:0;font-family:"Source Sans Pro",sans-serif;font-size:12px;color:#fafafa}
+#tracks{display:flex}
+#names{flex:0 0 __LABEL__px}
+#names div{height:__ROW__px;line-height:__ROW__px;white-space:nowrap;overflow:hidden}
+#scroller{flex:1;overflow-x:auto;overflow-y:hidden}
+#canvas{position:relative}
+.cell{position:absolute;width:__CELL__px;height:__ROW__px;line-height:__ROW__px;text-align:center}
+.run{position:absolute;top:2px;height:calc(__ROW__px - 4px);border-radius:2px;overflow:hidden;color:#000;text-align:center;line-height:calc(__ROW__px - 4px)}
+.tick{position:absolute;height:__ROW__px;border-left:1px solid #555;padding-left:2px;color:#aaa}
+__CSS__
+</style>
+<div id="tracks"><div id="names"></div><div id="scroller"><div id="canvas"></div></div></div>
+<script>
+const data = __DATA__;
+const cell = __CELL__, row = __ROW__, overscan = 50;
+const n = data.length;
+const names = document.getElementById("names");
+const scroller = document.getElementById("scroller");
+const canvas = document.getElementById("canvas");
+canvas.style.width = (n * cell) + "px";
+canvas.style.height = ((data.tracks.length + 2) * row) + "px";
+["Position", "Sequence"].concat(data.tracks.map(t => t.name)).forEach(name => {
+  const div = document.createElement("div");
+  div.textContent = name;
+  names.appendChild(div);
+});
+
+function render() {
+  const first = Math.max(0, Math.floor(scroller.scrollLeft / cell) - overscan);
+  const last = Math.min(n, Math.ceil((scroller.scrollLeft + scroller.clientWidth) / cell) + overscan);
+  const html = [];
+  for (let i = first - first % 10; i < last; i += 10) {
+    html.push(`<div class="tick" style="top:0;left:${i * cell}px">${i + 1}</div>`);
+  }
+  for (let i = first; i < Math.min(last, data.sequence.length); i++) {
+    html.push(`<div class="cell" style="top:${row}px;left:${i * cell}px">${data.sequence[i]}</div>`);
+  }
+  data.tracks.forEach((track, t) => {
+    const [starts, ends, codes] = track.runs;
+    const top = (t + 2) * row;
+    for (let r = 0; r < starts.length; r++) {
+      if (ends[r] <= first || starts[r] - 1 >= last) continue;
+      const label = data.labels[codes[r]];
+      html.push(`<div class="run l${codes[r]}" title="${label}: ${starts[r]}-${ends[r]}" ` +
+        `style="top:${top + 2}px;left:${(starts[r] - 1) * cell}px;width:${(ends[r] - starts[r] + 1) * cell}px">${label}</div>`);
+    }
+  });
+  canvas.innerHTML = html.join("");
+}
+
+let pending = false;
+scroller.addEventListener("scroll", () => {
+  if (!pending) {
+    pending = true;
+    requestAnimationFrame(() => { pending = false; render(); });
+  }
+});
+window.addEventListener("resize", render);
+render();
+</script>
+"""
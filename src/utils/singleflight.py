@@ -0,0 +1,94 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Request coalescing for concurrent identical calls.
+
+Concurrent callers of ``SingleFlight.do`` with the same key wait for the call
+that is already in flight and share its result (or exception) instead of
+issuing the same upstream requests again.
+"""
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+    waiters: int = 0
+
+
+@dataclass
+class SingleFlightStats:
+    name: str
+    executed: int = 0
+    collapsed: int = 0
+    in_flight: int = 0
+
+    @property
+    def collapse_ratio(self):
+        total = self.executed + self.collapsed
+        return self.collapsed / total if total else 0.0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self._executed = 0
+        self._collapsed = 0
+        _GROUPS.append(self)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._collapsed += 1
+                is_leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+                is_leader = True
+
+        if not is_leader:
+            logging.debug(f"{self.name}: waiting for in-flight call {key!r}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logging.debug(
+                    f"{self.name}: shared result of {key!r} with {call.waiters} callers"
+                )
+            call.done.set()
+
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(
+                name=self.name,
+                executed=self._executed,
+                collapsed=self._collapsed,
+                in_flight=len(self._calls),
+            )
+
+
+_GROUPS: list[SingleFlight] = []
+
+
+def all_stats() -> list[SingleFlightStats]:
+    """Returns the metrics of every single-flight group of this process."""
+    return [group.stats() for group in _GROUPS]
@@ -0,0 +1,501 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Column statistics and cost estimates for protein list queries.
+
+Equi-depth histograms of the filtered columns and the number of proteins per
+organism are computed offline (``tools/build_statistics.py``) and stored in
+the ``NumericHistogram`` and ``OrganismCount`` tables, next to the
+``sqlite_stat1`` table written by ANALYZE. Together they estimate how many
+proteins a filter matches and how many rows its query has to examine before
+it runs, which decides whether range filters use their index and whether
+the app warns about an expensive filter.
+
+The same build aggregates the proteins per lineage and topology and the
+length and TM helix histograms shown in the overview, so the overview never
+scans the protein tables.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass, replace
+from functools import reduce
+from operator import mul
+
+import numpy as np
+from peewee import OperationalError, Value, fn
+
+from utils import database
+from utils.database import (
+    RANGE_COLUMNS,
+    DBFilter,
+    DistributionBucket,
+    LineageTopologyCount,
+    NumericHistogram,
+    NumericRange,
+    Organism,
+    OrganismCount,
+    Sequence,
+    TMInfo,
+    Topology,
+)
+
+NUM_BUCKETS = 100
+
+# Ranges matching a larger fraction of all proteins do not use their index
+INDEX_SELECTIVITY = float(os.getenv("INDEX_SELECTIVITY", "0.05"))
+
+# Queries examining more rows are reported as expensive
+EXPENSIVE_ROWS = int(os.getenv("EXPENSIVE_ROWS", "5000000"))
+
+TOP_ORGANISMS = 20
+
+# Column and bucket width of the histograms of the overview
+DISTRIBUTIONS = {
+    "SEQ_LENGTH": (Sequence.seq_length, 50),
+    "TM_HELIX_COUNT": (TMInfo.tm_helix_count, 10),
+}
+
+HISTOGRAM_COLUMNS = {
+    **{range_column.name: column for range_column, column in RANGE_COLUMNS.items()},
+    "SEQ_LENGTH": Sequence.seq_length,
+    "HAS_ALPHA_HELIX": TMInfo.has_alpha_helix,
+    "HAS_BETA_STRAND": TMInfo.has_beta_strand,
+    "HAS_SIGNAL": TMInfo.has_signal,
+}
+
+
+@dataclass(frozen=True)
+class Histogram:
+    lows: np.ndarray
+    highs: np.ndarray
+    counts: np.ndarray
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def fraction(self, low: float | None, high: float | None) -> float:
+        """Estimated fraction of rows with values in [low, high]."""
+        if self.total == 0:
+            return 0.0
+        low = -np.inf if low is None else low
+        high = np.inf if high is None else high
+
+        # Values are assumed to be spread uniformly within a bucket
+        width = self.highs - self.lows
+        overlap = np.minimum(high, self.highs) - np.maximum(low, self.lows)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covered = np.where(
+                width > 0,
+                np.clip(overlap / width, 0, 1),
+                (self.lows >= low) & (self.highs <= high),
+            )
+        return float((covered * self.counts).sum() / self.total)
+
+
+@dataclass
+class OrganismCounts:
+    by_taxon: dict[str, int]
+    by_lineage: dict[tuple[str, str | None], int]
+
+    def count(self, taxonomy_key: tuple) -> int | None:
+        """Number of proteins selected by ``DBFilter.taxonomy_key()``."""
+        if taxonomy_key[0] == "organism":
+            return self.by_taxon.get(taxonomy_key[1], 0)
+        _, domain, kingdom = taxonomy_key
+        if domain is None and kingdom is None:
+            return None
+        return sum(
+            count
+            for (super_kingdom, clade), count in self.by_lineage.items()
+            if (domain is None or super_kingdom == domain)
+            and (kingdom is None or clade == kingdom)
+        )
+
+
+@dataclass
+class CostEstimate:
+    total_rows: int
+    # Proteins matching all filters, assuming independent columns
+    matching_rows: int
+    # Rows the query reads until it has found its page of results
+    examined_rows: int
+    strategy: str
+
+    @property
+    def expensive(self):
+        return self.examined_rows > EXPENSIVE_ROWS
+
+
+def build_histograms(num_buckets: int = NUM_BUCKETS):
+    """Recomputes the histograms of all filtered columns."""
+    NumericHistogram.create_table(safe=True)
+    for name, column in HISTOGRAM_COLUMNS.items():
+        logging.info(f"Computing histogram of {column.model.__name__}.{column.name}")
+        buckets = (
+            column.model.select(
+                column.alias("value"),
+                fn.NTILE(num_buckets).over(order_by=[column]).alias("bucket"),
+            )
+        ).alias("buckets")
+        rows = (
+            NumericHistogram.select(
+                buckets.c.bucket,
+                fn.MIN(buckets.c.value),
+                fn.MAX(buckets.c.value),
+                fn.COUNT(buckets.c.value),
+            )
+            .from_(buckets)
+            .group_by(buckets.c.bucket)
+            .tuples()
+        )
+        with database.DATABASE.atomic():
+            NumericHistogram.delete().where(NumericHistogram.column == name).execute()
+            NumericHistogram.insert_many(
+                [(name, *row) for row in rows],
+                fields=[
+                    NumericHistogram.column,
+                    NumericHistogram.bucket,
+                    NumericHistogram.low,
+                    NumericHistogram.high,
+                    NumericHistogram.count,
+                ],
+            ).execute()
+
+
+def build_organism_counts():
+    logging.info("Counting proteins per organism")
+    OrganismCount.create_table(safe=True)
+    with database.DATABASE.atomic():
+        OrganismCount.delete().execute()
+        OrganismCount.insert_from(
+            Sequence.select(Sequence.organism, fn.COUNT(Sequence.id)).group_by(
+                Sequence.organism
+            ),
+            [OrganismCount.organism, OrganismCount.count],
+        ).execute()
+
+
+def build_overview():
+    """Aggregates of the overview; they are small enough to load per request."""
+    logging.info("Aggregating proteins per lineage and topology")
+    # Recreated, so tables of earlier versions get the current columns
+    LineageTopologyCount.drop_table(safe=True)
+    LineageTopologyCount.create_table()
+    DistributionBucket.create_table(safe=True)
+    topology = database.topology_code()
+    with database.DATABASE.atomic():
+        LineageTopologyCount.delete().execute()
+        LineageTopologyCount.insert_from(
+            Sequence.select(
+                Organism.super_kingdom,
+                Organism.clade,
+                topology,
+                fn.COUNT(Sequence.id),
+            )
+            .join(TMInfo)
+            .switch(Sequence)
+            .join(Organism)
+            .group_by(Organism.super_kingdom, Organism.clade, topology),
+            [
+                LineageTopologyCount.super_kingdom,
+                LineageTopologyCount.clade,
+                LineageTopologyCount.topology,
+                LineageTopologyCount.proteins,
+            ],
+        ).execute()
+
+    for name, (column, width) in DISTRIBUTIONS.items():
+        logging.info(f"Aggregating the distribution of {column.name}")
+        # Integer division, the bucket is the lower bound
+        low = column / width * width
+        with database.DATABASE.atomic():
+            DistributionBucket.delete().where(
+                DistributionBucket.column == name
+            ).execute()
+            DistributionBucket.insert_from(
+                Sequence.select(Value(name), topology, low, fn.COUNT(Sequence.id))
+                .join(TMInfo)
+                .group_by(topology, low),
+                [
+                    DistributionBucket.column,
+                    DistributionBucket.topology,
+                    DistributionBucket.low,
+                    DistributionBucket.proteins,
+                ],
+            ).execute()
+
+
+def build_statistics(num_buckets: int = NUM_BUCKETS):
+    """
+    Planner statistics (ANALYZE), the statistics of the estimator and the
+    aggregates of the overview.
+    """
+    logging.info("Analyzing tables")
+    database.DATABASE.execute_sql("ANALYZE")
+    build_histograms(num_buckets)
+    build_organism_counts()
+    build_overview()
+
+
+_lock = threading.Lock()
+_cache: dict[str, tuple] = {}
+
+
+def _cached(name: str, loader):
+    """Loads statistics once per version of the database file."""
+    version = database.database_version(database.DATABASE.database)
+    with _lock:
+        if name in _cache and _cache[name][0] == version:
+            return _cache[name][1]
+    try:
+        value = loader()
+    except OperationalError:
+        logging.info(f"No {name} statistics found, estimates are limited")
+        value = None
+    with _lock:
+        _cache[name] = (version, value)
+    return value
+
+
+def _load_histograms() -> dict[str, Histogram]:
+    rows = list(
+        NumericHistogram.select(
+            NumericHistogram.column,
+            NumericHistogram.low,
+            NumericHistogram.high,
+            NumericHistogram.count,
+        )
+        .order_by(NumericHistogram.column, NumericHistogram.bucket)
+        .tuples()
+    )
+    histograms = {}
+    for name in HISTOGRAM_COLUMNS:
+        buckets = [row[1:] for row in rows if row[0] == name]
+        if buckets:
+            lows, highs, counts = map(np.array, zip(*buckets))
+            histograms[name] = Histogram(lows, highs, counts)
+    return histograms
+
+
+def _load_organism_counts() -> OrganismCounts:
+    counts = OrganismCounts(by_taxon={}, by_lineage={})
+    rows = (
+        OrganismCount.select(
+            Organism.taxon_id,
+            Organism.super_kingdom,
+            Organism.clade,
+            OrganismCount.count,
+        )
+        .join(Organism)
+        .tuples()
+    )
+    for taxon_id, super_kingdom, clade, count in rows:
+        counts.by_taxon[taxon_id] = count
+        lineage = (super_kingdom, clade)
+        counts.by_lineage[lineage] = counts.by_lineage.get(lineage, 0) + count
+    return counts
+
+
+def _load_table_rows() -> dict[str, int]:
+    """Row counts of the analyzed tables from sqlite_stat1."""
+    rows = database.DATABASE.execute_sql("SELECT tbl, stat FROM sqlite_stat1")
+    return {table: int(stat.split()[0]) for table, stat in rows}
+
+
+def _load_top_organisms() -> list[tuple]:
+    return list(
+        OrganismCount.select(
+            Organism.name,
+            Organism.taxon_id,
+            Organism.super_kingdom,
+            Organism.clade,
+            OrganismCount.count,
+        )
+        .join(Organism)
+        .order_by(OrganismCount.count.desc())
+        .limit(TOP_ORGANISMS)
+        .tuples()
+    )
+
+
+def load_histograms() -> dict[str, Histogram]:
+    return _cached("histogram", _load_histograms) or {}
+
+
+def load_organism_counts() -> OrganismCounts | None:
+    return _cached("organism", _load_organism_counts)
+
+
+def load_lineage_topology() -> list[tuple]:
+    """(super kingdom, clade, topology code, proteins) rows."""
+    return (
+        _cached(
+            "lineage_topology",
+            lambda: list(
+                LineageTopologyCount.select(
+                    LineageTopologyCount.super_kingdom,
+                    LineageTopologyCount.clade,
+                    LineageTopologyCount.topology,
+                    LineageTopologyCount.proteins,
+                ).tuples()
+            ),
+        )
+        or []
+    )
+
+
+def load_distribution(name: str) -> list[tuple]:
+    """(topology code, bucket low, proteins) rows of one of the DISTRIBUTIONS."""
+    return (
+        _cached(
+            f"distribution {name}",
+            lambda: list(
+                DistributionBucket.select(
+                    DistributionBucket.topology,
+                    DistributionBucket.low,
+                    DistributionBucket.proteins,
+                )
+                .where(DistributionBucket.column == name)
+                .order_by(DistributionBucket.low)
+                .tuples()
+            ),
+        )
+        or []
+    )
+
+
+def load_top_organisms() -> list[tuple]:
+    """(name, taxon id, super kingdom, clade, proteins) of the largest organisms."""
+    return _cached("top organisms", _load_top_organisms) or []
+
+
+def table_rows(table: str) -> int | None:
+    return (_cached("sqlite_stat1", _load_table_rows) or {}).get(table)
+
+
+def fraction(name: str, low=None, high=None) -> float | None:
+    histogram = load_histograms().get(name)
+    if histogram is None:
+        return None
+    return histogram.fraction(low, high)
+
+
+def range_fraction(numeric_range: NumericRange) -> float | None:
+    return fraction(numeric_range.column.name, numeric_range.low, numeric_range.high)
+
+
+def topology_fraction(db_filter: DBFilter) -> float | None:
+    if db_filter.topology == Topology.ALL:
+        return 1.0
+    fractions = {
+        Topology.BOTH: [
+            fraction("HAS_ALPHA_HELIX", 1, 1),
+            fraction("HAS_BETA_STRAND", 1, 1),
+        ],
+        Topology.ALPHA_HELIX: [fraction("HAS_ALPHA_HELIX", 1, 1)],
+        Topology.BETA_STRAND: [
+            fraction("HAS_BETA_STRAND", 1, 1),
+            fraction(
+                "HAS_SIGNAL",
+                int(db_filter.signal_peptide),
+                int(db_filter.signal_peptide),
+            ),
+        ],
+    }[db_filter.topology]
+    if None in fractions:
+        return None
+    return reduce(mul, fractions, 1.0)
+
+
+def total_proteins() -> int | None:
+    rows = table_rows("sequence")
+    if rows is None:
+        histogram = load_histograms().get("SEQ_LENGTH")
+        rows = histogram.total if histogram is not None else None
+    return rows
+
+
+def estimate_cost(db_filter: DBFilter) -> CostEstimate | None:
+    """
+    Estimates the cardinality of the filter and the rows its query examines,
+    or None without statistics. Random selections are always cheap.
+    """
+    total = total_proteins()
+    if total is None or db_filter.random_selection:
+        return None
+
+    taxonomy_rows = None
+    organism_counts = load_organism_counts()
+    if organism_counts is not None:
+        taxonomy_rows = organism_counts.count(db_filter.taxonomy_key())
+
+    length_fraction = 1.0
+    if db_filter.sequence_length_filter():
+        length_fraction = fraction("SEQ_LENGTH", *db_filter.sequence_lengths)
+
+    fractions = [length_fraction, topology_fraction(db_filter)] + [
+        range_fraction(numeric_range)
+        for numeric_range in db_filter.ranges
+        if numeric_range.low is not None or numeric_range.high is not None
+    ]
+    if None in fractions:
+        return None
+    selectivity = reduce(mul, fractions, 1.0)
+    if taxonomy_rows is not None:
+        selectivity *= taxonomy_rows / total if total else 0.0
+    matching = round(total * selectivity)
+
+    # Candidate plans: driving the query by the organism index, by the most
+    # selective range index or by scanning until a page of matches is found
+    candidates = []
+    if taxonomy_rows is not None:
+        candidates.append((taxonomy_rows, "taxonomy index"))
+    for numeric_range in db_filter.ranges:
+        share = range_fraction(numeric_range)
+        if share is not None and share <= INDEX_SELECTIVITY:
+            candidates.append((round(share * total), "range index"))
+    if db_filter.is_sorted:
+        # Reading the sort index in order stops after a page of matches
+        candidates.append((_scan_rows(db_filter, selectivity, total), "sort index"))
+    elif not candidates:
+        candidates.append((_scan_rows(db_filter, selectivity, total), "scan"))
+
+    examined, strategy = min(candidates)
+    return CostEstimate(
+        total_rows=total,
+        matching_rows=matching,
+        examined_rows=examined,
+        strategy=strategy,
+    )
+
+
+def _scan_rows(db_filter: DBFilter, selectivity: float, total: int) -> int:
+    if selectivity <= 0:
+        return total
+    return min(total, round(db_filter.num_sequences / selectivity))
+
+
+def plan_ranges(db_filter: DBFilter) -> DBFilter:
+    """
+    Only selective ranges keep using the index of their column; ranges that
+    match more proteins than the selected organisms are evaluated per row.
+    """
+    if not db_filter.ranges:
+        return db_filter
+
+    total = total_proteins()
+    taxonomy_rows = None
+    organism_counts = load_organism_counts()
+    if organism_counts is not None:
+        taxonomy_rows = organism_counts.count(db_filter.taxonomy_key())
+
+    ranges = []
+    for numeric_range in db_filter.ranges:
+        share = range_fraction(numeric_range)
+        use_index = share is None or share <= INDEX_SELECTIVITY
+        if use_index and share is not None and taxonomy_rows is not None:
+            use_index = share * total < taxonomy_rows
+        ranges.append(replace(numeric_range, use_index=use_index))
+    return replace(db_filter, ranges=tuple(ranges))
@@ -0,0 +1,305 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Synthetic TMvisDB with the schema and rough shape of the real database.
+
+Used to benchmark queries without the 100+ GB production file. Organisms are
+drawn from the real domains and kingdoms, and a few large proteomes hold most
+proteins (Zipf distributed sizes). Lengths are log-normal like UniProt and
+the topology classes, segment counts and TMbed regions follow TMvisDB, with
+most proteins alpha-helical. Rows are generated in NumPy batches and written
+with the bulk loader of ``tmvis_import``.
+"""
+
+import logging
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils import database, statistics, tmvis_import
+from utils.database import DATABASE, Annotation, Organism, Sequence, TMInfo
+from utils.lineage_definitions import DOMAIN_MAP, Domain, Eukaryota
+from utils.tmvis_import import TMBED_SOURCE, insert_sql
+
+HUMAN_TAXON_ID = "9606"
+
+DOMAIN_SHARES = {
+    Domain.BACTERIA: 0.74,
+    Domain.EUKARYOTA: 0.22,
+    Domain.ARCHAEA: 0.03,
+    Domain.UNCLASSIFIED: 0.01,
+}
+
+# Share of alpha-helical, beta-barrel, mixed and signal peptide only proteins
+ALPHA, BETA, BOTH, SIGNAL_ONLY = range(4)
+TOPOLOGY_SHARES = [0.9, 0.025, 0.005, 0.07]
+SIGNAL_SHARE = 0.15
+
+HELIX_LENGTH = 21
+STRAND_LENGTH = 9
+SIGNAL_LENGTH = 22
+MIN_LENGTH, MAX_LENGTH = 16, 5500
+
+AMINO_ACIDS = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+
+# Characters per position after the leading "A" of accessions like "A0AB12C3D4",
+# the 10 character format of api.ACCESSION_NUMBER_RE
+DIGITS = np.frombuffer(b"0123456789", dtype=np.uint8)
+LETTERS = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)
+ALPHANUMERIC = np.concatenate([LETTERS, DIGITS])
+ACCESSION_ALPHABETS = [DIGITS] + [LETTERS, ALPHANUMERIC, ALPHANUMERIC, DIGITS] * 2
+
+
+@dataclass
+class SyntheticConfig:
+    sequences: int
+    # Defaults to one organism per 2,000 proteins
+    organisms: int | None = None
+    seed: int = 0
+    batch_size: int = 100000
+    zipf_exponent: float = 1.1
+    generated_at: str = "2023-01-05"
+
+    @property
+    def num_organisms(self) -> int:
+        return self.organisms or max(10, self.sequences // 2000)
+
+
+def make_organisms(rng: np.random.Generator, count: int) -> list[tuple]:
+    """(id, taxon id, name, super kingdom, clade) rows, human first."""
+    domains = list(DOMAIN_SHARES)
+    domain_index = rng.choice(len(domains), size=count, p=list(DOMAIN_SHARES.values()))
+    taxon_ids = rng.choice(np.arange(10000, 10000 + count * 100), count, replace=False)
+    rows = []
+    for i, (index, taxon_id) in enumerate(zip(domain_index, taxon_ids.tolist())):
+        domain = domains[index]
+        # Unclassified sequences have no kingdom, their domain is used instead
+        clade = domain.value
+        if domain != Domain.UNCLASSIFIED:
+            clades = [k.value for k in DOMAIN_MAP[domain] if k.name != "ALL"]
+            clade = clades[rng.integers(len(clades))]
+        rows.append((i + 1, str(taxon_id), f"Organism {taxon_id}", domain.value, clade))
+    rows[0] = (
+        1,
+        HUMAN_TAXON_ID,
+        "Homo sapiens",
+        Domain.EUKARYOTA.value,
+        Eukaryota.OPISTHOKONTA.value,
+    )
+    return rows
+
+
+def organism_weights(rng: np.random.Generator, count: int, exponent: float):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    # The largest proteome stays human, the others are shuffled
+    weights[1:] = rng.permutation(weights[1:])
+    return weights / weights.sum()
+
+
+def random_sequences(rng: np.random.Generator, lengths: np.ndarray) -> list[str]:
+    residues = AMINO_ACIDS[rng.integers(len(AMINO_ACIDS), size=int(lengths.sum()))]
+    text = residues.tobytes().decode("ascii")
+    ends = np.cumsum(lengths).tolist()
+    return [text[end - length : end] for end, length in zip(ends, lengths.tolist())]
+
+
+def accessions(ids: np.ndarray) -> list[str]:
+    """Distinct UniProt style accessions for the ids."""
+    remaining = ids.copy()
+    columns = []
+    for alphabet in reversed(ACCESSION_ALPHABETS):
+        columns.append(alphabet[remaining % alphabet.size])
+        remaining //= alphabet.size
+    columns.append(np.full(ids.size, ord("A"), dtype=np.uint8))
+    characters = np.stack(columns[::-1], axis=1)
+    return characters.view(f"S{characters.shape[1]}").ravel().astype(str).tolist()
+
+
+def segment_counts(rng: np.random.Generator, kinds: np.ndarray, room: np.ndarray):
+    """Number of membrane segments per protein that fit into ``room`` residues."""
+    counts = np.select(
+        [kinds == ALPHA, kinds == BETA, kinds == BOTH],
+        [
+            np.minimum(rng.geometric(0.3, kinds.size), 15),
+            8 + 2 * rng.integers(0, 9, kinds.size),
+            rng.integers(2, 7, kinds.size),
+        ],
+        0,
+    )
+    # Every segment needs a loop of at least one residue
+    unit = np.where(kinds == BETA, STRAND_LENGTH, HELIX_LENGTH) + 1
+    return np.minimum(counts, np.maximum(room - 1, 0) // unit)
+
+
+def regions(
+    lengths: np.ndarray, signal: np.ndarray, kinds: np.ndarray, counts: np.ndarray
+):
+    """
+    TMbed regions as (protein index, start, end, label) arrays: an optional
+    signal peptide, then loops alternating inside and outside with a helix
+    or strand between two loops. Mixed proteins alternate helices and strands.
+    """
+    signal_length = np.where(signal, SIGNAL_LENGTH, 0)
+    num_regions = signal.astype(np.int64) + 2 * counts + 1
+    protein = np.repeat(np.arange(lengths.size), num_regions)
+    first = np.cumsum(num_regions) - num_regions
+    position = np.arange(protein.size) - first[protein]
+
+    is_signal = signal[protein] & (position == 0)
+    index = position - signal[protein]
+    is_loop = ~is_signal & (index % 2 == 0)
+    segment = index // 2
+
+    is_strand = (kinds[protein] == BETA) | (
+        (kinds[protein] == BOTH) & (segment % 2 == 1)
+    )
+    segment_length = np.where(is_strand, STRAND_LENGTH, HELIX_LENGTH)
+
+    # The residues left for loops are spread evenly, the last loop takes the rest
+    used = np.zeros(lengths.size, dtype=np.int64)
+    np.add.at(
+        used, protein[~is_loop & ~is_signal], segment_length[~is_loop & ~is_signal]
+    )
+    loop_room = lengths - signal_length - used
+    loop_length = loop_room // (counts + 1)
+    last_loop = loop_room - loop_length * counts
+
+    length = np.where(
+        is_signal,
+        signal_length[protein],
+        np.where(
+            is_loop,
+            np.where(
+                segment == counts[protein], last_loop[protein], loop_length[protein]
+            ),
+            segment_length,
+        ),
+    )
+    end = np.cumsum(length)
+    start = end - length - (end - length)[first][protein] + 1
+    end = start + length - 1
+
+    inside = segment % 2 == 0
+    labels = np.where(
+        is_signal,
+        "S",
+        np.where(
+            is_loop,
+            np.where(inside, "i", "o"),
+            np.where(is_strand, np.where(inside, "B", "b"), np.where(inside, "H", "h")),
+        ),
+    )
+    keep = length > 0
+    return protein[keep], start[keep], end[keep], labels[keep]
+
+
+def protein_batch(
+    rng: np.random.Generator,
+    first_id: int,
+    first_annotation_id: int,
+    size: int,
+    probabilities: np.ndarray,
+    generated_at: str,
+):
+    """Sequence, TMInfo and annotation rows of ``size`` proteins."""
+    ids = np.arange(first_id, first_id + size)
+    organism_ids = rng.choice(probabilities.size, size=size, p=probabilities) + 1
+    lengths = np.clip(
+        rng.lognormal(np.log(380), 0.6, size).astype(np.int64), MIN_LENGTH, MAX_LENGTH
+    )
+    kinds = rng.choice(4, size=size, p=TOPOLOGY_SHARES)
+    signal = (kinds == SIGNAL_ONLY) | (rng.random(size) < SIGNAL_SHARE)
+    signal &= lengths > SIGNAL_LENGTH + 1
+    counts = segment_counts(rng, kinds, lengths - np.where(signal, SIGNAL_LENGTH, 0))
+
+    protein, start, end, labels = regions(lengths, signal, kinds, counts)
+    residues = end - start + 1
+    helix_count = np.bincount(
+        protein, weights=residues * np.isin(labels, ["H", "h"]), minlength=size
+    ).astype(np.int64)
+    strand_count = np.bincount(
+        protein, weights=residues * np.isin(labels, ["B", "b"]), minlength=size
+    ).astype(np.int64)
+    signal_count = np.where(signal, SIGNAL_LENGTH, 0)
+
+    def percent(count):
+        return np.round(100 * count / lengths, 2)
+
+    accession_list = accessions(ids)
+    sequences = list(
+        zip(
+            ids.tolist(),
+            [f"{accession}_SYNTH" for accession in accession_list],
+            accession_list,
+            organism_ids.tolist(),
+            random_sequences(rng, lengths),
+            lengths.tolist(),
+        )
+    )
+    tm_infos = list(
+        zip(
+            ids.tolist(),
+            ids.tolist(),
+            helix_count.tolist(),
+            percent(helix_count).tolist(),
+            strand_count.tolist(),
+            percent(strand_count).tolist(),
+            signal_count.tolist(),
+            percent(signal_count).tolist(),
+            [generated_at] * size,
+            (helix_count > 0).tolist(),
+            (strand_count > 0).tolist(),
+            signal.tolist(),
+        )
+    )
+    annotations = list(
+        zip(
+            range(first_annotation_id, first_annotation_id + protein.size),
+            ids[protein].tolist(),
+            start.tolist(),
+            end.tolist(),
+            labels.tolist(),
+            [generated_at] * protein.size,
+            [TMBED_SOURCE] * protein.size,
+            [None] * protein.size,
+            [None] * protein.size,
+        )
+    )
+    return sequences, tm_infos, annotations
+
+
+def generate_database(config: SyntheticConfig):
+    """Fills the empty database bound to ``DATABASE`` and builds its statistics."""
+    for pragma in tmvis_import.LOAD_PRAGMAS:
+        DATABASE.execute_sql(pragma)
+    tmvis_import.create_tables()
+    if Sequence.select().exists():
+        raise ValueError("generate_database requires an empty database")
+
+    rng = np.random.default_rng(config.seed)
+    organisms = make_organisms(rng, config.num_organisms)
+    probabilities = organism_weights(rng, len(organisms), config.zipf_exponent)
+    cursor = DATABASE.cursor()
+    with DATABASE.atomic():
+        cursor.executemany(insert_sql(Organism), organisms)
+
+    started = time.monotonic()
+    annotation_id = 1
+    for first_id in range(1, config.sequences + 1, config.batch_size):
+        size = min(config.batch_size, config.sequences - first_id + 1)
+        sequences, tm_infos, annotations = protein_batch(
+            rng, first_id, annotation_id, size, probabilities, config.generated_at
+        )
+        with DATABASE.atomic():
+            cursor.executemany(insert_sql(Sequence), sequences)
+            cursor.executemany(insert_sql(TMInfo), tm_infos)
+            cursor.executemany(insert_sql(Annotation), annotations)
+        annotation_id += len(annotations)
+        logging.info(
+            f"Generated {first_id + size - 1:,} sequences "
+            f"in {time.monotonic() - started:,.0f}s"
+        )
+
+    database.renew_build_id()
+    tmvis_import.create_indexes()
+    statistics.build_statistics()
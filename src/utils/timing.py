@@ -0,0 +1,63 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Lightweight timing of script reruns and fragments."""
+
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Keep the most recent durations per name for percentiles in the logs
+HISTORY_SIZE = 200
+
+_history: dict[str, deque] = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
+_lock = threading.Lock()
+
+
+@contextmanager
+def log_duration(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        with _lock:
+            _history[name].append(elapsed)
+        logging.info(f"{name} took {elapsed:.1f} ms")
+
+
+def timed(name: str):
+    """Decorator variant of ``log_duration``."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with log_duration(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def summary() -> dict[str, dict[str, float]]:
+    """Returns count, median and p95 (in ms) of the recorded durations."""
+    with _lock:
+        history = {name: sorted(values) for name, values in _history.items()}
+    return {
+        name: {
+            "count": len(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        }
+        for name, values in history.items()
+        if values
+    }
+
+
+def reset():
+    """Forgets the recorded durations, e.g. between benchmark phases."""
+    with _lock:
+        _history.clear()
@@ -0,0 +1,690 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Bulk build of TMvisDB from the TMbed prediction export.
+
+The export holds one JSON document per protein. Lines are parsed in a process
+pool, organisms are resolved from an in-memory map and rows are written with
+explicit ids through ``executemany`` in large transactions. Indexes are only
+created once all rows are loaded. Taxa without lineage in the export are
+looked up in the UniProt taxonomy like tools/convert_mongodp.ipynb did.
+
+Monthly prediction chunks are merged into an existing database with
+``update_database``: proteins are matched by accession, unchanged proteins are
+skipped and changed ones have their TMbed annotations and ``TMInfo`` replaced.
+A protein found more than once keeps its latest prediction. Each transaction
+of a build or an update also records the loaded chunks and how far the export
+has been read, so an interrupted update resumes where it stopped.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import httpx
+import numpy as np
+from peewee import JOIN, fn
+
+from utils import api
+
+from utils.database import (
+    DATABASE,
+    Annotation,
+    DatabaseBuild,
+    ImportCheckpoint,
+    ImportedChunk,
+    Organism,
+    Sequence,
+    TMInfo,
+    renew_build_id,
+)
+from utils.membrane_annotation import AnnotationSource
+
+MODELS = [
+    Organism,
+    Sequence,
+    TMInfo,
+    Annotation,
+    ImportedChunk,
+    ImportCheckpoint,
+    DatabaseBuild,
+]
+
+# Settings for a single writer loading into a new file; a crash means rebuilding
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA cache_size = {-1024 * 1024}",
+]
+
+# Updates keep the rollback journal so every committed batch is durable
+UPDATE_PRAGMAS = [
+    "PRAGMA journal_mode = DELETE",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA cache_size = {-256 * 1024}",
+]
+
+# Maximum number of accessions looked up per query
+LOOKUP_SIZE = 500
+
+# Bytes of an export file hashed to tell it from another file of the same size
+EXPORT_KEY_BYTES = 2**20
+
+TAXONOMY_ATTEMPTS = 3
+
+UNKNOWN_TAXON_ID = "0"
+TMBED_SOURCE = AnnotationSource.TMBED.value
+
+
+class TMvisEntry(NamedTuple):
+    taxon_id: str
+    organism_name: str
+    lineage: tuple[str, str] | None
+    uniprot_id: str
+    uniprot_accession: str
+    sequence: str
+    seq_length: int
+    generated_at: str
+    chunk: int
+    regions: list[tuple[int, int, str]]
+    tm_info: tuple
+
+
+def deconstruct_predictions(predictions: str) -> list[tuple[int, int, str]]:
+    """Collapses per-residue labels into 1-based inclusive (start, end, label)."""
+    if not predictions:
+        return []
+    codes = np.frombuffer(predictions.encode("ascii"), dtype=np.uint8)
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(codes)]))
+    labels = codes[starts].tobytes().decode("ascii")
+    return list(zip((starts + 1).tolist(), ends.tolist(), labels))
+
+
+def parse_entry(line: str) -> TMvisEntry:
+    data = json.loads(line)
+    annotations = data["annotations"]
+    categorical = annotations["tm_categorical"]
+    uptaxonomy = data.get("uptaxonomy")
+    return TMvisEntry(
+        taxon_id=str(data["organism_id"]).strip(),
+        organism_name=data["organism_name"],
+        lineage=((uptaxonomy["Domain"], uptaxonomy["Kingdom"]) if uptaxonomy else None),
+        uniprot_id=data["uniprot_id"],
+        uniprot_accession=data["uniprot_accession"],
+        sequence=data["sequence"],
+        seq_length=data["seq_length"],
+        generated_at=data["run_on"]["$date"][:10],
+        chunk=data["chunk"],
+        regions=deconstruct_predictions(data["predictions"]["transmembrane"]),
+        tm_info=(
+            annotations["tm_helix_count"],
+            annotations["tm_helix_percent"],
+            annotations["tm_strand_count"],
+            annotations["tm_strand_percent"],
+            annotations["signal_count"],
+            annotations["signal_percent"],
+            categorical[0] == 1,
+            categorical[1] == 1,
+            categorical[2] == 1,
+        ),
+    )
+
+
+def parse_lines(lines: list[str]) -> tuple[int, list[TMvisEntry]]:
+    """
+    Worker function; parsing batches of lines keeps the IPC overhead low.
+    Returns the number of lines read with the entries for checkpointing.
+    """
+    return len(lines), [parse_entry(line) for line in lines if line.strip()]
+
+
+def open_export(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt")
+    return path.open("r")
+
+
+def read_batches(path: Path, batch_size: int, skip_lines: int = 0):
+    with open_export(path) as f:
+        for _ in islice(f, skip_lines):
+            pass
+        while batch := list(islice(f, batch_size)):
+            yield batch
+
+
+def parse_batches(path: Path, batch_size: int, workers: int, skip_lines: int = 0):
+    """(lines read, parsed entries) of the export in file order."""
+    batches = read_batches(path, batch_size, skip_lines)
+    if workers <= 1:
+        yield from map(parse_lines, batches)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(parse_lines, batches)
+
+
+def insert_sql(model) -> str:
+    columns = [f.column_name for f in model._meta.sorted_fields]
+    return (
+        f'INSERT INTO "{model._meta.table_name}" '
+        f"({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    )
+
+
+def update_sql(model) -> str:
+    columns = [f.column_name for f in model._meta.sorted_fields if f is not model.id]
+    return (
+        f'UPDATE "{model._meta.table_name}" '
+        f"SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+    )
+
+
+def next_id(model) -> int:
+    return (model.select(fn.MAX(model.id)).scalar() or 0) + 1
+
+
+def fetch_organism(taxon_id: str) -> tuple | None:
+    """
+    (taxon id, name, lineage) of a taxon from the UniProt taxonomy; merged
+    taxa redirect to their current taxon. None if UniProt has no such taxon,
+    raises ``httpx.HTTPError`` if the lookup keeps failing.
+    """
+    url = api.uniprot_taxonomy_api_url(taxon_id)
+    for attempt in range(1, TAXONOMY_ATTEMPTS + 1):
+        try:
+            response = httpx.get(url, follow_redirects=True, timeout=30)
+            if response.status_code in (400, 404):
+                return None
+            response.raise_for_status()
+            return api.uniprot_parse_taxonomy(response.json())
+        except httpx.HTTPError:
+            if attempt == TAXONOMY_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+
+class OrganismMap:
+    """
+    Organism ids by taxon id. Organisms with a lineage in the export are
+    added on first sight; taxa without one are looked up after applying the
+    replacements (obsolete taxon id -> current taxon id). Remaining taxa are
+    fetched with ``lookup``, e.g. ``fetch_organism``; taxa it does not know
+    map to the unknown organism, as in tools/convert_mongodp.ipynb. Proteins
+    of taxa that could not be looked up are reported as missing.
+    """
+
+    def __init__(
+        self,
+        replacements: dict[str, str],
+        lookup: Callable[[str], tuple | None] | None = None,
+    ):
+        self.replacements = dict(replacements)
+        self.lookup = lookup
+        self.ids = dict(Organism.select(Organism.taxon_id, Organism.id).tuples())
+        self.next_id = next_id(Organism)
+        self.new_rows: list[tuple] = []
+        self.missing: set[str] = set()
+        # Replacements found by ``lookup``, in the format of the replacement CSV
+        self.found: dict[str, str] = {}
+        if UNKNOWN_TAXON_ID not in self.ids:
+            self._add(UNKNOWN_TAXON_ID, "Unknown", ("Unknown", "Unknown"))
+
+    def _add(self, taxon_id: str, name: str, lineage: tuple[str, str]):
+        self.ids[taxon_id] = self.next_id
+        self.new_rows.append((self.next_id, taxon_id, name, *lineage))
+        self.next_id += 1
+
+    def resolve(self, entry: TMvisEntry) -> int | None:
+        if entry.lineage is not None and entry.taxon_id not in self.ids:
+            self._add(entry.taxon_id, entry.organism_name, entry.lineage)
+        taxon_id = self.replacements.get(entry.taxon_id, entry.taxon_id)
+        organism_id = self.ids.get(taxon_id)
+        if (
+            organism_id is None
+            and self.lookup is not None
+            and entry.taxon_id not in self.missing
+        ):
+            organism_id = self._look_up(entry.taxon_id, taxon_id)
+        if organism_id is None:
+            self.missing.add(entry.taxon_id)
+        return organism_id
+
+    def _look_up(self, original_id: str, taxon_id: str) -> int | None:
+        try:
+            organism = self.lookup(taxon_id)
+        except httpx.HTTPError as e:
+            logging.warning(f"Taxonomy lookup of {taxon_id} failed: {e}")
+            return None
+        if organism is None:
+            current_id = UNKNOWN_TAXON_ID
+        else:
+            current_id, name, lineage = organism
+            if current_id not in self.ids:
+                self._add(current_id, name, lineage)
+        self.replacements[original_id] = current_id
+        self.found[original_id] = current_id
+        return self.ids[current_id]
+
+    def flush(self, cursor):
+        cursor.executemany(insert_sql(Organism), self.new_rows)
+        self.new_rows.clear()
+
+
+@dataclass
+class BuildStats:
+    sequences: int = 0
+    annotations: int = 0
+    skipped: int = 0
+    # Only counted by incremental updates
+    updated: int = 0
+    unchanged: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.sequences / self.elapsed if self.elapsed else 0.0
+
+    def log(self, stage: str):
+        changes = ""
+        if self.updated or self.unchanged:
+            changes = f"{self.updated:,} updated, {self.unchanged:,} unchanged, "
+        logging.info(
+            f"{stage}: {self.sequences:,} sequences, {self.annotations:,} annotations, "
+            f"{changes}{self.skipped:,} skipped in {self.elapsed:,.0f}s "
+            f"({self.rate:,.0f} sequences/s)"
+        )
+
+
+class BulkWriter:
+    """
+    Buffers rows with explicit ids and writes them with executemany. Existing
+    sequences are updated in place and get new TMInfo and TMbed annotations.
+    Rows are buffered by sequence id, so a protein added twice before a flush
+    replaces its buffered rows instead of being inserted twice.
+    """
+
+    def __init__(self, organisms: OrganismMap):
+        self.organisms = organisms
+        self.sequence_id = next_id(Sequence)
+        self.tm_info_id = next_id(TMInfo)
+        self.annotation_id = next_id(Annotation)
+        self.sequences: dict[int, tuple] = {}
+        self.sequence_updates: dict[int, tuple] = {}
+        self.tm_infos: dict[int, tuple] = {}
+        self.annotations: dict[int, list[tuple]] = {}
+        # Sequence id and run date of the buffered proteins by accession
+        self.buffered: dict[str, tuple[int, str]] = {}
+        # (chunk, run date) of the buffered proteins by sequence id
+        self.chunks: dict[int, tuple[int, str]] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self.sequences) + len(self.sequence_updates)
+
+    def is_outdated(self, entry: TMvisEntry) -> bool:
+        """A newer prediction of the protein is buffered already."""
+        buffered = self.buffered.get(entry.uniprot_accession)
+        return buffered is not None and buffered[1] > entry.generated_at
+
+    def add(
+        self, entry: TMvisEntry, organism_id: int, sequence_id: int | None = None
+    ) -> int:
+        """Buffers the protein; returns the change in the number of annotations."""
+        buffered = self.buffered.get(entry.uniprot_accession)
+        if buffered is not None:
+            sequence_id = buffered[0]
+        row = (
+            entry.uniprot_id,
+            entry.uniprot_accession,
+            organism_id,
+            entry.sequence,
+            entry.seq_length,
+        )
+        if sequence_id is None:
+            sequence_id = self.sequence_id
+            self.sequence_id += 1
+            self.sequences[sequence_id] = (sequence_id, *row)
+        elif sequence_id in self.sequences:
+            self.sequences[sequence_id] = (sequence_id, *row)
+        else:
+            self.sequence_updates[sequence_id] = (*row, sequence_id)
+        self.buffered[entry.uniprot_accession] = (sequence_id, entry.generated_at)
+        self.chunks[sequence_id] = (entry.chunk, entry.generated_at)
+        self.tm_infos[sequence_id] = (
+            self.tm_info_id,
+            sequence_id,
+            *entry.tm_info[:6],
+            entry.generated_at,
+        ) + entry.tm_info[6:]
+        self.tm_info_id += 1
+        reference = f"chunk {entry.chunk}"
+        first_id = self.annotation_id
+        replaced = self.annotations.get(sequence_id, [])
+        self.annotations[sequence_id] = [
+            (
+                first_id + i,
+                sequence_id,
+                start,
+                end,
+                label,
+                entry.generated_at,
+                TMBED_SOURCE,
+                reference,
+                None,
+            )
+            for i, (start, end, label) in enumerate(entry.regions)
+        ]
+        self.annotation_id += len(entry.regions)
+        return len(entry.regions) - len(replaced)
+
+    def flush(self) -> Counter:
+        """
+        Writes the buffered rows; callers wrap it in a transaction. Returns
+        the number of proteins written by (chunk, run date), without the
+        predictions replaced by a later one before the flush.
+        """
+        cursor = DATABASE.cursor()
+        self.organisms.flush(cursor)
+        if self.sequence_updates:
+            self._delete_predictions(list(self.sequence_updates))
+            cursor.executemany(update_sql(Sequence), self.sequence_updates.values())
+        cursor.executemany(insert_sql(Sequence), self.sequences.values())
+        cursor.executemany(insert_sql(TMInfo), self.tm_infos.values())
+        cursor.executemany(
+            insert_sql(Annotation), chain.from_iterable(self.annotations.values())
+        )
+        self.sequences.clear()
+        self.sequence_updates.clear()
+        self.tm_infos.clear()
+        self.annotations.clear()
+        self.buffered.clear()
+        written = Counter(self.chunks.values())
+        self.chunks.clear()
+        return written
+
+    @staticmethod
+    def _delete_predictions(sequence_ids: list[int]):
+        for start in range(0, len(sequence_ids), LOOKUP_SIZE):
+            ids = sequence_ids[start : start + LOOKUP_SIZE]
+            TMInfo.delete().where(TMInfo.sequence.in_(ids)).execute()
+            Annotation.delete().where(
+                Annotation.sequence.in_(ids) & (Annotation.source_db == TMBED_SOURCE)
+            ).execute()
+
+
+def create_tables():
+    """Tables only; indexes are created after loading."""
+    for model in MODELS:
+        model._schema.create_table(safe=True)
+
+
+def create_indexes():
+    for model in MODELS:
+        started = time.monotonic()
+        model._schema.create_indexes(safe=True)
+        logging.info(
+            f"Indexed {model._meta.table_name} in {time.monotonic() - started:,.0f}s"
+        )
+
+
+def export_key(path: Path) -> str:
+    """
+    Identifies an export file in the checkpoints by name, size and a hash of
+    its start, so a new export with the name and size of an older one is
+    imported from the beginning.
+    """
+    with path.open("rb") as f:
+        digest = hashlib.sha256(f.read(EXPORT_KEY_BYTES)).hexdigest()
+    return f"{path.name}:{path.stat().st_size}:{digest[:16]}"
+
+
+def existing_sequences(accessions: list[str]) -> dict[str, tuple]:
+    """
+    (id, uniprot id, organism id, sequence, length, run date, TMInfo values)
+    by accession; the TMInfo values are in the order of ``TMvisEntry.tm_info``.
+    """
+    existing = {}
+    for start in range(0, len(accessions), LOOKUP_SIZE):
+        rows = (
+            Sequence.select(
+                Sequence.uniprot_accession,
+                Sequence.id,
+                Sequence.uniprot_id,
+                Sequence.organism,
+                Sequence.sequence,
+                Sequence.seq_length,
+                TMInfo.generated_at,
+                TMInfo.tm_helix_count,
+                TMInfo.tm_helix_percent,
+                TMInfo.tm_strand_count,
+                TMInfo.tm_strand_percent,
+                TMInfo.signal_count,
+                TMInfo.signal_percent,
+                TMInfo.has_alpha_helix,
+                TMInfo.has_beta_strand,
+                TMInfo.has_signal,
+            )
+            .join(TMInfo, join_type=JOIN.LEFT_OUTER)
+            .where(
+                Sequence.uniprot_accession.in_(accessions[start : start + LOOKUP_SIZE])
+            )
+            .tuples()
+        )
+        for accession, *row in rows:
+            existing[accession] = (
+                *row[:5],
+                row[5] and str(row[5]),
+                tuple(row[6:]),
+            )
+    return existing
+
+
+def tmbed_regions(sequence_ids: list[int]) -> dict[int, list[tuple[int, int, str]]]:
+    """TMbed (start, end, label) regions of the sequences, like ``entry.regions``."""
+    regions = {}
+    for start in range(0, len(sequence_ids), LOOKUP_SIZE):
+        rows = (
+            Annotation.select(
+                Annotation.sequence, Annotation.start, Annotation.end, Annotation.label
+            )
+            .where(
+                Annotation.sequence.in_(sequence_ids[start : start + LOOKUP_SIZE])
+                & (Annotation.source_db == TMBED_SOURCE)
+            )
+            .order_by(Annotation.sequence, Annotation.start)
+            .tuples()
+        )
+        for sequence_id, *region in rows:
+            regions.setdefault(sequence_id, []).append(tuple(region))
+    return regions
+
+
+def record_progress(export: str, lines: int, chunks: Counter, completed=False):
+    now = datetime.now()
+    ImportCheckpoint.insert(
+        export=export, lines=lines, completed=completed, updated_at=now
+    ).on_conflict_replace().execute()
+    for (chunk, run_on), count in chunks.items():
+        ImportedChunk.insert(
+            chunk=chunk, run_on=run_on, sequences=count, imported_at=now
+        ).on_conflict(
+            conflict_target=[ImportedChunk.chunk, ImportedChunk.run_on],
+            update={
+                ImportedChunk.sequences: ImportedChunk.sequences + count,
+                ImportedChunk.imported_at: now,
+            },
+        ).execute()
+
+
+def build_database(
+    path: Path,
+    replacements: dict[str, str] | None = None,
+    workers: int = 1,
+    batch_lines: int = 2000,
+    commit_every: int = 200000,
+    indexed: bool = True,
+    lookup_taxa: bool = True,
+) -> tuple[BuildStats, set[str]]:
+    """
+    Loads the export into the empty database bound to ``DATABASE`` and
+    returns the statistics and the taxon ids without organism. Without
+    ``indexed``, the database is only a staging copy for ``db_layout``.
+    Without ``lookup_taxa``, taxa are not fetched from the UniProt taxonomy.
+    """
+    for pragma in LOAD_PRAGMAS:
+        DATABASE.execute_sql(pragma)
+    create_tables()
+    if Sequence.select().exists():
+        raise ValueError("build_database requires an empty database")
+
+    organisms = OrganismMap(replacements or {}, fetch_organism if lookup_taxa else None)
+    writer = BulkWriter(organisms)
+    stats = BuildStats()
+    export = export_key(path)
+    lines_done = 0
+
+    def commit(completed=False):
+        with DATABASE.atomic():
+            record_progress(export, lines_done, writer.flush(), completed)
+
+    for num_lines, entries in parse_batches(path, batch_lines, workers):
+        for entry in entries:
+            organism_id = organisms.resolve(entry)
+            if organism_id is None:
+                stats.skipped += 1
+                continue
+            if writer.is_outdated(entry):
+                stats.unchanged += 1
+                continue
+            if entry.uniprot_accession in writer.buffered:
+                stats.updated += 1
+            else:
+                stats.sequences += 1
+            stats.annotations += writer.add(entry, organism_id)
+        lines_done += num_lines
+
+        if writer.pending >= commit_every:
+            commit()
+            stats.log("Loaded")
+    commit(completed=True)
+    renew_build_id()
+    stats.log("Loaded")
+
+    if indexed:
+        create_indexes()
+        stats.log("Indexed")
+    warn_skipped(stats, organisms)
+    return stats, organisms.missing
+
+
+def warn_skipped(stats: BuildStats, organisms: OrganismMap):
+    if organisms.found:
+        logging.info(f"Looked up {len(organisms.found):,} taxa in the UniProt taxonomy")
+    if stats.skipped:
+        logging.warning(
+            f"Skipped {stats.skipped:,} proteins of {len(organisms.missing):,} taxa "
+            "without organism; they are missing from the database"
+        )
+
+
+def update_database(
+    path: Path,
+    replacements: dict[str, str] | None = None,
+    workers: int = 1,
+    batch_lines: int = 2000,
+    commit_every: int = 50000,
+    restart: bool = False,
+    lookup_taxa: bool = True,
+) -> tuple[BuildStats, set[str]]:
+    """
+    Merges the export into the database bound to ``DATABASE``. Proteins are
+    matched by accession; new ones are inserted and changed ones replace
+    their sequence row, TMInfo and TMbed annotations. Every commit records
+    the export lines read so far, an interrupted update continues from the
+    last commit unless ``restart`` is set.
+    """
+    for pragma in UPDATE_PRAGMAS:
+        DATABASE.execute_sql(pragma)
+    create_tables()
+
+    export = export_key(path)
+    checkpoint = ImportCheckpoint.get_or_none(ImportCheckpoint.export == export)
+    lines_done = 0
+    if checkpoint is not None and not restart:
+        if checkpoint.completed:
+            logging.info(f"{path} was already imported, use restart to import again")
+            return BuildStats(), set()
+        lines_done = checkpoint.lines
+        logging.info(f"Resuming {path} after {lines_done:,} lines")
+
+    organisms = OrganismMap(replacements or {}, fetch_organism if lookup_taxa else None)
+    writer = BulkWriter(organisms)
+    stats = BuildStats()
+
+    def commit(completed=False):
+        with DATABASE.atomic():
+            record_progress(export, lines_done, writer.flush(), completed)
+
+    batches = parse_batches(path, batch_lines, workers, skip_lines=lines_done)
+    for num_lines, entries in batches:
+        existing = existing_sequences([entry.uniprot_accession for entry in entries])
+        regions = tmbed_regions([current[0] for current in existing.values()])
+        for entry in entries:
+            organism_id = organisms.resolve(entry)
+            if organism_id is None:
+                stats.skipped += 1
+                continue
+            if writer.is_outdated(entry):
+                stats.unchanged += 1
+                continue
+            # The database does not know proteins buffered since the last commit
+            buffered = entry.uniprot_accession in writer.buffered
+            current = None if buffered else existing.get(entry.uniprot_accession)
+            new = (
+                entry.uniprot_id,
+                organism_id,
+                entry.sequence,
+                entry.seq_length,
+                entry.generated_at,
+                entry.tm_info,
+            )
+            # Unchanged, or an older prediction than the one in the database
+            if current is not None and (
+                (current[1:] == new and regions.get(current[0], []) == entry.regions)
+                or (current[5] or "") > entry.generated_at
+            ):
+                stats.unchanged += 1
+                continue
+            sequence_id = current[0] if current is not None else None
+            stats.annotations += writer.add(entry, organism_id, sequence_id)
+            if sequence_id is None and not buffered:
+                stats.sequences += 1
+            else:
+                stats.updated += 1
+        lines_done += num_lines
+
+        if writer.pending >= commit_every:
+            commit()
+            stats.log("Updated")
+    commit(completed=True)
+    if stats.sequences or stats.updated:
+        renew_build_id()
+    stats.log("Updated")
+    warn_skipped(stats, organisms)
+    return stats, organisms.missing
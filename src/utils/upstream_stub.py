@@ -0,0 +1,405 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""Local stand-in for the UniProt, TmAlphaFold and AlphaFold DB APIs.
+
+``UpstreamStub`` serves responses from memory on a local port, with a delay
+and a share of failed (503) responses per service, so the protein detail
+page can be benchmarked without network access. Responses are recorded from
+the real services (``record_responses``) or built from the proteins of the
+bound database, up front (``database_responses``) or on request
+(``database_response``).
+
+Responses are keyed per service by a relative path, which is also their file
+name in a recording directory:
+
+    uniprot/<accession>.json              search result of the accession
+    tmalphafold/<uniprot id>.json         TMDET regions
+    alphafold/prediction/<accession>.json prediction metadata
+    alphafold/files/<pdb file name>       structure
+"""
+
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from utils import api
+from utils.database import DATABASE, SHARD_ROUTER, Annotation, Sequence
+
+SERVICES = ("uniprot", "tmalphafold", "alphafold")
+
+# Base URL attributes of utils.api per service
+API_URLS = {
+    "uniprot": "UNIPROT_API_URL",
+    "tmalphafold": "TMALPHAFOLD_API_URL",
+    "alphafold": "ALPHAFOLD_API_URL",
+}
+
+RESIDUE_NAMES = {
+    "A": "ALA", "C": "CYS", "D": "ASP", "E": "GLU", "F": "PHE",
+    "G": "GLY", "H": "HIS", "I": "ILE", "K": "LYS", "L": "LEU",
+    "M": "MET", "N": "ASN", "P": "PRO", "Q": "GLN", "R": "ARG",
+    "S": "SER", "T": "THR", "V": "VAL", "W": "TRP", "Y": "TYR",
+}  # fmt: skip
+
+# Typical response times of the real services in seconds
+TYPICAL_DELAYS = {"uniprot": 0.3, "tmalphafold": 0.2, "alphafold": 0.15}
+
+HELIX_LABELS = ("H", "h")
+STRAND_LABELS = ("B", "b")
+
+
+@dataclass
+class ServiceBehavior:
+    # Seconds before each response, plus a uniform random share of jitter
+    delay: float = 0.0
+    jitter: float = 0.0
+    # Share of requests answered with 503 Service Unavailable
+    error_rate: float = 0.0
+
+
+@dataclass
+class StubResponse:
+    content_type: str
+    body: bytes
+
+
+def service_behaviors(
+    delays: list[str], error_rates: list[str], jitter: float
+) -> dict[str, ServiceBehavior]:
+    """
+    Behaviors from SERVICE=VALUE arguments, e.g. ["uniprot=0.5"]; services
+    without a delay get their TYPICAL_DELAYS.
+    """
+
+    def parse(pairs: list[str], defaults: dict[str, float]) -> dict[str, float]:
+        values = dict(defaults)
+        for pair in pairs:
+            service, _, value = pair.partition("=")
+            if service not in SERVICES:
+                raise ValueError(f"Unknown service {service!r}, expected {SERVICES}")
+            values[service] = float(value)
+        return values
+
+    delay_values = parse(delays, TYPICAL_DELAYS)
+    error_values = parse(error_rates, {})
+    return {
+        service: ServiceBehavior(
+            delay=delay_values[service],
+            jitter=jitter,
+            error_rate=error_values.get(service, 0.0),
+        )
+        for service in SERVICES
+    }
+
+
+def response_for(key: str, body: bytes) -> StubResponse:
+    content_type = "application/json" if key.endswith(".json") else "text/plain"
+    return StubResponse(content_type, body)
+
+
+def request_key(service: str, path: str, query: str) -> str | None:
+    """Response key of a request path below the service prefix."""
+    parts = path.strip("/").split("/")
+    if service == "uniprot" and parts[-1] == "search":
+        # "accession:P12345 AND active:true" or "P12345 AND active:true"
+        terms = parse_qs(query).get("query", [""])[0].split()
+        if terms:
+            return f"{terms[0].split(':')[-1]}.json"
+    elif service == "tmalphafold" and parts[:2] == ["api", "tmdet"]:
+        return parts[-1]
+    elif service == "alphafold" and parts[:2] == ["api", "prediction"]:
+        return f"prediction/{parts[-1]}.json"
+    elif service == "alphafold" and parts[0] == "files":
+        return f"files/{parts[-1]}"
+    return None
+
+
+class UpstreamStub:
+    """
+    HTTP server answering the API requests of ``utils.api`` from memory.
+    Use as a context manager; ``patch_api`` points ``utils.api`` at it.
+    """
+
+    def __init__(
+        self,
+        responses: dict[str, dict[str, StubResponse]],
+        behaviors: dict[str, ServiceBehavior] | None = None,
+        seed: int = 0,
+        fallback=None,
+    ):
+        """``fallback(service, key)`` answers requests missing in ``responses``."""
+        self.responses = responses
+        self.fallback = fallback
+        self.behaviors = {s: ServiceBehavior() for s in SERVICES}
+        self.behaviors.update(behaviors or {})
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="upstream-stub", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def patch_api(self):
+        """Sends the requests of ``utils.api`` to this server."""
+        for service, attribute in API_URLS.items():
+            setattr(api, attribute, f"{self.url}/{service}")
+
+    def reset_counts(self):
+        with self._lock:
+            self.requests.clear()
+            self.errors.clear()
+
+    def _outcome(self, service: str) -> tuple[float, bool]:
+        """Delay and whether the request fails."""
+        behavior = self.behaviors[service]
+        with self._lock:
+            self.requests[service] += 1
+            delay = behavior.delay * (1 + behavior.jitter * self._random.random())
+            failed = self._random.random() < behavior.error_rate
+            if failed:
+                self.errors[service] += 1
+        return delay, failed
+
+    def _respond(self, service: str, key: str) -> StubResponse | None:
+        response = self.responses.get(service, {}).get(key)
+        if response is None and self.fallback is not None:
+            response = self.fallback(service, key)
+        if response is None or not key.startswith("prediction/"):
+            return response
+        # Recorded predictions point at the real file server
+        predictions = json.loads(response.body)
+        for prediction in predictions:
+            name = prediction["pdbUrl"].rsplit("/", 1)[-1]
+            prediction["pdbUrl"] = f"{self.url}/alphafold/files/{name}"
+        return StubResponse(response.content_type, json.dumps(predictions).encode())
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                service, _, path = url.path.lstrip("/").partition("/")
+                if service not in SERVICES:
+                    self.send_error(404)
+                    return
+
+                delay, failed = stub._outcome(service)
+                time.sleep(delay)
+                key = request_key(service, path, url.query)
+                response = None if key is None else stub._respond(service, key)
+                if failed:
+                    self.send_error(503)
+                elif response is None:
+                    self.send_error(404)
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", response.content_type)
+                    self.send_header("Content-Length", str(len(response.body)))
+                    self.end_headers()
+                    self.wfile.write(response.body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"upstream stub: {format % args}")
+
+        return Handler
+
+
+def load_responses(directory: Path) -> dict[str, dict[str, StubResponse]]:
+    """Reads a recording directory, see the module docstring for its layout."""
+    responses = {}
+    for service in SERVICES:
+        root = directory / service
+        responses[service] = {
+            path.relative_to(root).as_posix(): response_for(
+                path.name, path.read_bytes()
+            )
+            for path in root.rglob("*")
+            if path.is_file()
+        }
+    return responses
+
+
+def record_responses(accessions: list[str], directory: Path):
+    """Saves the responses of the real APIs for the accessions."""
+
+    def save(service: str, key: str, url: str):
+        response = httpx.get(url, timeout=30)
+        if response.status_code != 200:
+            logging.info(f"{url}: HTTP {response.status_code}, not recorded")
+            return None
+        path = directory / service / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(response.content)
+        return response
+
+    for accession in accessions:
+        uniprot = save(
+            "uniprot",
+            f"{accession}.json",
+            api.uniprot_query_url(accession, api.uniprot_get_input_type(accession)),
+        )
+        results = uniprot.json().get("results") if uniprot is not None else None
+        name = results[0]["uniProtkbId"] if results else accession
+        save("tmalphafold", f"{name}.json", api.tmalphafold_query_url(name))
+        prediction = save(
+            "alphafold",
+            f"prediction/{accession}.json",
+            f"{api.ALPHAFOLD_API_URL}/api/prediction/{accession}",
+        )
+        if prediction is not None:
+            pdb_url = prediction.json()[0]["pdbUrl"]
+            save("alphafold", f"files/{pdb_url.rsplit('/', 1)[-1]}", pdb_url)
+
+
+def uniprot_body(sequence: Sequence, annotations: list[Annotation]) -> dict:
+    features = [
+        {
+            "type": "Transmembrane",
+            "description": "Beta stranded" if a.label in STRAND_LABELS else "Helical",
+            "location": {"start": {"value": a.start}, "end": {"value": a.end}},
+        }
+        for a in annotations
+        if a.label in HELIX_LABELS + STRAND_LABELS
+    ]
+    return {
+        "results": [
+            {
+                "primaryAccession": sequence.uniprot_accession,
+                "uniProtkbId": sequence.uniprot_id,
+                "sequence": {"length": sequence.seq_length},
+                "features": features,
+            }
+        ]
+    }
+
+
+def tmalphafold_body(annotations: list[Annotation]) -> dict | None:
+    regions = [
+        {"_attributes": {"type": "M", "seq_beg": a.start, "seq_end": a.end}}
+        for a in annotations
+        if a.label in HELIX_LABELS
+    ]
+    return {"CHAIN": [{"REGION": regions}]} if regions else None
+
+
+def pdb_structure(sequence: str) -> str:
+    """Backbone and C-beta atoms of the sequence on an ideal alpha helix."""
+    lines = []
+    serial = 1
+    for i, residue in enumerate(sequence, start=1):
+        angle = math.radians(100 * i)
+        atoms = ["N", "CA", "C", "O"] + ([] if residue == "G" else ["CB"])
+        for offset, name in enumerate(atoms):
+            x = 2.3 * math.cos(angle) + 0.3 * offset
+            y = 2.3 * math.sin(angle) + 0.2 * offset
+            z = 1.5 * i + 0.1 * offset
+            lines.append(
+                f"ATOM  {serial:5d}  {name:<3} {RESIDUE_NAMES.get(residue, 'UNK')} "
+                f"A{i:4d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00 90.00"
+                f"           {name[0]}"
+            )
+            serial += 1
+    return "\n".join(lines + ["END", ""])
+
+
+def protein_responses(sequence: Sequence) -> dict[str, dict[str, StubResponse]]:
+    """
+    Responses consistent with a protein of the database: UniProt and
+    TmAlphaFold report its TMbed helices and strands, AlphaFold an ideal
+    helix of its sequence.
+    """
+    accession = sequence.uniprot_accession
+    annotations = list(
+        Annotation.select()
+        .where(Annotation.sequence == sequence)
+        .order_by(Annotation.start)
+    )
+    responses = {service: {} for service in SERVICES}
+    responses["uniprot"][f"{accession}.json"] = response_for(
+        ".json", json.dumps(uniprot_body(sequence, annotations)).encode()
+    )
+    tmalphafold = tmalphafold_body(annotations)
+    if tmalphafold is not None:
+        responses["tmalphafold"][f"{sequence.uniprot_id}.json"] = response_for(
+            ".json", json.dumps(tmalphafold).encode()
+        )
+    pdb_name = f"AF-{accession}-F1-model_v4.pdb"
+    prediction = [
+        {
+            "uniprotAccession": accession,
+            "uniprotSequence": sequence.sequence,
+            "pdbUrl": f"https://alphafold.ebi.ac.uk/files/{pdb_name}",
+        }
+    ]
+    responses["alphafold"][f"prediction/{accession}.json"] = response_for(
+        ".json", json.dumps(prediction).encode()
+    )
+    responses["alphafold"][f"files/{pdb_name}"] = response_for(
+        pdb_name, pdb_structure(sequence.sequence).encode()
+    )
+    return responses
+
+
+def database_responses(accessions: list[str]) -> dict[str, dict[str, StubResponse]]:
+    """Responses of ``protein_responses`` for the accessions."""
+    responses = {service: {} for service in SERVICES}
+    for accession in accessions:
+        sequence = Sequence.get(Sequence.uniprot_accession == accession)
+        for service, service_responses in protein_responses(sequence).items():
+            responses[service].update(service_responses)
+    return responses
+
+
+def database_response(service: str, key: str) -> StubResponse | None:
+    """
+    Response of any protein in the bound database, built on request. Used as
+    ``fallback`` of ``UpstreamStub`` when the requested proteins are not
+    known in advance, e.g. in sessions that pick proteins from the table.
+    """
+    name = key.rsplit("/", 1)[-1].removesuffix(".json")
+    if key.startswith("files/"):
+        # AF-<accession>-F1-model_v4.pdb
+        name = name.split("-")[1]
+    if service == "tmalphafold":
+        condition = Sequence.uniprot_id == name
+    elif service == "uniprot":
+        # The app searches UniProt by accession or UniProt ID
+        condition = (Sequence.uniprot_accession == name) | (Sequence.uniprot_id == name)
+    else:
+        condition = Sequence.uniprot_accession == name
+
+    # Each request is served by a new thread with its own connection
+    with DATABASE.connection_context(), SHARD_ROUTER.protein_shard(name):
+        sequence = Sequence.get_or_none(condition)
+        if sequence is None:
+            return None
+        return protein_responses(sequence)[service].get(key)
@@ -1,7 +1,15 @@
-import streamlit as st
-import py3Dmol
+from itertools import groupby
+from pathlib import Path
 
-from utils.protein_visualization import showmol
+import streamlit as st
+from utils.protein_visualization import (
+    ProteinStyle,
+    compact_structure,
+    create_view,
+    make_viewer_html,
+    range_styles,
+    showmol,
+)
 
 ##############
 # Header vis #
@@ -12,13 +20,48 @@ id = "A0A6J4QGY1"
 seq = "MSTTSATPDPVVVRSTVPARMDRLPWTRFHWIVVVGLGVSWILDGLEIQIVSLNGPSLTDAAGSMHLSAAEFGALGSIYLAGEVVGALVFGRITDKLGRRKLFIITLAIYLVGSGLGGFAWDFWSLALFRFVAGTGIGGEYTAINSAIDELIPAKYRGRVDIAVNGTYWGGALLGNLVGLYLFSNNVSIDWGWRIGFFIGPVLGLVIIFLRRTIPESPRWLMTHGREEEAKRTVDDIEKRIEARGVELEPVPDSKAITLKETPPLGFAELTKIFFGKYPKRSVLGFTMMVTQAFLYNAIFFSYALVLKTFYGIPAGSIPLYFLPFALGNLLGPLLLGHLFDTIGRRKMILATYGGSGILLFITAFMFNAGILTATTQTILWCVIFFFASAGASSAYLTVSEIFPLELRGQAISYFFAISQGAGGVVAPWLFGKLIGNPDALASTGHAPPTGPLTWGYVIGASIMVIGGLVAWFIGIDAERKSLEDIATPLSAAEQPPGQGEMSEARS"
 pred = "iiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHHoooooooooooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiHHHHHHHHHHHHHHHHHHHHoohhhhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHooooooooohhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHHHooooooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiHHHHHHHHHHHHHHHHHHHHHooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHooooooooooooooooooohhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHHoooooooooooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiHHHHHHHHHHHHHHHHHHHHoohhhhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHooooooooohhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHHHooooooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiHHHHHHHHHHHHHHHHHHHHHooooooohhhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiHHHHHHHHHHHHHHHHHHHHHHHooooooooooooooooooohhhhhhhhhhhhhhhhhhhhhiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiii"
 
-pdb_file = open("assets/header_A0A2T0ZVU5.pdb", "r")
-system = "".join([x for x in pdb_file])
+PDB_PATH = Path(__file__).parents[2] / "assets" / "header_A0A2T0ZVU5.pdb"
 
 
 ##############
 
 
+def _header_styles(num_residues: int):
+    color_map = {
+        "S": "pink",
+        "H": "yellowgreen",
+        "h": "darkgreen",
+        "B": "powderblue",
+        "b": "darkblue",
+    }
+    starts, ends, colors = [], [], []
+    position = 1
+    for res_type, run in groupby(pred[:num_residues]):
+        length = len(list(run))
+        starts.append(position)
+        ends.append(position + length - 1)
+        colors.append(color_map.get(res_type, "grey"))
+        position += length
+    return range_styles(starts, ends, colors, ProteinStyle.CARTOON)
+
+
+@st.cache_resource(show_spinner=False)
+def header_viewer_html():
+    """Builds the spinning header structure once per process."""
+    with PDB_PATH.open("r") as pdb_file:
+        system = compact_structure(pdb_file.read(), ProteinStyle.CARTOON)
+    num_residues = sum(1 for line in system.splitlines() if line[12:16] == " CA ")
+
+    view = create_view(height=200, width=400)
+    view.addModelsAsFrames(system)
+    view.setBackgroundColor("#0E1117")
+    view.spin(True)
+    for selection, residue_style in _header_styles(num_residues):
+        view.setStyle(selection, residue_style)
+    view.zoom(0.15)
+    return make_viewer_html(view)
+
+
 def title():
     st.markdown(
         "<style>div.block-container{padding-top:3rem;}</style>", unsafe_allow_html=True
@@ -31,36 +74,7 @@ def title():
     col1.markdown("# TMvisDB")
 
     with col2:
-        view = py3Dmol.view(
-            js="https://3dmol.org/build/3Dmol.js", height=200, width=400
-        )
-        view.addModelsAsFrames(system)
-        view.setBackgroundColor("#0E1117")
-        view.spin(True)
-
-        num_atom = 0
-        atom_color = dict()
-        # get TM colors
-        for nr, res_type in enumerate(pred):
-            if res_type == "S":
-                atom_color[nr] = "pink"
-            elif res_type == "H":
-                atom_color[nr] = "yellowgreen"
-            elif res_type == "h":
-                atom_color[nr] = "darkgreen"
-            elif res_type == "B":
-                atom_color[nr] = "powderblue"
-            elif res_type == "b":
-                atom_color[nr] = "darkblue"
-            else:
-                atom_color[nr] = "grey"
-
-        view.setStyle(
-            {"model": -1},
-            {"cartoon": {"colorscheme": {"prop": "resi", "map": atom_color}}},
-        )
-        view.zoom(0.15)
-        showmol(view, height=200, width=400)
+        showmol(header_viewer_html(), height=200, width=400)
 
     st.caption(
         "Welcome to TMvisDB: A database to search and visualize predicted transmembrane proteins."
@@ -1,5 +1,20 @@
+import pandas as pd
 import streamlit as st
 
+from utils import query_cache, statistics
+from utils.database import TOPOLOGY_SIGNATURES
+from utils.lineage_definitions import Topology
+
+# Kingdom shown for organisms without a clade
+NO_CLADE = "Unclassified"
+
+TOPOLOGY_CLASSES = {
+    "H": Topology.ALPHA_HELIX.value,
+    "B": Topology.BETA_STRAND.value,
+    "HB": Topology.BOTH.value,
+}
+
+
 def intro():
     st.markdown(
         "**TMvisDB** provides per-residue transmembrane topology annotations for all proteins in [AlphaFold DB](https://doi.org/10.1093/nar/gkab1061) (~ 200 million proteins, September '22) "
@@ -20,3 +35,109 @@ def intro():
         "You can either select a protein from the table you generated while browsing TMvisDB, or you can directly enter a UniProt Identifier. "
         "The AlphaFold 2 structures of a protein is then shown with the corresponding color code of the predicted topology. "
         "You may also select the pLDDT score of AlphaFold 2 as a color code.")
+
+
+def topology_class(code: int) -> str:
+    """Predicted transmembrane class of a topology code, ignoring signal peptides."""
+    return TOPOLOGY_CLASSES.get(TOPOLOGY_SIGNATURES[code].strip("-S"), "None")
+
+
+def count_proteins(df: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    return df.groupby(by, as_index=False, observed=True)["Proteins"].sum()
+
+
+def statistics_dashboard():
+    """
+    Protein counts of the whole database from the aggregates computed with
+    the statistics (tools/build_statistics.py); nothing is shown without them.
+    """
+    lineage = pd.DataFrame(
+        statistics.load_lineage_topology(),
+        columns=["Domain", "Kingdom", "topology", "Proteins"],
+    )
+    if lineage.empty:
+        return
+    # Group-bys drop missing keys, which would hide these proteins
+    lineage["Kingdom"] = lineage["Kingdom"].fillna(NO_CLADE)
+    lineage["Topology"] = lineage["topology"].map(topology_class)
+    lineage["Signal peptide"] = lineage["topology"].map(
+        lambda code: "S" in TOPOLOGY_SIGNATURES[code]
+    )
+
+    st.markdown("###### :bar_chart: TMvisDB in numbers")
+    classes = count_proteins(lineage, ["Topology"]).set_index("Topology")["Proteins"]
+    both = classes.get(Topology.BOTH.value, 0)
+    alpha_helix = classes.get(Topology.ALPHA_HELIX.value, 0) + both
+    beta_strand = classes.get(Topology.BETA_STRAND.value, 0) + both
+    signal_peptide = lineage.loc[lineage["Signal peptide"], "Proteins"].sum()
+
+    metrics = st.columns(4)
+    metrics[0].metric("Proteins", f"{lineage['Proteins'].sum():,}")
+    metrics[1].metric("With alpha-helices", f"{alpha_helix:,}")
+    metrics[2].metric("With beta-strands", f"{beta_strand:,}")
+    metrics[3].metric("With signal peptides", f"{signal_peptide:,}")
+
+    taxonomy, topology = st.columns(2)
+    with taxonomy:
+        st.markdown("Proteins per domain")
+        st.bar_chart(
+            count_proteins(lineage, ["Domain", "Topology"]),
+            x="Domain",
+            y="Proteins",
+            color="Topology",
+        )
+        domain = st.selectbox(
+            "Kingdoms of domain",
+            sorted(lineage["Domain"].unique()),
+            key="overview_domain",
+        )
+        st.bar_chart(
+            count_proteins(
+                lineage[lineage["Domain"] == domain], ["Kingdom", "Topology"]
+            ),
+            x="Kingdom",
+            y="Proteins",
+            color="Topology",
+        )
+        # Aggregated on demand, only with the analytics engine
+        clades = query_cache.get_clade_distribution(domain)
+        if clades is not None and not clades.empty:
+            clades["Kingdom"] = clades["Kingdom"].fillna(NO_CLADE)
+            st.markdown("Transmembrane helix residues per kingdom")
+            st.bar_chart(clades, x="TM helix residues", y="Proteins", color="Kingdom")
+    with topology:
+        st.markdown("Topology classes")
+        breakdown = count_proteins(lineage, ["Topology", "Signal peptide"])
+        breakdown["Share (%)"] = (
+            100 * breakdown["Proteins"] / breakdown["Proteins"].sum()
+        ).round(2)
+        st.dataframe(breakdown, hide_index=True)
+
+        st.markdown("Organisms with the most proteins")
+        top_organisms = pd.DataFrame(
+            statistics.load_top_organisms(),
+            columns=["Organism", "Organism ID", "Domain", "Kingdom", "Proteins"],
+        )
+        top_organisms["Kingdom"] = top_organisms["Kingdom"].fillna(NO_CLADE)
+        st.dataframe(top_organisms, hide_index=True)
+
+    lengths, helices = st.columns(2)
+    for column, name, label in [
+        (lengths, "SEQ_LENGTH", "Sequence length"),
+        (helices, "TM_HELIX_COUNT", "Transmembrane helix residues"),
+    ]:
+        distribution = pd.DataFrame(
+            statistics.load_distribution(name),
+            columns=["topology", label, "Proteins"],
+        )
+        if distribution.empty:
+            continue
+        distribution["Topology"] = distribution["topology"].map(topology_class)
+        with column:
+            st.markdown(f"{label} distribution")
+            st.bar_chart(
+                count_proteins(distribution, [label, "Topology"]),
+                x=label,
+                y="Proteins",
+                color="Topology",
+            )
@@ -1,7 +1,8 @@
 import logging
+import time
 
-import py3Dmol
 import streamlit as st
+import streamlit.components.v1 as components
 from st_aggrid import AgGrid
 
 from utils.protein_visualization import showmol
@@ -12,11 +13,10 @@ from utils.protein_visualization import (
     ALPHAFOLD_LEGEND_DF,
     ANNOTATION_LEGEND_DF,
 )
-from utils import protein_visualization
+from utils import protein_visualization, residue_track
 
 from utils.protein_info import ProteinInfo
-from utils.protein_visualization import Style, ColorScheme
-from utils import membrane_annotation
+from utils.protein_visualization import Style, ColorScheme, ProteinStyle
 from utils.membrane_annotation import (
     MembraneAnnotation,
     DISPLAY_NAMES,
@@ -70,8 +70,7 @@ def available_annotations_human_readable(annotation: MembraneAnnotation):
     else:
         formatted_annotations = [
             prefix_annotation(annotation=DISPLAY_NAMES[ann])
-            for ann in annotation.annotations
-            if annotation.annotations[ann] is not None
+            for ann in annotation.segments
         ]
         if len(formatted_annotations) == 1:
             connected = formatted_annotations[0]
@@ -82,6 +81,15 @@ def available_annotations_human_readable(annotation: MembraneAnnotation):
         return f"Found {connected}."
 
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_track_html(
+    accession: str, fingerprint: tuple, _protein_info: ProteinInfo
+) -> str:
+    return residue_track.render_residue_tracks(
+        _protein_info.annotation, _protein_info.sequence
+    )
+
+
 def display_membrane_annotation(protein_info: ProteinInfo):
     """Visualizes membrane annotations using the provided data."""
 
@@ -90,19 +98,18 @@ def display_membrane_annotation(protein_info: ProteinInfo):
         st.caption("Could not find any annotations for this protein.")
         return
 
-    pred_table = membrane_annotation.construct_df_from_annotation(
-        protein_info.annotation, protein_info.sequence
-    )
-    styled_table = pred_table.T.style.apply(
-        protein_visualization.color_prediction, axis=0
-    )
-
     st.write(available_annotations_human_readable(protein_info.annotation))
 
-    st.write(styled_table)
+    components.html(
+        render_track_html(
+            protein_info.uniprot_accession, protein_info.fingerprint, protein_info
+        ),
+        height=residue_track.track_height(protein_info.annotation),
+        scrolling=False,
+    )
 
     st.caption(
-        "If entries in a row are '*', there are no annotations for these residues."  # noqa: E501
+        "Scroll horizontally to move along the sequence. Residues without annotation are left blank."  # noqa: E501
     )
 
 
@@ -116,22 +123,46 @@ def display_other_annotations(protein_info: ProteinInfo):
     )
 
 
-def display_protein_structure(protein_info: ProteinInfo, style: Style):
-    structure = protein_info.structure
-    view = py3Dmol.view(js="https://3dmol.org/build/3Dmol.js")
+@st.cache_data(max_entries=128, show_spinner=False)
+def compact_structure(
+    accession: str, visualization_style: ProteinStyle, _structure: str
+) -> str:
+    """Caches the style-specific reduced structure per (accession, style)."""
+    return protein_visualization.compact_structure(_structure, visualization_style)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_structure_html(
+    accession: str,
+    fingerprint: tuple,
+    visualization_style: ProteinStyle,
+    color_scheme: ColorScheme,
+    spin: bool,
+    layers: tuple[AnnotationSource, ...],
+    _protein_info: ProteinInfo,
+) -> str:
+    """
+    Renders the viewer HTML once per (accession, style, color scheme, spin,
+    annotation layers) and fetched data, see ProteinInfo.fingerprint.
+    """
+    start = time.perf_counter()
+    structure = _protein_info.structure
+    if structure is not None:
+        structure = compact_structure(accession, visualization_style, structure)
+    view = protein_visualization.create_view()
     view.addModelsAsFrames(structure)
     view.setBackgroundColor("#262730")
 
     # TODO make style selectable
     # add color
     if (
-        style.color_scheme == ColorScheme.ALPHAFOLD_PLDDT_SCORE
-        or not protein_info.annotation.has_annotations
+        color_scheme == ColorScheme.ALPHAFOLD_PLDDT_SCORE
+        or not _protein_info.annotation.has_annotations
     ):
         view.setStyle(
             {"model": -1},
             {
-                style.visualization_style.value: {
+                visualization_style.value: {
                     "colorscheme": {
                         "prop": "b",
                         "gradient": "roygb",
@@ -142,24 +173,40 @@ def display_protein_structure(protein_info: ProteinInfo, style: Style):
             },
         )
     else:
-        tmbed_annotations = protein_info.annotation.annotations.get(
-            AnnotationSource.TMBED, []
-        )
-        tm_color = protein_visualization.map_annotation_to_color(tmbed_annotations)
-
         view.setStyle(
             {"model": -1},
-            {
-                style.visualization_style.value: {
-                    "colorscheme": {"prop": "resi", "map": tm_color}
-                }
-            },
+            {visualization_style.value: {"color": protein_visualization.BASE_COLOR}},
         )
+        for selection, residue_style in protein_visualization.annotation_layer_styles(
+            _protein_info.annotation, layers, visualization_style
+        ):
+            view.setStyle(selection, residue_style)
 
-    view.spin(style.spin)
+    view.spin(spin)
 
     view.zoomTo()
-    showmol(view, height=500, width=800)
+    html = protein_visualization.make_viewer_html(view)
+    if structure is not None:
+        logging.info(
+            f"Structure {accession} ({visualization_style.value}): "
+            f"{len(structure) / 1024:.1f} of {len(_protein_info.structure) / 1024:.1f} KiB, "  # noqa: E501
+            f"viewer {len(html) / 1024:.1f} KiB, "
+            f"rendered in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+    return html
+
+
+def display_protein_structure(protein_info: ProteinInfo, style: Style):
+    html = render_structure_html(
+        protein_info.uniprot_accession,
+        protein_info.fingerprint,
+        style.visualization_style,
+        style.color_scheme,
+        style.spin,
+        style.layers,
+        protein_info,
+    )
+    showmol(html, height=500, width=800)
 
 
 def create_visualization_for_id(
@@ -1,16 +1,26 @@
+from dataclasses import replace
+import os
+
 import pandas as pd
 import streamlit as st
 from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
 
-from utils import database, api
+from utils import api, query_cache, statistics
 from utils.database import DBFilter
 from utils.lineage_definitions import Topology
-from utils import protein_info
+from utils.random_pool import RandomSelectionPool
+
+# Number of unseen random selections kept in memory
+RANDOM_POOL_SIZE = int(os.getenv("RANDOM_POOL_SIZE", "32"))
+
+
+# Internal ids are only used as cursor for sorted results
+HIDDEN_COLUMNS = ["id"]
 
 
 @st.cache_data
 def convert_df(df):
-    return df.to_csv().encode("utf-8")
+    return df.drop(columns=HIDDEN_COLUMNS, errors="ignore").to_csv().encode("utf-8")
 
 
 def filter_to_markdown(db_filter: DBFilter):
@@ -42,6 +52,19 @@ def filter_to_markdown(db_filter: DBFilter):
     else:
         parts.append("**lengths**: [all]")
 
+    # Value ranges
+    for numeric_range in db_filter.ranges:
+        if numeric_range.low is not None or numeric_range.high is not None:
+            low = numeric_range.low if numeric_range.low is not None else "min"
+            high = numeric_range.high if numeric_range.high is not None else "max"
+            parts.append(f"**{numeric_range.column.value.lower()}**: [{low}-{high}]")
+
+    # Sorting
+    if db_filter.is_sorted:
+        parts.append(
+            f"**sorted by**: [{db_filter.sort_key.value} ({'descending' if db_filter.sort_descending else 'ascending'})]"  # noqa: E501
+        )
+
     # Final String
     return ", ".join(parts)
 
@@ -66,6 +89,10 @@ def show_table(df: pd.DataFrame, paginate=True):
 
     builder.configure_grid_options(enableCellTextSelection=True)
 
+    for column in HIDDEN_COLUMNS:
+        if column in df.columns:
+            builder.configure_column(column, hide=True)
+
     if "Organism ID" in df.columns:
         builder.configure_column(
             "Organism ID",
@@ -97,17 +124,63 @@ def show_table(df: pd.DataFrame, paginate=True):
     AgGrid(df, gridOptions=go, fit_columns_on_grid_load=True, allow_unsafe_jscode=True)
 
 
-@st.cache_data(ttl=60, show_spinner=False)
+@st.cache_resource
+def random_selection_pool() -> RandomSelectionPool:
+    return RandomSelectionPool(
+        page_size=DBFilter().num_sequences, pool_size=RANDOM_POOL_SIZE
+    ).start()
+
+
 def display_random_data(db_filter: DBFilter):
-    with st.spinner("Loading random data..."):
-        query = database.get_sequence_data(db_filter)
-        st.session_state.data = protein_info.db_to_df(query)
-    st.session_state.user_display = "The table below shows a random selection. You can retrieve new random data every minute. Use the sidebar filters for a personalized selection."  # noqa: E501
+    # Every click creates a new filter; other reruns keep the shown selection
+    if st.session_state.get("random_filter") is not db_filter:
+        with st.spinner("Loading random data..."):
+            st.session_state.data = random_selection_pool().take(db_filter)
+        st.session_state.random_filter = db_filter
+    st.session_state.user_display = "The table below shows a random selection. Click the button again for a new selection. Use the sidebar filters for a personalized selection."  # noqa: E501
 
 
-@st.cache_data(ttl=600, show_spinner=False)
 def display_filtered_data(db_filter: DBFilter):
+    # Estimated from the database statistics before the query runs
+    estimate = statistics.estimate_cost(db_filter)
+    if estimate is not None:
+        st.caption(f"About {estimate.matching_rows:,} proteins match your filters.")
+        if estimate.expensive:
+            st.warning(
+                f"These filters are expensive to evaluate: about {estimate.examined_rows:,} proteins need to be checked. "  # noqa: E501
+                "Loading may take a while and the results may be narrowed; selecting a domain, an organism or a topology helps.",  # noqa: E501
+                icon="⏳",
+            )
     with st.spinner("Loading filtered data..."):
-        query = database.get_sequence_data(db_filter)
-        st.session_state.data = protein_info.db_to_df(query)
+        st.session_state.data = query_cache.get_sequence_frame(db_filter)
+    if st.session_state.data.attrs.get("busy"):
+        st.warning(
+            "TMvisDB is busy and could not run your query. Please apply your filters again in a moment.",  # noqa: E501
+            icon="⏳",
+        )
+    elif st.session_state.data.attrs.get("narrowed"):
+        st.warning(
+            f"Your query is too broad to finish in time and was narrowed to {len(st.session_state.data)} rows. "  # noqa: E501
+            "Please refine your filters, e.g. by selecting a domain or an organism.",
+            icon="⏱️",
+        )
     st.session_state.user_display = f"The table below shows your personalized selection -  {filter_to_markdown(db_filter)}. For a random selection use the sidebar button."  # noqa: E501
+
+
+def display_page_navigation(db_filter: DBFilter, df: pd.DataFrame):
+    """
+    Sorted results are paged with a cursor on the last shown row, so later
+    pages are as cheap as the first one.
+    """
+    if not db_filter.is_sorted:
+        return
+
+    col_first, col_next = st.columns(2)
+    if db_filter.cursor is not None and col_first.button("First page"):
+        st.session_state.database_filter = replace(db_filter, cursor=None)
+        st.rerun()
+    if len(df) == db_filter.num_sequences and col_next.button("Next page"):
+        st.session_state.database_filter = db_filter.next_page(
+            df[db_filter.sort_key.value].iloc[-1].item(), int(df["id"].iloc[-1])
+        )
+        st.rerun()
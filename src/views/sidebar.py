@@ -1,11 +1,30 @@
 import streamlit as st
 
-from utils.database import TaxaSelectionCriterion, Domain, Topology, DBFilter
-from utils import lineage_definitions
+from utils.database import (
+    TaxaSelectionCriterion,
+    Domain,
+    Topology,
+    DBFilter,
+    SortKey,
+    RangeColumn,
+    NumericRange,
+)
+from utils import lineage_definitions, timing
 from utils.protein_visualization import ProteinStyle, ColorScheme, VizFilter, Style
+from utils.membrane_annotation import AnnotationSource, DISPLAY_NAMES
 
 sb = st.sidebar
 
+# Slider bounds of the numeric range filters; the full range is no filter
+RANGE_BOUNDS = {
+    RangeColumn.TM_HELIX_COUNT: (0, 5500),
+    RangeColumn.TM_STRAND_COUNT: (0, 5500),
+    RangeColumn.SIGNAL_COUNT: (0, 5500),
+    RangeColumn.TM_HELIX_PERCENT: (0.0, 100.0),
+    RangeColumn.TM_STRAND_PERCENT: (0.0, 100.0),
+    RangeColumn.SIGNAL_PERCENT: (0.0, 100.0),
+}
+
 
 def display_sidebar_header():
     sb.markdown(
@@ -13,7 +32,7 @@ def display_sidebar_header():
     )
     sb.markdown("---")
     sb.subheader("Search TMvisDB")
-    sb.caption("Please open the 'Database' tab to see results.")
+    sb.caption("Results are shown in the 'Database' tab.")
 
 
 def create_random_form():
@@ -25,9 +44,14 @@ def create_random_form():
     )
 
 
+@st.fragment
+@timing.timed("fragment filter form")
 def create_filter_form():
-    # FIXME this should only re-render on submit
-    with sb.expander("Click here to access filters for TMvisDB."):
+    """
+    Filter widgets only rerun this fragment while they are edited; applying
+    the filters reruns the app to refresh the protein table.
+    """
+    with st.expander("Click here to access filters for TMvisDB."):
         taxonomy_selection = st.radio(
             "Select Taxonomy via",
             TaxaSelectionCriterion,
@@ -94,6 +118,35 @@ def create_filter_form():
             key="sequence_lengths",
         )
 
+        range_columns = st.multiselect(
+            "Filter by value ranges",
+            RangeColumn,
+            format_func=lambda x: x.value,
+            help="Restrict the number or percentage of predicted transmembrane and signal peptide residues.",  # noqa: E501
+            key="range_columns",
+        )
+        for column in range_columns:
+            st.slider(
+                column.value,
+                *RANGE_BOUNDS[column],
+                RANGE_BOUNDS[column],
+                key=f"range_{column.name}",
+            )
+
+        sort_key = st.selectbox(
+            "Sort by",
+            SortKey,
+            format_func=lambda x: x.value,
+            help="Show the proteins with the highest (or lowest) values first.",
+            key="sort_key",
+        )
+        st.checkbox(
+            "Sort descending",
+            value=True,
+            disabled=(sort_key == SortKey.NONE),
+            key="sort_descending",
+        )
+
         st.number_input(
             "Select limit of shown sequences",
             1,
@@ -104,18 +157,22 @@ def create_filter_form():
         )
 
         # Submit results
-        st.button(
+        if st.button(
             "Apply filters",
             help="Click here to show your selection.",
             on_click=handle_db_filter,
-        )
+        ):
+            st.rerun()
 
 
 def create_vis_form():
     st.sidebar.subheader("Visualize predicted transmembrane proteins")
-    sb.caption("Please open the 'Visualization' tab to see results.")
+    sb.caption("Results are shown in the 'Visualization' tab.")
 
-    with sb.expander("Click here to access 3D visualization for single proteins."):
+    with (
+        sb.expander("Click here to access 3D visualization for single proteins."),
+        st.form("visualization_form", border=False),
+    ):
         st.text_input("Insert Uniprot ID", placeholder="Q9NVH1", key="visualization_id")
 
         st.selectbox(
@@ -131,11 +188,20 @@ def create_vis_form():
             format_func=lambda x: x.value,
             key="color_scheme",
         )
+        # select annotation layers
+        st.multiselect(
+            "Annotation layers",
+            AnnotationSource,
+            default=[AnnotationSource.TMBED],
+            format_func=lambda x: DISPLAY_NAMES[x],
+            help="Annotations painted onto the structure. Later layers are drawn on top of earlier ones.",  # noqa: E501
+            key="layers",
+        )
         # select spin
         st.checkbox("Spin", value=False, key="spin")
 
-        # Submit results
-        st.button(
+        # Submit results; edits inside the form do not rerun the app
+        st.form_submit_button(
             "Visualize Protein",
             help="Click here to visualize your selection.",
             on_click=handle_vis_changes,
@@ -160,17 +226,38 @@ def handle_db_filter():
         "kingdom",
         "signal_peptide",
         "num_sequences",
+        "sort_key",
+        "sort_descending",
     ]
     filter_kwargs = {
         attr: getattr(st.session_state, attr)
         for attr in attributes
         if hasattr(st.session_state, attr)
     }
-    st.session_state.database_filter = DBFilter(**filter_kwargs, random_selection=False)
+    st.session_state.database_filter = DBFilter(
+        **filter_kwargs, ranges=selected_ranges(), random_selection=False
+    )
+    st.session_state.active_tab = "Database"
+
+
+def selected_ranges():
+    ranges = []
+    for column in st.session_state.get("range_columns", []):
+        low, high = st.session_state.get(f"range_{column.name}", RANGE_BOUNDS[column])
+        min_value, max_value = RANGE_BOUNDS[column]
+        ranges.append(
+            NumericRange(
+                column,
+                low=None if low == min_value else low,
+                high=None if high == max_value else high,
+            )
+        )
+    return tuple(ranges)
 
 
 def handle_random_selection():
     st.session_state.database_filter = DBFilter(random_selection=True)
+    st.session_state.active_tab = "Database"
 
 
 def handle_vis_changes():
@@ -183,17 +270,21 @@ def handle_vis_changes():
         for attr in attributes
         if hasattr(st.session_state, attr)
     }
+    if hasattr(st.session_state, "layers"):
+        style_kwargs["layers"] = tuple(st.session_state.layers)
     style = Style(**style_kwargs)
     st.session_state.visualization_filter = VizFilter(
         style=style, selected_id=selected_id
     )
+    st.session_state.active_tab = "Visualization"
 
 
 def display_sidebar():
     display_sidebar_header()
     create_random_form()
     sb.markdown("---")
-    create_filter_form()
+    with sb:
+        create_filter_form()
     sb.markdown("---")
     create_vis_form()
     end()
@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils.database import DATABASE  # noqa: E402
+from utils.synthetic_data import SyntheticConfig, generate_database  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    """An empty database file bound to ``DATABASE``."""
+    DATABASE.init((tmp_path / "tmvis.db").as_posix())
+    with DATABASE.connection_context():
+        yield DATABASE
+
+
+@pytest.fixture(scope="session")
+def synthetic_path(tmp_path_factory) -> Path:
+    """A small synthetic database with statistics; tests must not modify it."""
+    path = tmp_path_factory.mktemp("synthetic") / "tmvis.db"
+    DATABASE.init(path.as_posix())
+    with DATABASE.connection_context():
+        generate_database(SyntheticConfig(sequences=5000, organisms=40))
+    return path
+
+
+@pytest.fixture
+def synthetic_database(synthetic_path):
+    """The synthetic database bound to ``DATABASE``."""
+    DATABASE.init(synthetic_path.as_posix())
+    with DATABASE.connection_context():
+        yield DATABASE
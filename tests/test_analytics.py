@@ -0,0 +1,129 @@
+import logging
+import shutil
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+from utils import database  # noqa: E402
+from utils.database import (  # noqa: E402
+    DATABASE,
+    SNAPSHOT_MANIFEST,
+    AnalyticsEngine,
+    DBFilter,
+    Domain,
+    NumericRange,
+    Organism,
+    ProteinRow,
+    RangeColumn,
+    SortKey,
+    TaxaSelectionCriterion,
+    TMInfo,
+    Topology,
+)
+from utils.lineage_definitions import get_kingdom_for_domain  # noqa: E402
+from utils.parquet_export import export_parquet  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def snapshot(synthetic_path, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("analytics") / "parquet"
+    DATABASE.init(synthetic_path.as_posix())
+    with DATABASE.connection_context():
+        export_parquet(directory, batch_size=1000)
+    return directory
+
+
+def sorted_filter(domain: Domain, **kwargs) -> DBFilter:
+    return DBFilter(
+        taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+        domain=domain,
+        kingdom=get_kingdom_for_domain(domain).ALL,
+        random_selection=False,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "db_filter",
+    [
+        sorted_filter(Domain.ALL, sort_key=SortKey.TM_HELIX_COUNT),
+        sorted_filter(
+            Domain.BACTERIA,
+            topology=Topology.ALPHA_HELIX,
+            sort_key=SortKey.SEQUENCE_LENGTH,
+            sort_descending=False,
+        ),
+        sorted_filter(
+            Domain.EUKARYOTA,
+            sequence_lengths=(100, 800),
+            ranges=(NumericRange(RangeColumn.TM_HELIX_COUNT, 20, 60),),
+            sort_key=SortKey.TM_HELIX_PERCENT,
+        ),
+        DBFilter(random_selection=False, sort_key=SortKey.SEQUENCE_LENGTH),
+    ],
+    ids=["all by helices", "alpha bacteria by length", "eukaryota ranges", "human"],
+)
+def test_snapshot_returns_the_rows_of_sqlite(synthetic_database, snapshot, db_filter):
+    engine = AnalyticsEngine(snapshot.as_posix())
+    assert engine.available
+
+    expected = list(database.get_sequence_data(db_filter).tuples())
+    sql, params = engine.filter_query(db_filter).sql()
+    rows = engine.cursor().execute(sql, params).fetchall()
+
+    assert expected
+    assert rows == expected
+
+
+def test_histogram_counts_the_proteins_of_sqlite(synthetic_database, snapshot):
+    engine = AnalyticsEngine(snapshot.as_posix())
+    query = (
+        TMInfo.select(Organism.clade, TMInfo.tm_helix_count)
+        .join_from(TMInfo, database.Sequence)
+        .join(Organism)
+        .where(Organism.super_kingdom == "Bacteria")
+    )
+    expected = Counter(
+        (clade, helix_residues // 20 * 20) for clade, helix_residues in query.tuples()
+    )
+
+    sql, params = engine.histogram(
+        ProteinRow.tm_helix_count,
+        20,
+        ProteinRow.clade,
+        where=ProteinRow.super_kingdom == "Bacteria",
+    ).sql()
+    rows = engine.cursor().execute(sql, params).fetchall()
+
+    assert {(clade, bucket): count for clade, bucket, count in rows} == expected
+
+
+def test_snapshot_of_another_build_is_rejected(synthetic_path, tmp_path, caplog):
+    path = tmp_path / "tmvis.db"
+    shutil.copy(synthetic_path, path)
+    DATABASE.init(path.as_posix())
+    with DATABASE.connection_context():
+        export_parquet(tmp_path / "parquet")
+        engine = AnalyticsEngine((tmp_path / "parquet").as_posix())
+        assert engine.available
+
+        database.renew_build_id()
+
+        with caplog.at_level(logging.WARNING):
+            assert not engine.available
+        assert "export it again" in caplog.text
+
+
+def test_snapshot_without_manifest_is_rejected(
+    synthetic_database, snapshot, tmp_path, caplog
+):
+    directory = tmp_path / "parquet"
+    shutil.copytree(snapshot, directory)
+    (directory / SNAPSHOT_MANIFEST).unlink()
+
+    with caplog.at_level(logging.WARNING):
+        assert not AnalyticsEngine(directory.as_posix()).available
+    assert "No manifest" in caplog.text
@@ -0,0 +1,46 @@
+import datetime
+
+from utils import annotation_import, tmvis_import
+from utils.database import Annotation, Organism, Sequence
+from utils.membrane_annotation import AnnotationSource
+
+
+def flat_entry(accession: str, *transmem: tuple[int, int]) -> str:
+    features = "".join(
+        f'FT   TRANSMEM        {start}..{end}\nFT                   /note="Helical"\n'
+        for start, end in transmem
+    )
+    return (
+        f"ID   {accession}_HUMAN    Reviewed;         100 AA.\n"
+        f"AC   {accession};\n{features}//\n"
+    )
+
+
+def test_reimport_removes_deleted_features(database, tmp_path):
+    tmvis_import.create_tables()
+    human = Organism.create(
+        taxon_id="9606", name="Homo sapiens", super_kingdom="Eukaryota", clade="Metazoa"
+    )
+    for accession in ["P00001", "P00002"]:
+        Sequence.create(
+            uniprot_id=f"{accession}_HUMAN",
+            uniprot_accession=accession,
+            organism=human,
+            sequence="M" * 100,
+            seq_length=100,
+        )
+    dump = tmp_path / "uniprot.dat"
+    dump.write_text(flat_entry("P00001", (10, 30)) + flat_entry("P00002", (40, 60)))
+    annotation_import.import_uniprot(dump, "flat")
+
+    # P00001 lost its transmembrane feature in the next UniProt release
+    dump.write_text(flat_entry("P00001") + flat_entry("P00002", (45, 65)))
+    num_sequences, num_annotations = annotation_import.import_uniprot(
+        dump, "flat", date_added=datetime.date(2024, 7, 1)
+    )
+
+    assert (num_sequences, num_annotations) == (2, 1)
+    rows = Annotation.select(
+        Annotation.source_db_ref, Annotation.start, Annotation.end
+    ).where(Annotation.source_db == AnnotationSource.UNIPROT.value)
+    assert list(rows.tuples()) == [("P00002", 45, 65)]
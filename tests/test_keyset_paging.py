@@ -0,0 +1,53 @@
+from dataclasses import replace
+
+import pytest
+
+from utils import database
+from utils.database import SORT_COLUMNS, DBFilter, SortKey, TaxaSelectionCriterion
+
+PAGE_SIZE = 100
+
+
+def sorted_filter(sort_key: SortKey, descending: bool, **kwargs) -> DBFilter:
+    return DBFilter(
+        taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+        random_selection=False,
+        sort_key=sort_key,
+        sort_descending=descending,
+        num_sequences=PAGE_SIZE,
+        **kwargs,
+    )
+
+
+def query_rows(db_filter: DBFilter) -> list[dict]:
+    return list(database.get_sequence_data(db_filter).dicts())
+
+
+# TM helix counts have many ties, which the sequence id breaks
+@pytest.mark.parametrize("sort_key", [SortKey.TM_HELIX_COUNT, SortKey.SEQUENCE_LENGTH])
+@pytest.mark.parametrize("descending", [True, False])
+def test_pages_continue_the_sorted_order(synthetic_database, sort_key, descending):
+    db_filter = sorted_filter(sort_key, descending)
+    column = SORT_COLUMNS[sort_key].column_name
+    expected = [
+        row["id"] for row in query_rows(replace(db_filter, num_sequences=3 * PAGE_SIZE))
+    ]
+
+    paged = []
+    for _ in range(3):
+        rows = query_rows(db_filter)
+        paged += [row["id"] for row in rows]
+        db_filter = db_filter.next_page(rows[-1][column], rows[-1]["id"])
+
+    assert paged == expected
+    assert len(set(paged)) == 3 * PAGE_SIZE
+
+
+def test_last_page_is_short(synthetic_database):
+    db_filter = sorted_filter(SortKey.SEQUENCE_LENGTH, True)
+    rows = query_rows(replace(db_filter, num_sequences=10**6))
+    last = rows[-PAGE_SIZE // 2 - 1]
+
+    page = query_rows(db_filter.next_page(last["seq_length"], last["id"]))
+
+    assert [row["id"] for row in page] == [row["id"] for row in rows[-PAGE_SIZE // 2 :]]
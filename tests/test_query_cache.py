@@ -0,0 +1,49 @@
+from dataclasses import replace
+
+import pandas as pd
+
+from utils.database import DBFilter, SortKey, TaxaSelectionCriterion
+from utils.query_cache import QUERY_CACHE, QueryCache, frame_size, get_sequence_frame
+
+
+def frame(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({"id": range(rows)})
+
+
+def test_least_recently_used_results_are_evicted():
+    size = frame_size(frame(100))
+    cache = QueryCache(max_bytes=2 * size)
+    cache.put("a", frame(100))
+    cache.put("b", frame(100))
+    cache.get("a")
+
+    cache.put("c", frame(100))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats().evictions == 1
+
+
+def test_changed_database_drops_results():
+    cache = QueryCache(max_bytes=2**20)
+    cache.check_version(1)
+    cache.put("a", frame(10))
+
+    cache.check_version(1)
+    assert cache.get("a") is not None
+    cache.check_version(2)
+    assert cache.get("a") is None
+    assert cache.stats().invalidations == 1
+
+
+def test_equal_filters_share_one_result(synthetic_database):
+    db_filter = DBFilter(
+        taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+        random_selection=False,
+        sort_key=SortKey.SEQUENCE_LENGTH,
+    )
+    first = get_sequence_frame(db_filter)
+
+    # The organism is ignored when selecting by domain
+    assert get_sequence_frame(replace(db_filter, organism_id=10090)) is first
+    assert QUERY_CACHE.get(db_filter.cache_key()) is first
@@ -0,0 +1,78 @@
+import sqlite3
+import time
+
+import pytest
+from peewee import OperationalError
+
+from utils.database import DATABASE
+from utils.query_executor import QueryExecutor
+
+COUNT_SQL = (
+    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < ?) "
+    "SELECT x FROM n"
+)
+
+
+class RawQuery:
+    def __init__(self, sql: str, *params):
+        self._sql = sql
+        self._params = list(params)
+
+    def sql(self):
+        return self._sql, self._params
+
+
+@pytest.fixture
+def executor(database):
+    executor = QueryExecutor(1)
+    yield executor
+    executor.close()
+
+
+def worker_connection_closed(executor: QueryExecutor) -> bool:
+    return executor._pool.submit(DATABASE.is_closed).result()
+
+
+def test_query_within_budget(executor):
+    result = executor.run(RawQuery(COUNT_SQL, 1000))
+    assert not result.narrowed
+    assert len(result.rows) == 1000
+
+
+def test_query_narrowed_by_step_budget(executor):
+    result = executor.run(RawQuery(COUNT_SQL, 10**8), step_budget=100000)
+    assert result.narrowed
+    assert len(result.rows) < 10**8
+
+
+def test_shard_is_attached_for_one_query(executor, tmp_path):
+    shard = tmp_path / "shard.db"
+    with sqlite3.connect(shard) as connection:
+        connection.execute("CREATE TABLE protein (name TEXT)")
+        connection.execute("INSERT INTO protein VALUES ('Q9NVH1')")
+
+    result = executor.run(RawQuery("SELECT name FROM protein"), shard=shard.as_posix())
+    assert result.rows == [("Q9NVH1",)]
+    databases = executor.run(RawQuery("SELECT name FROM pragma_database_list"))
+    assert ("shard",) not in databases.rows
+
+
+def test_connection_is_kept_between_queries(executor):
+    executor.run(RawQuery(COUNT_SQL, 1))
+    assert not worker_connection_closed(executor)
+
+
+def test_connection_closed_on_error(executor):
+    with pytest.raises(OperationalError):
+        executor.run(RawQuery("SELECT * FROM missing_table"))
+    assert worker_connection_closed(executor)
+    assert executor.run(RawQuery(COUNT_SQL, 3)).rows == [(1,), (2,), (3,)]
+
+
+def test_query_waiting_too_long_is_busy(executor):
+    # Occupies the only worker
+    executor._pool.submit(time.sleep, 0.3)
+    result = executor.run(RawQuery(COUNT_SQL, 1), timeout=0.1)
+    assert result.busy
+    assert not result.narrowed
+    assert executor.stats().busy == 1
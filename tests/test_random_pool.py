@@ -0,0 +1,84 @@
+import datetime
+import time
+
+import pytest
+
+from utils import tmvis_import
+from utils.database import DBFilter, Organism, Sequence, TMInfo
+from utils.random_pool import RandomSelectionPool
+
+PAGE_SIZE = 5
+
+
+def add_protein(organism: Organism, accession: str):
+    sequence = Sequence.create(
+        uniprot_id=f"{accession}_TEST",
+        uniprot_accession=accession,
+        organism=organism,
+        sequence="M" * 100,
+        seq_length=100,
+    )
+    TMInfo.create(
+        sequence=sequence,
+        tm_helix_count=1,
+        tm_helix_percent=20.0,
+        tm_strand_count=0,
+        tm_strand_percent=0.0,
+        signal_count=0,
+        signal_percent=0.0,
+        generated_at=datetime.date(2024, 1, 1),
+        has_alpha_helix=True,
+        has_beta_strand=False,
+        has_signal=False,
+    )
+
+
+@pytest.fixture
+def human(database):
+    tmvis_import.create_tables()
+    human = Organism.create(
+        taxon_id="9606", name="Homo sapiens", super_kingdom="Eukaryota", clade="Metazoa"
+    )
+    for i in range(20):
+        add_protein(human, f"P{i:05}")
+    return human
+
+
+@pytest.fixture
+def pool(human):
+    pool = RandomSelectionPool(page_size=PAGE_SIZE, pool_size=2).start()
+    yield pool
+    pool.stop()
+
+
+def wait_for_fresh_pages(pool: RandomSelectionPool, pages: int):
+    deadline = time.monotonic() + 10
+    while pool.stats().fresh < pages:
+        assert time.monotonic() < deadline, "the pool was not refilled"
+        time.sleep(0.01)
+
+
+def test_pool_serves_fresh_pages_then_refills(pool):
+    wait_for_fresh_pages(pool, 2)
+
+    page = pool.take(DBFilter(num_sequences=PAGE_SIZE))
+
+    assert len(page) == PAGE_SIZE
+    assert pool.stats().served == 1
+    wait_for_fresh_pages(pool, 2)
+    assert pool.stats().generated == 3
+
+
+def test_pool_drops_pages_of_changed_database(database, pool, human):
+    wait_for_fresh_pages(pool, 2)
+    pool.take(DBFilter(num_sequences=PAGE_SIZE))
+
+    # Grows the file, a new version even within the resolution of its mtime
+    with database.atomic():
+        for i in range(100):
+            add_protein(human, f"Q{i:05}")
+    page = pool.take(DBFilter(num_sequences=PAGE_SIZE))
+
+    stats = pool.stats()
+    assert (stats.served, stats.reused, stats.cold) == (1, 0, 1)
+    assert len(page) == PAGE_SIZE
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+
+from utils import db_layout
+from utils.database import (
+    DATABASE,
+    SHARD_ROUTER,
+    DBFilter,
+    Domain,
+    Organism,
+    Sequence,
+    SortKey,
+    TaxaSelectionCriterion,
+    get_sequence_data_for_id,
+)
+from utils.lineage_definitions import get_kingdom_for_domain
+from utils.query_cache import get_sequence_frame
+
+
+@pytest.fixture(scope="module")
+def catalog_path(synthetic_path, tmp_path_factory) -> Path:
+    directory = tmp_path_factory.mktemp("shards")
+    db_layout.split_database(synthetic_path, directory)
+    return directory / db_layout.CATALOG_NAME
+
+
+@pytest.fixture
+def catalog(catalog_path):
+    DATABASE.init(catalog_path.as_posix())
+    with DATABASE.connection_context():
+        yield DATABASE
+
+
+def accessions(path: Path, db_filter: DBFilter) -> list[str]:
+    DATABASE.init(path.as_posix())
+    with DATABASE.connection_context():
+        return list(get_sequence_frame(db_filter)["UniProt Accession"])
+
+
+def domain_filter(domain: Domain, **kwargs) -> DBFilter:
+    return DBFilter(
+        taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+        domain=domain,
+        kingdom=get_kingdom_for_domain(domain).ALL,
+        random_selection=False,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize(
+    "db_filter",
+    [
+        domain_filter(Domain.ALL, sort_key=SortKey.TM_HELIX_COUNT),
+        domain_filter(Domain.ALL, sort_key=SortKey.SEQUENCE_LENGTH, num_sequences=50),
+        domain_filter(
+            Domain.BACTERIA, sort_key=SortKey.SEQUENCE_LENGTH, sort_descending=False
+        ),
+        DBFilter(random_selection=False, sort_key=SortKey.TM_HELIX_PERCENT),
+    ],
+    ids=["all by helices", "first 50 by length", "bacteria by length", "human"],
+)
+def test_sorted_results_match_unsharded(synthetic_path, catalog_path, db_filter):
+    expected = accessions(synthetic_path, db_filter)
+
+    assert expected
+    assert accessions(catalog_path, db_filter) == expected
+
+
+def test_filters_are_routed_to_their_shards(catalog):
+    paths = {
+        super_kingdom: SHARD_ROUTER.path(shard)
+        for super_kingdom, shard in SHARD_ROUTER.shards().items()
+    }
+
+    assert SHARD_ROUTER.paths_for(domain_filter(Domain.ARCHAEA)) == [paths["Archaea"]]
+    assert SHARD_ROUTER.paths_for(DBFilter(random_selection=False)) == [
+        paths["Eukaryota"]
+    ]
+    assert sorted(SHARD_ROUTER.paths_for(DBFilter())) == sorted(paths.values())
+    assert sorted(SHARD_ROUTER.paths_for(domain_filter(Domain.ALL))) == sorted(
+        paths.values()
+    )
+
+
+def test_protein_details_are_read_from_their_shard(synthetic_path, catalog_path):
+    DATABASE.init(synthetic_path.as_posix())
+    with DATABASE.connection_context():
+        proteins = {
+            super_kingdom: accession
+            for super_kingdom, accession in Sequence.select(
+                Organism.super_kingdom, Sequence.uniprot_accession
+            )
+            .join(Organism)
+            .tuples()
+        }
+
+    DATABASE.init(catalog_path.as_posix())
+    with DATABASE.connection_context():
+        assert set(proteins) == set(SHARD_ROUTER.shards())
+        for accession in proteins.values():
+            with SHARD_ROUTER.protein_shard(accession):
+                protein = get_sequence_data_for_id(accession)
+            assert protein["uniprot_accession"] == accession
@@ -0,0 +1,59 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+
+def run_concurrently(flight: SingleFlight, function, callers: int = 2) -> list:
+    """Calls ``function`` through the flight from several threads at once."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait(5)
+        return function()
+
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(flight.do, "key", leader)]
+        started.wait(5)
+        futures += [pool.submit(flight.do, "key", function) for _ in range(callers - 1)]
+        while flight.stats().collapsed < callers - 1:
+            time.sleep(0.001)
+        release.set()
+        return [future.exception() or future.result() for future in futures]
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight("test")
+
+    results = run_concurrently(flight, object, callers=3)
+
+    assert results[0] is results[1] is results[2]
+    stats = flight.stats()
+    assert (stats.executed, stats.collapsed, stats.in_flight) == (1, 2, 0)
+
+
+def test_concurrent_calls_share_the_exception():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("upstream down")
+
+    errors = run_concurrently(flight, fail)
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.stats().executed == 1
+
+
+def test_later_calls_run_again():
+    flight = SingleFlight("test")
+
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    with pytest.raises(KeyError):
+        flight.do("key", dict().__getitem__, "missing")
+    assert flight.stats().executed == 3
@@ -0,0 +1,52 @@
+import datetime
+
+from utils import statistics, tmvis_import
+from utils.database import DATABASE, Organism, Sequence, TMInfo
+
+
+def add_protein(organism: Organism, accession: str, tm_helix_count: int):
+    sequence = Sequence.create(
+        uniprot_id=f"{accession}_TEST",
+        uniprot_accession=accession,
+        organism=organism,
+        sequence="M" * 100,
+        seq_length=100,
+    )
+    TMInfo.create(
+        sequence=sequence,
+        tm_helix_count=tm_helix_count,
+        tm_helix_percent=tm_helix_count,
+        tm_strand_count=0,
+        tm_strand_percent=0.0,
+        signal_count=0,
+        signal_percent=0.0,
+        generated_at=datetime.date(2024, 1, 1),
+        has_alpha_helix=tm_helix_count > 0,
+        has_beta_strand=False,
+        has_signal=False,
+    )
+
+
+def test_overview_counts_organisms_without_clade(database):
+    tmvis_import.create_tables()
+    # Table of an earlier version, which required a clade
+    DATABASE.execute_sql(
+        "CREATE TABLE lineagetopologycount (id INTEGER PRIMARY KEY, "
+        "super_kingdom VARCHAR NOT NULL, clade VARCHAR NOT NULL, "
+        "topology INTEGER NOT NULL, proteins INTEGER NOT NULL)"
+    )
+    human = Organism.create(
+        taxon_id="9606", name="Homo sapiens", super_kingdom="Eukaryota", clade="Metazoa"
+    )
+    archaeon = Organism.create(
+        taxon_id="2157", name="Archaeon", super_kingdom="Archaea", clade=None
+    )
+    add_protein(human, "P00001", 20)
+    add_protein(archaeon, "P00002", 40)
+    add_protein(archaeon, "P00003", 0)
+
+    statistics.build_overview()
+
+    rows = statistics.load_lineage_topology()
+    assert sum(proteins for *_, proteins in rows) == 3
+    assert sum(proteins for _, clade, _, proteins in rows if clade is None) == 2
@@ -0,0 +1,155 @@
+import json
+
+from utils import tmvis_import
+from utils.database import Annotation, ImportCheckpoint, ImportedChunk, Sequence, TMInfo
+
+
+def export_line(accession: str, run_on: str, chunk: int, predictions: str) -> str:
+    return json.dumps(
+        {
+            "organism_id": 9606,
+            "organism_name": "Homo sapiens",
+            "uptaxonomy": {"Domain": "Eukaryota", "Kingdom": "Metazoa"},
+            "uniprot_id": f"{accession}_HUMAN",
+            "uniprot_accession": accession,
+            "sequence": "M" * len(predictions),
+            "seq_length": len(predictions),
+            "run_on": {"$date": f"{run_on}T00:00:00.000Z"},
+            "chunk": chunk,
+            "predictions": {"transmembrane": predictions},
+            "annotations": {
+                "tm_categorical": [1, 0, 0],
+                "tm_helix_count": predictions.count("H"),
+                "tm_helix_percent": 50.0,
+                "tm_strand_count": 0,
+                "tm_strand_percent": 0.0,
+                "signal_count": 0,
+                "signal_percent": 0.0,
+            },
+        }
+    )
+
+
+def write_export(path, lines: list[str]):
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return path
+
+
+def test_update_with_protein_twice_before_commit(database, tmp_path):
+    export = write_export(
+        tmp_path / "export.json",
+        [
+            export_line("P12345", "2024-06-01", 1, "iiHHHHoo"),
+            export_line("P12345", "2024-07-01", 2, "iiiHHHHHoo"),
+        ],
+    )
+
+    stats, _ = tmvis_import.update_database(export, lookup_taxa=False)
+
+    assert Sequence.select().count() == 1
+    assert Sequence.get().seq_length == 10
+    assert [str(tm_info.generated_at) for tm_info in TMInfo.select()] == ["2024-07-01"]
+    assert Annotation.select().count() == 3
+    assert (stats.sequences, stats.updated) == (1, 1)
+    assert ImportCheckpoint.get().completed
+
+
+def test_update_keeps_latest_prediction(database, tmp_path):
+    export = write_export(
+        tmp_path / "export.json",
+        [
+            export_line("P12345", "2024-07-01", 2, "iiiHHHHHoo"),
+            export_line("P12345", "2024-06-01", 1, "iiHHHHoo"),
+        ],
+    )
+
+    stats, _ = tmvis_import.update_database(export, lookup_taxa=False)
+
+    assert Sequence.get().seq_length == 10
+    assert stats.unchanged == 1
+
+
+def test_build_records_chunks(database, tmp_path):
+    export = write_export(
+        tmp_path / "export.json",
+        [
+            export_line("P12345", "2024-06-01", 1, "iiHHHHoo"),
+            export_line("Q12345", "2024-06-01", 1, "oooo"),
+            export_line("A0A000", "2024-07-01", 2, "iHHo"),
+        ],
+    )
+
+    tmvis_import.build_database(export, lookup_taxa=False)
+
+    chunks = ImportedChunk.select().order_by(ImportedChunk.chunk)
+    assert [(c.chunk, str(c.run_on), c.sequences) for c in chunks] == [
+        (1, "2024-06-01", 2),
+        (2, "2024-07-01", 1),
+    ]
+    checkpoint = ImportCheckpoint.get()
+    assert (checkpoint.lines, checkpoint.completed) == (3, True)
+
+
+def test_build_counts_only_written_predictions(database, tmp_path):
+    export = write_export(
+        tmp_path / "export.json",
+        [
+            export_line("P12345", "2024-06-01", 1, "iiHHHHoo"),
+            export_line("P12345", "2024-07-01", 2, "iiiHHHHHoo"),
+        ],
+    )
+
+    tmvis_import.build_database(export, lookup_taxa=False)
+
+    chunks = ImportedChunk.select()
+    assert [(c.chunk, str(c.run_on), c.sequences) for c in chunks] == [
+        (2, "2024-07-01", 1)
+    ]
+
+
+def test_update_replaces_prediction_of_same_run(database, tmp_path):
+    tmvis_import.update_database(
+        write_export(
+            tmp_path / "june.json", [export_line("P12345", "2024-06-01", 1, "iiHHHHoo")]
+        ),
+        lookup_taxa=False,
+    )
+
+    stats, _ = tmvis_import.update_database(
+        write_export(
+            tmp_path / "rerun.json",
+            [export_line("P12345", "2024-06-01", 1, "iHHHHHoo")],
+        ),
+        lookup_taxa=False,
+    )
+
+    assert (stats.updated, stats.unchanged) == (1, 0)
+    assert [
+        (a.start, a.end, a.label)
+        for a in Annotation.select().order_by(Annotation.start)
+    ] == [(1, 1, "i"), (2, 6, "H"), (7, 8, "o")]
+
+
+def test_update_skips_unchanged_prediction(database, tmp_path):
+    line = export_line("P12345", "2024-06-01", 1, "iiHHHHoo")
+    tmvis_import.update_database(
+        write_export(tmp_path / "june.json", [line]), lookup_taxa=False
+    )
+
+    stats, _ = tmvis_import.update_database(
+        write_export(tmp_path / "again.json", [line]), lookup_taxa=False
+    )
+
+    assert (stats.updated, stats.unchanged) == (0, 1)
+
+
+def test_new_export_with_same_name_and_size_is_imported(database, tmp_path):
+    export = tmp_path / "export.json"
+    write_export(export, [export_line("P12345", "2024-06-01", 1, "iiHHHHoo")])
+    tmvis_import.update_database(export, lookup_taxa=False)
+
+    write_export(export, [export_line("Q12345", "2024-06-01", 1, "iiHHHHoo")])
+    stats, _ = tmvis_import.update_database(export, lookup_taxa=False)
+
+    assert stats.sequences == 1
+    assert Sequence.select().count() == 2
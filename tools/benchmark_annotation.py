@@ -0,0 +1,168 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Microbenchmark of the membrane annotation engine on long proteins.
+
+Compares the columnar (NumPy) implementation in utils.membrane_annotation with
+the former per-residue list implementation for building the annotation table,
+the 3Dmol coloring (per-residue color map vs. range styles) and per-label
+residue counts.
+
+Example:
+    python tools/benchmark_annotation.py --length 5500 --repeat 50
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import membrane_annotation  # noqa: E402
+from utils import protein_visualization  # noqa: E402
+from utils.membrane_annotation import (  # noqa: E402
+    DISPLAY_NAMES,
+    AnnotationSource,
+    MembraneAnnotation,
+    ResidueAnnotation,
+)
+
+
+def random_topology(length: int, labels: str, min_run: int, max_run: int):
+    annotations, position = [], 1
+    while position <= length:
+        end = min(position + random.randint(min_run, max_run) - 1, length)
+        annotations.append(ResidueAnnotation(position, end, random.choice(labels)))
+        position = end + 1
+    return annotations
+
+
+def random_segments(length: int, label: str, count: int):
+    starts = sorted(random.sample(range(1, length - 30), count))
+    return [
+        ResidueAnnotation(start, start + 20, label)
+        for start, next_start in zip(starts, starts[1:] + [length])
+        if start + 20 < next_start
+    ]
+
+
+def example_protein(length: int):
+    sequence = "".join(random.choices("ACDEFGHIKLMNPQRSTVWY", k=length))
+    sources = {
+        AnnotationSource.TMBED: random_topology(length, "HhBbioS", 5, 40),
+        AnnotationSource.TOPDB: random_topology(length, "IOM", 10, 80),
+        AnnotationSource.UNIPROT: random_segments(length, "AH", 40),
+        AnnotationSource.TMALPHAFOLD: random_segments(length, "AH", 35),
+        AnnotationSource.MEMBRANOME: random_segments(length, "AH", 2),
+    }
+    return sequence, sources
+
+
+# Former list-based implementation, kept for comparison
+def legacy_vector(annotations, sequence_length):
+    annotation_vector = ["*"] * sequence_length
+    for annotation in annotations:
+        for i in range(annotation.start - 1, annotation.end):
+            annotation_vector[i] = annotation.label
+    return annotation_vector
+
+
+def legacy_table(sources, sequence):
+    return pd.DataFrame(
+        zip(
+            list(sequence),
+            *[legacy_vector(sources[source], len(sequence)) for source in sources],
+        ),
+        columns=["Sequence"] + [DISPLAY_NAMES[source] for source in sources],
+    )
+
+
+def legacy_colors(annotations):
+    atom_color = {}
+    for annotation in annotations:
+        color = "".join(
+            protein_visualization.TOPOLOGY_COLORS.get(
+                annotation.label, protein_visualization.ColorCode.OUTSIDE.value
+            ).split()
+        )
+        for i in range(annotation.start - 1, annotation.end):
+            atom_color[i] = color
+    return atom_color
+
+
+def legacy_counts(annotations):
+    counts = {}
+    for label in legacy_vector(annotations, annotations[-1].end):
+        counts[label] = counts.get(label, 0) + 1
+    return counts
+
+
+def columnar(sources):
+    annotation = MembraneAnnotation()
+    annotation.update_annotations(sources)
+    return annotation
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--length", type=int, default=5500)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sequence, sources = example_protein(args.length)
+    annotation = columnar(sources)
+    tmbed = sources[AnnotationSource.TMBED]
+
+    print(
+        f"{args.length} residues, "
+        + ", ".join(f"{DISPLAY_NAMES[s]}: {len(a)} segments" for s, a in sources.items())
+    )
+    benchmarks = [
+        (
+            "annotation table",
+            lambda: legacy_table(sources, sequence),
+            lambda: membrane_annotation.construct_df_from_annotation(
+                annotation, sequence
+            ),
+        ),
+        (
+            "3Dmol coloring",
+            lambda: legacy_colors(tmbed),
+            lambda: protein_visualization.annotation_layer_styles(
+                annotation,
+                (AnnotationSource.TMBED,),
+                protein_visualization.ProteinStyle.CARTOON,
+            ),
+        ),
+        (
+            "residue counts",
+            lambda: legacy_counts(tmbed),
+            lambda: annotation.residue_counts(AnnotationSource.TMBED),
+        ),
+    ]
+
+    print(f"segment arrays built in {measure(lambda: columnar(sources), args.repeat):.3f} ms")
+    print(f"{'operation':<20}{'lists [ms]':>12}{'columnar [ms]':>16}{'speedup':>10}")
+    for name, legacy, vectorized in benchmarks:
+        legacy_ms = measure(legacy, args.repeat)
+        vectorized_ms = measure(vectorized, args.repeat)
+        speedup = legacy_ms / vectorized_ms if vectorized_ms else float("inf")
+        print(f"{name:<20}{legacy_ms:>12.3f}{vectorized_ms:>16.3f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
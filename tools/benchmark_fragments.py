@@ -0,0 +1,122 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Compare the cost of an interaction with and without fragments.
+
+Before the app used st.fragment, every widget change reran the whole script.
+Now a change inside the filter form, the protein table or a viewer reruns
+only that fragment. AppTest always runs the whole script, so this script
+drives one session through these interactions with AppTest and compares the
+full reruns ("app rerun", the cost of any interaction without fragments)
+with the fragment bodies timed within them. The fragment numbers are an
+estimate, not a measured fragment rerun: they leave out the work Streamlit
+does around a fragment rerun (session handling, widget state, sending the
+deltas), and the body may run warmer inside a full rerun than on its own.
+Protein details come from utils.upstream_stub.
+
+Example:
+    python tools/benchmark_fragments.py --db data/synthetic.db --rounds 20
+"""
+
+import argparse
+import logging
+import random
+import sys
+from pathlib import Path
+
+SRC = (Path(__file__).parent / "../src").resolve()
+sys.path.append(SRC.as_posix())
+from utils import timing, upstream_stub  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+from utils.lineage_definitions import TaxaSelectionCriterion  # noqa: E402
+from utils.protein_visualization import ColorScheme, ProteinStyle  # noqa: E402
+from utils.upstream_stub import UpstreamStub  # noqa: E402
+
+APP = SRC / "streamlitapp.py"
+FRAGMENTS = [
+    "fragment filter form",
+    "fragment protein table",
+    "fragment database viewer",
+    "fragment visualization tab",
+]
+
+
+def button(at, label: str):
+    return next(button for button in at.button if button.label == label)
+
+
+def interact(at, rng: random.Random):
+    """One round: a random selection, a filter edit, a protein and a viewer."""
+    button(at, "Show random selection").click().run()
+    at.radio(key="taxonomy_selection").set_value(
+        rng.choice(list(TaxaSelectionCriterion))
+    ).run()
+
+    data = at.session_state["data"]
+    choose = next(
+        selectbox
+        for selectbox in at.selectbox
+        if selectbox.label.startswith("Choose an ID")
+    )
+    choose.set_value(rng.choice(list(data["UniProt ID"]))).run()
+
+    at.text_input(key="visualization_id").input(
+        rng.choice(list(data["UniProt Accession"]))
+    )
+    at.selectbox(key="visualization_style").set_value(rng.choice(list(ProteinStyle)))
+    at.selectbox(key="color_scheme").set_value(rng.choice(list(ColorScheme)))
+    button(at, "Visualize Protein").click().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/synthetic.db"))
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+
+    import streamlit.config
+    import streamlit.logger
+    from streamlit.testing.v1 import AppTest
+
+    # AppTest runs without a Streamlit server, which Streamlit warns about.
+    # Parsing the config first keeps it from resetting the log level later.
+    streamlit.config.get_option("logger.level")
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    rng = random.Random(args.seed)
+    DATABASE.init(args.db.resolve().as_posix())
+    behaviors = upstream_stub.service_behaviors([], [], 0.0)
+    with UpstreamStub(
+        {}, behaviors, seed=args.seed, fallback=upstream_stub.database_response
+    ) as stub:
+        stub.patch_api()
+        at = AppTest.from_file(APP.as_posix(), default_timeout=120)
+        # Warm up the caches and the imports, then measure
+        at.run()
+        interact(at, rng)
+        timing.reset()
+        for _ in range(args.rounds):
+            interact(at, rng)
+
+    summary = timing.summary()
+    print(f"{'':<44}{'runs':>6}{'p50 [ms]':>11}{'p95 [ms]':>11}")
+    rerun = summary["app rerun"]
+    print(
+        f"{'full rerun (any interaction, no fragments)':<44}"
+        f"{rerun['count']:>6}{rerun['p50']:>11.1f}{rerun['p95']:>11.1f}"
+    )
+    for name in FRAGMENTS:
+        if name in summary:
+            s = summary[name]
+            label = f"{name} (estimate)"
+            print(f"{label:<44}{s['count']:>6}{s['p50']:>11.1f}{s['p95']:>11.1f}")
+    print(
+        "Fragment rows time the fragment bodies within full AppTest reruns, "
+        "without Streamlit's own fragment rerun overhead."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Benchmark the protein detail page against a local stub of its upstream APIs.
+
+ProteinInfo.collect_for_id requests UniProt, TmAlphaFold and AlphaFold DB.
+Here these requests go to utils.upstream_stub, which replays recorded
+responses (--recordings) or responses built from the database, with
+configurable delays and errors, so no network is needed. Reports
+
+- latency of the page and of each stage for proteins fetched one by one,
+- throughput and latency with concurrent sessions (--concurrency),
+- the protein cache of the app on a Zipf distributed trace of page views:
+  hit rate, upstream requests per view and latency of hits and misses.
+
+Recorded proteins must be in --db, e.g. record with the production database.
+
+Example:
+    python tools/benchmark_protein_detail.py --db data/synthetic.db
+    python tools/benchmark_protein_detail.py --db data/synthetic.db \
+        --delay uniprot=0.5 --error-rate tmalphafold=0.1 --concurrency 1,8,32
+    python tools/benchmark_protein_detail.py --db data/tmvis.db \
+        --record data/recordings --proteins 20
+"""
+
+import argparse
+import json
+import logging
+import random
+import statistics as stats
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from peewee import fn
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import timing, upstream_stub  # noqa: E402
+from utils.database import DATABASE, Sequence  # noqa: E402
+from utils.protein_info import PROTEIN_INFO_FLIGHT, ProteinInfo  # noqa: E402
+from utils.upstream_stub import TYPICAL_DELAYS, UpstreamStub  # noqa: E402
+
+STAGES = [
+    "uniprot request",
+    "tmalphafold request",
+    "annotation query",
+    "sequence query",
+    "alphafold request",
+    "protein info",
+]
+
+
+@dataclass
+class Latency:
+    count: int
+    p50_ms: float
+    p95_ms: float
+
+    @classmethod
+    def of(cls, seconds: list[float]):
+        ms = [s * 1000 for s in seconds]
+        p95 = stats.quantiles(ms, n=20)[18] if len(ms) > 1 else ms[0]
+        return cls(len(ms), stats.median(ms), p95)
+
+    def __str__(self):
+        return f"{self.count:>6}{self.p50_ms:>11.1f}{self.p95_ms:>11.1f}"
+
+
+@dataclass
+class PhaseResult:
+    latency: Latency
+    seconds: float
+    upstream_requests: dict[str, int]
+    upstream_errors: dict[str, int]
+    # Pages without UniProt data or structure
+    incomplete: int
+    # Latency per stage of the page
+    stages: dict[str, dict] = field(default_factory=dict)
+    extra: dict = field(default_factory=dict)
+
+
+def sample_accessions(count: int, rng: random.Random) -> list[str]:
+    max_id = Sequence.select(fn.MAX(Sequence.id)).scalar() or 0
+    ids = rng.sample(range(1, max_id + 1), min(count, max_id))
+    query = Sequence.select(Sequence.uniprot_accession).where(Sequence.id.in_(ids))
+    return [accession for (accession,) in query.tuples()]
+
+
+def is_incomplete(protein_info: ProteinInfo) -> bool:
+    return (
+        bool(protein_info.failed_sources)
+        or protein_info.uniprot_name is None
+        or protein_info.structure is None
+    )
+
+
+def run_phase(stub: UpstreamStub, trace: list[str], workers: int, fetch):
+    """Fetches the accessions of the trace with ``workers`` threads."""
+    stub.reset_counts()
+    timing.reset()
+
+    def view(accession):
+        started = time.perf_counter()
+        protein_info = fetch(accession)
+        return time.perf_counter() - started, is_incomplete(protein_info)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        views = list(executor.map(view, trace))
+    seconds = time.perf_counter() - started
+    return PhaseResult(
+        latency=Latency.of([duration for duration, _ in views]),
+        seconds=seconds,
+        upstream_requests=dict(stub.requests),
+        upstream_errors=dict(stub.errors),
+        incomplete=sum(incomplete for _, incomplete in views),
+    )
+
+
+def print_phase(title: str, result: PhaseResult):
+    requests = sum(result.upstream_requests.values())
+    errors = sum(result.upstream_errors.values())
+    print(f"{title:<32}{result.latency}{result.latency.count / result.seconds:>10.1f}")
+    print(
+        f"{'':<4}{requests} upstream requests ({errors} failed), "
+        f"{result.incomplete} incomplete pages"
+        + "".join(f", {name} {value}" for name, value in result.extra.items())
+    )
+
+
+def cold_stages(stub: UpstreamStub, accessions: list[str]):
+    """Sequential page loads without caches, with the latency of each stage."""
+    result = run_phase(stub, accessions, 1, ProteinInfo.collect_for_id)
+    summary = timing.summary()
+    print(f"{'stage':<32}{'count':>6}{'p50 [ms]':>11}{'p95 [ms]':>11}")
+    for stage in STAGES:
+        if stage in summary:
+            s = summary[stage]
+            print(f"{stage:<32}{s['count']:>6}{s['p50']:>11.1f}{s['p95']:>11.1f}")
+    result.stages = {stage: summary[stage] for stage in STAGES if stage in summary}
+    return result
+
+
+def cache_trace(accessions: list[str], views: int, exponent: float, rng):
+    """Page views with Zipf distributed popularity of the proteins."""
+    weights = [1 / rank**exponent for rank in range(1, len(accessions) + 1)]
+    return rng.choices(accessions, weights=weights, k=views)
+
+
+def cached_views(stub: UpstreamStub, trace: list[str]):
+    """Replays the trace through the protein cache of the app."""
+    import streamlit.config
+    import streamlit.logger
+
+    # The cache runs without a Streamlit server, which Streamlit warns about.
+    # Parsing the config first keeps it from resetting the log level later.
+    streamlit.config.get_option("logger.level")
+    streamlit.logger.set_log_level(logging.ERROR)
+    from streamlitapp import cached_protein_info, collect_protein_info
+
+    cached_protein_info.clear()
+    hits, misses = [], []
+
+    def fetch(accession):
+        executed = PROTEIN_INFO_FLIGHT.stats().executed
+        started = time.perf_counter()
+        protein_info = collect_protein_info(accession)
+        duration = time.perf_counter() - started
+        hit = PROTEIN_INFO_FLIGHT.stats().executed == executed
+        (hits if hit else misses).append(duration)
+        return protein_info
+
+    result = run_phase(stub, trace, 1, fetch)
+    result.extra = {
+        "hit rate": round(len(hits) / len(trace), 3),
+        "upstream requests per view": round(
+            sum(result.upstream_requests.values()) / len(trace), 2
+        ),
+    }
+    for name, durations in (("hit", hits), ("miss", misses)):
+        if durations:
+            result.extra[f"{name} p50 [ms]"] = round(Latency.of(durations).p50_ms, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/synthetic.db"))
+    parser.add_argument("--proteins", type=int, default=50)
+    parser.add_argument(
+        "--recordings",
+        type=Path,
+        default=None,
+        help="Replay the responses in this directory instead of building them.",
+    )
+    parser.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        help="Save the real API responses of --proteins proteins here and exit.",
+    )
+    parser.add_argument(
+        "--delay",
+        action="append",
+        default=[],
+        metavar="SERVICE=SECONDS",
+        help=f"Response delay per service, defaults: {TYPICAL_DELAYS}.",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.5, help="Random extra share of the delay."
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        default=[],
+        metavar="SERVICE=SHARE",
+        help="Share of failed (503) responses per service.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,4,16",
+        help="Comma separated numbers of concurrent sessions.",
+    )
+    parser.add_argument(
+        "--views", type=int, default=500, help="Page views of the trace."
+    )
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", type=Path, default=None, help="Write the results.")
+    args = parser.parse_args()
+    # Failed upstream requests are counted instead of logged
+    logging.basicConfig(level=logging.CRITICAL)
+
+    rng = random.Random(args.seed)
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        if args.recordings is not None:
+            responses = upstream_stub.load_responses(args.recordings)
+            accessions = sorted(k.removesuffix(".json") for k in responses["uniprot"])
+        else:
+            accessions = sample_accessions(args.proteins, rng)
+            if args.record is not None:
+                upstream_stub.record_responses(accessions, args.record)
+                return
+            responses = upstream_stub.database_responses(accessions)
+
+    behaviors = upstream_stub.service_behaviors(
+        args.delay, args.error_rate, args.jitter
+    )
+
+    results = {}
+    with UpstreamStub(responses, behaviors, seed=args.seed) as stub:
+        stub.patch_api()
+        print(f"{len(accessions)} proteins, upstream stub at {stub.url}")
+
+        results["cold"] = cold_stages(stub, accessions)
+        print(
+            f"{'phase':<32}{'views':>6}{'p50 [ms]':>11}{'p95 [ms]':>11}{'views/s':>10}"
+        )
+        print_phase("cold, sequential", results["cold"])
+        for workers in map(int, args.concurrency.split(",")):
+            trace = [rng.choice(accessions) for _ in range(workers * 8)]
+            name = f"{workers} concurrent sessions"
+            results[name] = run_phase(stub, trace, workers, ProteinInfo.collect_for_id)
+            print_phase(name, results[name])
+
+        trace = cache_trace(accessions, args.views, args.zipf, rng)
+        results["cached"] = cached_views(stub, trace)
+        print_phase("app cache, Zipf trace", results["cached"])
+
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps({name: asdict(r) for name, r in results.items()}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Benchmark the database queries of the app.
+
+Runs a matrix of DBFilter settings (taxonomy, topology, sorting and length)
+plus range filters, paging, random selection and the protein detail lookups
+against a database, e.g. one written by tools/generate_synthetic_db.py.
+Reports the p50/p95 latency, the number of rows and the shape of the SQLite
+query plan of every case. With --baseline, the results are compared with an
+earlier --json output and the exit code is 1 if a case got slower or its
+plan worse (a new full table scan or temporary B-tree); with
+--timing-advisory, slower cases are only reported.
+
+CI runs the cases on a small synthetic database and fails on worse plans
+than those of tools/benchmark_baseline.json, see .github/workflows/checks.yml.
+Plans depend on the SQLite version, so to re-record the baseline after an
+intended plan change, download the query-benchmark artifact (benchmark.json)
+of the CI run and commit it as tools/benchmark_baseline.json.
+
+The cases time the statements of one database file, so benchmark the
+unsharded database or a single shard rather than the catalog of
+tools/split_database.py; tools/benchmark_sessions.py runs on a catalog.
+
+Example:
+    python tools/benchmark_queries.py --db data/synthetic.db --json before.json
+    python tools/benchmark_queries.py --db data/synthetic.db --baseline before.json
+    python tools/generate_synthetic_db.py --sequences 200000 --organisms 2000 \
+        --db data/ci.db
+    python tools/benchmark_queries.py --db data/ci.db --timing-advisory \
+        --baseline tools/benchmark_baseline.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import re
+import statistics as stats
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+
+from peewee import fn
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import database, statistics  # noqa: E402
+from utils.database import (  # noqa: E402
+    DATABASE,
+    DBFilter,
+    NumericRange,
+    Organism,
+    OrganismCount,
+    RangeColumn,
+    Sequence,
+    SortKey,
+)
+from utils.lineage_definitions import (  # noqa: E402
+    Domain,
+    TaxaSelectionCriterion,
+    Topology,
+    get_kingdom_for_domain,
+)
+
+TOPOLOGIES = {
+    "all": {"topology": Topology.ALL},
+    "alpha": {"topology": Topology.ALPHA_HELIX},
+    "beta": {"topology": Topology.BETA_STRAND},
+}
+SORTS = {
+    "unsorted": {"sort_key": SortKey.NONE},
+    "length asc": {"sort_key": SortKey.SEQUENCE_LENGTH, "sort_descending": False},
+    "helix desc": {"sort_key": SortKey.TM_HELIX_COUNT},
+}
+LENGTHS = {
+    "any length": {"sequence_lengths": (16, 5500)},
+    "100-300": {"sequence_lengths": (100, 300)},
+}
+RANGES = {
+    "selective range": (NumericRange(RangeColumn.TM_HELIX_COUNT, low=200),),
+    "unselective range": (NumericRange(RangeColumn.TM_HELIX_PERCENT, low=5),),
+}
+
+
+@dataclass
+class CaseResult:
+    rows: int
+    p50_ms: float
+    p95_ms: float
+    plan: list[str]
+
+
+class QueryLog(logging.Handler):
+    """Collects the SQL statements peewee logs while a case runs."""
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.statements: list[tuple[str, tuple]] = []
+
+    def emit(self, record):
+        if isinstance(record.msg, tuple):
+            self.statements.append(record.msg)
+
+
+def domain_filter(domain: Domain, **kwargs) -> DBFilter:
+    return DBFilter(
+        taxonomy_selection=TaxaSelectionCriterion.DOMAIN,
+        domain=domain,
+        kingdom=get_kingdom_for_domain(domain).ALL,
+        **kwargs,
+    )
+
+
+def taxonomies() -> dict[str, DBFilter]:
+    """The largest and a median organism, a large and a small domain and all."""
+    counts = list(
+        OrganismCount.select(OrganismCount.organism, OrganismCount.count)
+        .order_by(OrganismCount.count.desc())
+        .tuples()
+    )
+    if not counts:
+        raise ValueError("The database has no statistics, run build_statistics.py")
+    organism_ids = {
+        "largest organism": counts[0][0],
+        "median organism": counts[len(counts) // 2][0],
+    }
+    filters = {
+        name: DBFilter(organism_id=int(Organism.get_by_id(organism_id).taxon_id))
+        for name, organism_id in organism_ids.items()
+    }
+    filters["Bacteria"] = domain_filter(Domain.BACTERIA)
+    filters["Archaea"] = domain_filter(Domain.ARCHAEA)
+    filters["all"] = domain_filter(Domain.ALL)
+    return filters
+
+
+def filter_cases() -> dict[str, DBFilter]:
+    cases = {}
+    taxonomy_filters = taxonomies()
+    for (taxonomy, base), topology, sort, length in itertools.product(
+        taxonomy_filters.items(), TOPOLOGIES, SORTS, LENGTHS
+    ):
+        cases[f"{taxonomy} / {topology} / {sort} / {length}"] = replace(
+            base,
+            random_selection=False,
+            **TOPOLOGIES[topology],
+            **SORTS[sort],
+            **LENGTHS[length],
+        )
+    for (taxonomy, base), (name, ranges) in itertools.product(
+        taxonomy_filters.items(), RANGES.items()
+    ):
+        cases[f"{taxonomy} / {name}"] = replace(
+            base, random_selection=False, ranges=ranges
+        )
+    cases["random"] = DBFilter()
+    return cases
+
+
+def second_page(db_filter: DBFilter) -> DBFilter:
+    last = list(database.get_sequence_data(db_filter).dicts())[-1]
+    sort_column = database.SORT_COLUMNS[db_filter.sort_key]
+    return db_filter.next_page(last[sort_column.name], last["id"])
+
+
+def sample_accessions(count: int) -> list[str]:
+    """Accessions spread over the id range, so each run reads other pages."""
+    max_id = Sequence.select(fn.MAX(Sequence.id)).scalar() or 0
+    step = max(max_id // (count + 1), 1)
+    return [
+        Sequence.select(Sequence.uniprot_accession)
+        .where(Sequence.id >= step * (i + 1))
+        .order_by(Sequence.id)
+        .scalar()
+        for i in range(count)
+    ]
+
+
+def query_plan(statements: list[tuple[str, tuple]]) -> list[str]:
+    """One line per statement: its plan steps, nested steps prefixed with ">"."""
+    shapes = []
+    for sql, params in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        rows = DATABASE.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        depth = {0: 0}
+        steps = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            steps.append(">" * (depth[node_id] - 1) + detail)
+        shapes.append(" | ".join(steps))
+    return shapes
+
+
+def measure(run, repeat: int, warmup: int) -> CaseResult:
+    """Runs ``run(i)`` with the peewee statements of the first run logged."""
+    query_log = QueryLog()
+    logger = logging.getLogger("peewee")
+    level = logger.level
+    logger.addHandler(query_log)
+    logger.setLevel(logging.DEBUG)
+    try:
+        rows = run(0)
+    finally:
+        logger.removeHandler(query_log)
+        logger.setLevel(level)
+
+    for i in range(warmup):
+        run(i)
+    durations = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        run(i)
+        durations.append((time.perf_counter() - started) * 1000)
+    p95 = stats.quantiles(durations, n=20)[18] if len(durations) > 1 else durations[0]
+    return CaseResult(
+        rows=rows,
+        p50_ms=stats.median(durations),
+        p95_ms=p95,
+        plan=query_plan(query_log.statements),
+    )
+
+
+def run_cases(repeat: int, warmup: int, pattern: str | None) -> dict[str, CaseResult]:
+    cases = {}
+    for name, db_filter in filter_cases().items():
+        planned = statistics.plan_ranges(db_filter)
+        cases[name] = lambda i, f=planned: len(
+            list(database.get_sequence_data(f).tuples())
+        )
+        if db_filter.is_sorted and name.startswith("all /"):
+            page = second_page(planned)
+            cases[f"{name} / page 2"] = lambda i, f=page: len(
+                list(database.get_sequence_data(f).tuples())
+            )
+
+    accessions = sample_accessions(max(repeat, warmup, 1))
+    cases["protein details"] = lambda i: int(
+        database.get_sequence_data_for_id(accessions[i]) is not None
+    )
+    cases["protein sequence"] = lambda i: int(
+        database.get_sequence_for_id(accessions[i]) is not None
+    )
+    cases["membrane annotation"] = lambda i: len(
+        database.get_membrane_annotation_for_id(accessions[i])
+    )
+
+    results = {}
+    for name, run in cases.items():
+        if pattern is not None and pattern.lower() not in name.lower():
+            continue
+        results[name] = measure(run, repeat, warmup)
+        print_result(name, results[name])
+    return results
+
+
+def print_result(name: str, result: CaseResult):
+    print(
+        f"{name:<58}{result.rows:>7}{result.p50_ms:>11.2f}{result.p95_ms:>11.2f}",
+        flush=True,
+    )
+    for shape in result.plan:
+        print(f"    {shape}")
+
+
+def plan_features(plan: list[str]) -> Counter:
+    """Full table scans and temporary B-trees in the plan steps of a case."""
+    features = Counter()
+    for shape in plan:
+        for step in shape.split(" | "):
+            # Older SQLite versions write "SCAN TABLE t1"
+            step = step.lstrip(">").replace("SCAN TABLE ", "SCAN ")
+            if match := re.fullmatch(r"SCAN (\w+)", step):
+                features[f"full scan of {match[1]}"] += 1
+            elif step.startswith("USE TEMP B-TREE"):
+                features[step] += 1
+    return features
+
+
+def compare(
+    results: dict[str, CaseResult], baseline: dict, tolerance: float
+) -> tuple[int, int]:
+    """
+    Prints slower cases and changed plans. Returns the number of slower
+    cases and of cases whose plan got worse: a new full table scan or a new
+    temporary B-tree, the usual signs of a lost index. Other plan changes
+    are only printed.
+    """
+    slower = worse_plans = 0
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        # Sub-millisecond differences are noise, as are single slow runs,
+        # which only raise the p95
+        if (
+            result.p50_ms > before["p50_ms"] * tolerance
+            and result.p95_ms > before["p95_ms"] * tolerance
+            and result.p95_ms - before["p95_ms"] > 1
+        ):
+            slower += 1
+            print(
+                f"SLOWER {name}: p50 {before['p50_ms']:.2f} -> {result.p50_ms:.2f} ms, "
+                f"p95 {before['p95_ms']:.2f} -> {result.p95_ms:.2f} ms"
+            )
+        if result.plan != before["plan"]:
+            added = plan_features(result.plan) - plan_features(before["plan"])
+            if added:
+                worse_plans += 1
+            label = "PLAN WORSE" if added else "PLAN CHANGED"
+            print(f"{label} {name}: {', '.join(added) or 'other steps'}")
+            for shape in before["plan"]:
+                print(f"  - {shape}")
+            for shape in result.plan:
+                print(f"  + {shape}")
+    return slower, worse_plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/synthetic.db"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument(
+        "--filter", default=None, help="Only run cases containing this text."
+    )
+    parser.add_argument("--json", type=Path, default=None, help="Write the results.")
+    parser.add_argument(
+        "--baseline", type=Path, default=None, help="Results of an earlier --json."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="Allowed ratio of p50 and p95 to the baseline before a case is slower.",
+    )
+    parser.add_argument(
+        "--timing-advisory",
+        action="store_true",
+        help="Only fail on worse plans, e.g. against a baseline of another machine.",
+    )
+    args = parser.parse_args()
+
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        if database.SHARD_ROUTER.sharded:
+            parser.error(
+                f"{args.db} is the catalog of a sharded database, "
+                "benchmark a shard or the unsharded database instead"
+            )
+        database.set_pragma_settings(DATABASE)
+        print(f"{statistics.total_proteins() or 0:,} proteins in {args.db}")
+        print(f"{'case':<58}{'rows':>7}{'p50 [ms]':>11}{'p95 [ms]':>11}")
+        results = run_cases(args.repeat, args.warmup, args.filter)
+
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps({name: asdict(r) for name, r in results.items()}, indent=2)
+        )
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        slower, worse_plans = compare(results, baseline, args.tolerance)
+        print(
+            f"{slower} of {len(results)} cases slower, {worse_plans} with a worse "
+            f"plan than {args.baseline}"
+        )
+        if worse_plans or (slower and not args.timing_advisory):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
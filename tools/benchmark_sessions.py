@@ -0,0 +1,507 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Load test of concurrent app sessions with Streamlit's AppTest.
+
+Every session runs the app script in this process, like the sessions of one
+container, and repeats random user actions: random selections, filtered
+queries, choosing a protein in the table and visualizing a protein with
+another style and color scheme. Protein details are fetched from a local
+stub of the upstream APIs (utils.upstream_stub). Reports the rerun latency
+per action, the memory (RSS) of the process and the database contention:
+queries waiting for a query worker, queries narrowed by their budget or not
+run while all workers were busy, and requests shared by single-flight.
+
+AppTest always reruns the whole script, while in the app editing the filter
+form, choosing a protein below the table and visualizing a protein only
+rerun their fragment. The latencies of these actions are therefore upper
+bounds, marked with * in the report and left out of the totals.
+
+Example:
+    python tools/benchmark_sessions.py --db data/synthetic.db --sessions 8
+    python tools/benchmark_sessions.py --db data/synthetic.db --sessions 32 \
+        --actions 50 --think-time 2 --delay alphafold=1 --json sessions.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import resource
+import statistics as stats
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from peewee import fn
+
+SRC = (Path(__file__).parent / "../src").resolve()
+sys.path.append(SRC.as_posix())
+from utils import singleflight, statistics, timing, upstream_stub  # noqa: E402
+from utils.database import (  # noqa: E402
+    DATABASE,
+    SHARD_ROUTER,
+    ProteinShard,
+    Sequence,
+    SortKey,
+)
+from utils.lineage_definitions import (  # noqa: E402
+    Domain,
+    TaxaSelectionCriterion,
+    Topology,
+)
+from utils.protein_visualization import ColorScheme, ProteinStyle  # noqa: E402
+from utils.query_cache import QUERY_CACHE  # noqa: E402
+from utils.query_executor import QUERY_EXECUTOR  # noqa: E402
+from utils.upstream_stub import TYPICAL_DELAYS, UpstreamStub  # noqa: E402
+
+APP = SRC / "streamlitapp.py"
+
+# Relative frequency of the actions after a session opened the app
+ACTIONS = {
+    "random selection": 2,
+    "filter": 3,
+    "select protein": 3,
+    "visualize": 2,
+}
+# Actions that only rerun a fragment in the app but the whole script here
+FRAGMENT_ACTIONS = {"edit filter", "select protein", "visualize"}
+DOMAINS = [Domain.BACTERIA, Domain.EUKARYOTA, Domain.ARCHAEA, Domain.ALL]
+SORT_KEYS = [SortKey.NONE, SortKey.SEQUENCE_LENGTH, SortKey.TM_HELIX_COUNT]
+
+
+@dataclass
+class Rerun:
+    action: str
+    seconds: float
+    failed: bool
+
+
+@dataclass
+class Latency:
+    count: int
+    failed: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @classmethod
+    def of(cls, reruns: list[Rerun]):
+        ms = sorted(rerun.seconds * 1000 for rerun in reruns)
+        percentiles = (
+            stats.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+        )
+        return cls(
+            count=len(ms),
+            failed=sum(rerun.failed for rerun in reruns),
+            p50_ms=stats.median(ms),
+            p95_ms=percentiles[94],
+            p99_ms=percentiles[98],
+            max_ms=ms[-1],
+        )
+
+    def __str__(self):
+        return (
+            f"{self.count:>7}{self.failed:>7}{self.p50_ms:>10.0f}"
+            f"{self.p95_ms:>10.0f}{self.p99_ms:>10.0f}{self.max_ms:>10.0f}"
+        )
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak instead of current RSS without /proc; KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of the process until stopped."""
+
+    def __init__(self, interval: float = 0.25):
+        super().__init__(name="memory-sampler", daemon=True)
+        self.interval = interval
+        self.samples: list[int] = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.samples.append(rss_bytes())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Session:
+    """One simulated user; ``step`` runs one action and reruns the app."""
+
+    def __init__(
+        self,
+        rng: random.Random,
+        taxon_ids: list[str],
+        accessions: list[str],
+        timeout: float,
+    ):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP.as_posix(), default_timeout=timeout)
+        self.rng = rng
+        self.taxon_ids = taxon_ids
+        self.accessions = accessions
+        self.reruns: list[Rerun] = []
+        self.errors: Counter = Counter()
+
+    def _run(self, action: str):
+        started = time.perf_counter()
+        try:
+            self.at.run()
+            failed = bool(self.at.exception)
+            for exception in self.at.exception:
+                self.errors[exception.message.splitlines()[0][:120]] += 1
+        except Exception as e:
+            # AppTest raises when the rerun exceeds its timeout
+            failed = True
+            self.errors[f"{type(e).__name__}: {str(e)[:120]}"] += 1
+        self.reruns.append(Rerun(action, time.perf_counter() - started, failed))
+
+    def _button(self, label: str):
+        return next(button for button in self.at.button if button.label == label)
+
+    def open(self):
+        self._run("open")
+
+    def random_selection(self):
+        self._button("Show random selection").click()
+        self._run("random selection")
+
+    def filter(self):
+        """Edits the filter form like a user, then applies the filters."""
+        rng = self.rng
+        by_organism = rng.random() < 0.5
+        criterion = (
+            TaxaSelectionCriterion.ORGANISM
+            if by_organism
+            else TaxaSelectionCriterion.DOMAIN
+        )
+        self.at.radio(key="taxonomy_selection").set_value(criterion)
+        self._run("edit filter")
+        if by_organism:
+            self.at.number_input(key="organism_id").set_value(
+                int(rng.choice(self.taxon_ids))
+            )
+        else:
+            self.at.selectbox(key="domain").set_value(rng.choice(DOMAINS))
+        self._run("edit filter")
+
+        self.at.selectbox(key="topology").set_value(rng.choice(list(Topology)))
+        self.at.selectbox(key="sort_key").set_value(rng.choice(SORT_KEYS))
+        self._button("Apply filters").click()
+        self._run("apply filters")
+
+    def _table_accessions(self) -> list[str]:
+        data = self.at.session_state["data"]
+        return [] if data.empty else list(data["UniProt Accession"])
+
+    def select_protein(self):
+        """Chooses another protein below the table, or fills the table first."""
+        choices = [
+            selectbox
+            for selectbox in self.at.selectbox
+            if selectbox.label.startswith("Choose an ID")
+        ]
+        if not choices or self.at.session_state["active_tab"] != "Database":
+            self.random_selection()
+            return
+        data = self.at.session_state["data"]
+        choices[0].set_value(self.rng.choice(list(data["UniProt ID"])))
+        self._run("select protein")
+
+    def visualize(self):
+        """Visualizes a protein of the table with a random style and colors."""
+        accession = self.rng.choice(self._table_accessions() or self.accessions)
+        self.at.text_input(key="visualization_id").input(accession)
+        self.at.selectbox(key="visualization_style").set_value(
+            self.rng.choice(list(ProteinStyle))
+        )
+        self.at.selectbox(key="color_scheme").set_value(
+            self.rng.choice(list(ColorScheme))
+        )
+        self._button("Visualize Protein").click()
+        self._run("visualize")
+
+    def step(self):
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        try:
+            getattr(self, action.replace(" ", "_"))()
+        except (KeyError, StopIteration):
+            # A failed rerun left out the widget; reload the app like a user
+            self.errors[f"{action}: widget missing after a failed rerun"] += 1
+            self.open()
+
+
+def share_runtime():
+    """
+    Shares the mock Runtime and the script cache of AppTest between sessions.
+
+    AppTest installs a Runtime for each run and removes it when the run ends,
+    which fails the runs of other sessions still in progress, and compiles the
+    script on every run. Like a server, all sessions share one Runtime, the
+    one installed last, and one script cache.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+
+    latest = None
+
+    def instance(cls):
+        nonlocal latest
+        if cls._instance is not None:
+            latest = cls._instance
+        if latest is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return latest
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(
+        lambda cls: cls._instance is not None or latest is not None
+    )
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+
+
+def run_session(session: Session, actions: int, think_time: float, start: float):
+    time.sleep(start)
+    session.open()
+    for _ in range(actions):
+        if think_time > 0:
+            time.sleep(session.rng.expovariate(1 / think_time))
+        session.step()
+    return session
+
+
+def contention() -> dict:
+    executor = QUERY_EXECUTOR.stats()
+    cache = QUERY_CACHE.stats()
+    return {
+        "query executor": {
+            **asdict(executor),
+            "mean_wait_seconds": executor.mean_wait_seconds,
+        },
+        "query cache hit ratio": cache.hit_ratio,
+        "single-flight": {
+            group.name: {"executed": group.executed, "collapsed": group.collapsed}
+            for group in singleflight.all_stats()
+        },
+    }
+
+
+def print_report(reruns: list[Rerun], seconds: float, memory: dict, db: dict):
+    print(
+        f"{'action':<20}{'reruns':>7}{'failed':>7}{'p50 [ms]':>10}"
+        f"{'p95 [ms]':>10}{'p99 [ms]':>10}{'max [ms]':>10}"
+    )
+    for action in ["open", "random selection", "edit filter", "apply filters"] + [
+        "select protein",
+        "visualize",
+    ]:
+        action_reruns = [rerun for rerun in reruns if rerun.action == action]
+        if action_reruns:
+            label = f"{action} *" if action in FRAGMENT_ACTIONS else action
+            print(f"{label:<20}{Latency.of(action_reruns)}")
+    full_reruns = [rerun for rerun in reruns if rerun.action not in FRAGMENT_ACTIONS]
+    print(f"{'full reruns':<20}{Latency.of(full_reruns)}")
+    print("* upper bound: a full rerun here, a fragment rerun in the app")
+    print(f"{len(full_reruns) / seconds:.1f} full reruns/s over {seconds:.0f}s")
+
+    mib = 2**20
+    print(
+        f"RSS: {memory['start'] / mib:,.0f} MiB at start, "
+        f"{memory['peak'] / mib:,.0f} MiB peak, {memory['end'] / mib:,.0f} MiB at "
+        f"the end, {memory['growth_per_rerun'] / 1024:,.1f} KiB per rerun"
+    )
+
+    executor = db["query executor"]
+    print(
+        f"Queries: {executor['queries']} on {executor['workers']} workers, "
+        f"{executor['narrowed']} narrowed by their budget, "
+        f"{executor['busy']} not run while busy, "
+        f"up to {executor['max_queued']} waiting, "
+        f"wait {executor['mean_wait_seconds'] * 1000:.1f} ms mean / "
+        f"{executor['max_wait_seconds'] * 1000:.1f} ms max"
+    )
+    print(f"Query cache hit ratio: {db['query cache hit ratio']:.1%}")
+    for name, group in db["single-flight"].items():
+        print(
+            f"Single-flight {name}: {group['executed']} executed, "
+            f"{group['collapsed']} shared"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/synthetic.db"))
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument(
+        "--actions", type=int, default=20, help="Actions per session after opening."
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=1.0,
+        help="Mean seconds between two actions of a session (exponential).",
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=5.0,
+        help="Seconds over which the sessions start.",
+    )
+    parser.add_argument(
+        "--delay",
+        action="append",
+        default=[],
+        metavar="SERVICE=SECONDS",
+        help=f"Upstream delay per service, defaults: {TYPICAL_DELAYS}.",
+    )
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        default=[],
+        metavar="SERVICE=SHARE",
+        help="Share of failed (503) upstream responses per service.",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="Seconds before a rerun fails."
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", type=Path, default=None, help="Write the results.")
+    args = parser.parse_args()
+    # Failed reruns are counted instead of logged
+    logging.basicConfig(level=logging.CRITICAL)
+
+    import streamlit.config
+    import streamlit.logger
+
+    # AppTest runs without a Streamlit server, which Streamlit warns about.
+    # Parsing the config first keeps it from resetting the log level later.
+    streamlit.config.get_option("logger.level")
+    streamlit.logger.set_log_level(logging.ERROR)
+    share_runtime()
+
+    rng = random.Random(args.seed)
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        taxon_ids = [taxon_id for _, taxon_id, *_ in statistics.load_top_organisms()]
+        # The catalog of a sharded database lists the proteins of all shards
+        proteins = ProteinShard if SHARD_ROUTER.sharded else Sequence
+        max_id = proteins.select(fn.MAX(proteins.id)).scalar() or 0
+        ids = rng.sample(range(1, max_id + 1), min(100, max_id))
+        accessions = [
+            accession
+            for (accession,) in proteins.select(proteins.uniprot_accession)
+            .where(proteins.id.in_(ids))
+            .tuples()
+        ]
+    if not taxon_ids:
+        raise ValueError("The database has no statistics, run build_statistics.py")
+
+    behaviors = upstream_stub.service_behaviors(
+        args.delay, args.error_rate, args.jitter
+    )
+    with UpstreamStub(
+        {}, behaviors, seed=args.seed, fallback=upstream_stub.database_response
+    ) as stub:
+        stub.patch_api()
+        sessions = [
+            Session(random.Random(rng.random()), taxon_ids, accessions, args.timeout)
+            for _ in range(args.sessions)
+        ]
+        print(
+            f"{args.sessions} sessions with {args.actions} actions each, "
+            f"upstream stub at {stub.url}"
+        )
+
+        gc.collect()
+        memory = {"start": rss_bytes()}
+        sampler = MemorySampler()
+        sampler.start()
+        timing.reset()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.sessions) as executor:
+            futures = [
+                executor.submit(
+                    run_session,
+                    session,
+                    args.actions,
+                    args.think_time,
+                    args.ramp_up * i / args.sessions,
+                )
+                for i, session in enumerate(sessions)
+            ]
+            for future in futures:
+                future.result()
+        seconds = time.perf_counter() - started
+        sampler.stop()
+        gc.collect()
+        upstream_requests = dict(stub.requests)
+        upstream_errors = dict(stub.errors)
+
+    reruns = [rerun for session in sessions for rerun in session.reruns]
+    memory["end"] = rss_bytes()
+    memory["peak"] = max(sampler.samples + [memory["start"], memory["end"]])
+    memory["growth_per_rerun"] = (memory["end"] - memory["start"]) / len(reruns)
+    db = contention()
+    print_report(reruns, seconds, memory, db)
+    failed = sum(upstream_errors.values())
+    print(f"Upstream requests: {upstream_requests} ({failed} failed)")
+    errors = sum((session.errors for session in sessions), Counter())
+    for message, count in errors.most_common(5):
+        print(f"{count:>5} x {message}")
+
+    if args.json is not None:
+        actions = {rerun.action for rerun in reruns}
+        args.json.write_text(
+            json.dumps(
+                {
+                    "sessions": args.sessions,
+                    "seconds": seconds,
+                    "actions": {
+                        action: asdict(
+                            Latency.of([r for r in reruns if r.action == action])
+                        )
+                        for action in sorted(actions)
+                    },
+                    "full reruns": asdict(
+                        Latency.of(
+                            [r for r in reruns if r.action not in FRAGMENT_ACTIONS]
+                        )
+                    ),
+                    "upper bounds": sorted(FRAGMENT_ACTIONS),
+                    "memory": memory,
+                    "contention": db,
+                    "upstream": {
+                        "requests": upstream_requests,
+                        "errors": upstream_errors,
+                    },
+                    "app timings": timing.summary(),
+                    "errors": dict(errors),
+                },
+                indent=2,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Build TMvisDB from the TMbed prediction export (one JSON document per line).
+
+Replaces the row-by-row load of tools/convert_mongodp.ipynb. Organisms
+without lineage in the export can be mapped to current taxon ids with the
+replacement CSV (obsolete id, current id) written by that notebook; other
+taxa are looked up in the UniProt taxonomy like the notebook did. The exit
+code is 1 if proteins were skipped because their taxon could not be found.
+
+With --update, new prediction chunks are merged into an existing database.
+Only new and changed proteins are written; an interrupted update resumes
+from its last commit when run again.
+
+With --optimized-layout, the export is loaded into a staging file next to
+--db, which is then written as the read-optimized copy of
+tools/optimize_database.py.
+
+Example:
+    python tools/build_database.py data/tmvis.json --db data/tmvis.db \
+        --replacements data/replacement_taxon_id.csv --workers 16
+    python tools/build_database.py data/tmvis.json --db data/tmvis.db \
+        --optimized-layout --page-size 8192
+    python tools/build_database.py data/tmvis_2024_06.json --db data/tmvis.db \
+        --update --statistics
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import db_layout, statistics, tmvis_import  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("export", type=Path)
+    parser.add_argument("--db", type=Path, default=Path("data/tmvis.db"))
+    parser.add_argument("--replacements", type=Path, default=None)
+    parser.add_argument(
+        "--missing-taxa",
+        type=Path,
+        default=Path("data/missing_taxon_id.csv"),
+        help="Taxon ids of skipped proteins are written here.",
+    )
+    parser.add_argument(
+        "--no-taxonomy-lookup",
+        action="store_true",
+        help="Skip proteins of unknown taxa instead of asking the UniProt taxonomy.",
+    )
+    parser.add_argument(
+        "--allow-skipped",
+        action="store_true",
+        help="Exit with 0 even if proteins were skipped.",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-lines", type=int, default=2000)
+    parser.add_argument("--commit-every", type=int, default=None)
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Merge the export into an existing database.",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Import the whole export again instead of resuming an update.",
+    )
+    parser.add_argument(
+        "--optimized-layout",
+        action="store_true",
+        help="Cluster the new database by organism and length, see utils.db_layout.",
+    )
+    parser.add_argument("--page-size", type=int, default=db_layout.PAGE_SIZE)
+    statistics_group = parser.add_mutually_exclusive_group()
+    statistics_group.add_argument(
+        "--no-statistics",
+        action="store_true",
+        help="Skip ANALYZE and the statistics of tools/build_statistics.py.",
+    )
+    statistics_group.add_argument(
+        "--statistics",
+        action="store_true",
+        help="Rebuild the statistics after an update.",
+    )
+    args = parser.parse_args()
+    if args.optimized_layout and (args.update or args.no_statistics):
+        parser.error("--optimized-layout builds a new database with statistics")
+    return args
+
+
+def read_replacements(path: Path | None) -> dict[str, str]:
+    if path is None:
+        return {}
+    with path.open() as f:
+        return {original: replacement for original, replacement in csv.reader(f)}
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db_path = args.db.resolve()
+    if args.optimized_layout:
+        db_path = db_path.with_name(db_path.name + ".staging")
+        db_path.unlink(missing_ok=True)
+
+    DATABASE.init(db_path.as_posix())
+    with DATABASE.connection_context():
+        if args.update:
+            stats, missing = tmvis_import.update_database(
+                args.export,
+                replacements=read_replacements(args.replacements),
+                workers=args.workers,
+                batch_lines=args.batch_lines,
+                commit_every=args.commit_every or 50000,
+                restart=args.restart,
+                lookup_taxa=not args.no_taxonomy_lookup,
+            )
+            build_statistics = args.statistics
+        else:
+            stats, missing = tmvis_import.build_database(
+                args.export,
+                replacements=read_replacements(args.replacements),
+                workers=args.workers,
+                batch_lines=args.batch_lines,
+                commit_every=args.commit_every or 200000,
+                indexed=not args.optimized_layout,
+                lookup_taxa=not args.no_taxonomy_lookup,
+            )
+            build_statistics = not args.no_statistics and not args.optimized_layout
+        if build_statistics:
+            statistics.build_statistics()
+
+    if missing:
+        args.missing_taxa.parent.mkdir(parents=True, exist_ok=True)
+        with args.missing_taxa.open("w") as f:
+            f.writelines(f"{taxon_id},\n" for taxon_id in sorted(missing))
+        logging.info(f"{len(missing)} taxon ids without organism: {args.missing_taxa}")
+
+    if args.optimized_layout:
+        report = db_layout.write_optimized(db_path, args.db, page_size=args.page_size)
+        db_path.unlink()
+        report.log()
+
+    stats.log("Done")
+    if stats.skipped and not args.allow_skipped:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Compute the statistics used to plan and estimate TMvisDB filter queries.
+
+Run after every import; the app reloads the statistics when the database
+file changes.
+
+Example:
+    python tools/build_statistics.py --db data/tmvis.db --buckets 100
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import statistics  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/tmvis.db"))
+    parser.add_argument("--buckets", type=int, default=statistics.NUM_BUCKETS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        statistics.build_statistics(args.buckets)
+
+    logging.info("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Export the browse columns of TMvisDB to a Parquet snapshot.
+
+The snapshot is partitioned by super kingdom and read by the optional DuckDB
+analytics engine when PARQUET_DIR points to it. Needs the analytics extra
+(pyarrow, duckdb). Export again after every import: the app ignores a
+snapshot exported from another build of the database.
+
+Example:
+    python tools/export_parquet.py --db data/tmvis.db --out data/parquet
+    PARQUET_DIR=data/parquet streamlit run src/streamlitapp.py
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import parquet_export  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/tmvis.db"))
+    parser.add_argument("--out", type=Path, default=Path("data/parquet"))
+    parser.add_argument("--batch-size", type=int, default=parquet_export.BATCH_SIZE)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        counts = parquet_export.export_parquet(args.out.resolve(), args.batch_size)
+
+    for partition, count in sorted(counts.items()):
+        logging.info(f"{partition}: {count:,} proteins")
+    logging.info("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Generate a synthetic TMvisDB for benchmarks.
+
+The database has the schema, indexes and statistics of a database built by
+tools/build_database.py, with proteins drawn from the distributions in
+utils.synthetic_data. The same seed always gives the same database.
+
+Example:
+    python tools/generate_synthetic_db.py --sequences 1000000 --db data/synthetic.db
+    python tools/generate_synthetic_db.py --sequences 50000000 \
+        --db data/synthetic_50m.db --organisms 200000
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils.database import DATABASE  # noqa: E402
+from utils.synthetic_data import SyntheticConfig, generate_database  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sequences", type=int, default=1000000)
+    parser.add_argument("--db", type=Path, default=Path("data/synthetic.db"))
+    parser.add_argument(
+        "--organisms",
+        type=int,
+        default=None,
+        help="Defaults to one organism per 2,000 sequences.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=100000)
+    parser.add_argument(
+        "--overwrite", action="store_true", help="Replace an existing --db."
+    )
+    args = parser.parse_args()
+    if args.db.exists() and not args.overwrite:
+        parser.error(f"{args.db} exists, pass --overwrite to replace it")
+    return args
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    args.db.unlink(missing_ok=True)
+    args.db.parent.mkdir(parents=True, exist_ok=True)
+    DATABASE.init(args.db.resolve().as_posix())
+    with DATABASE.connection_context():
+        generate_database(
+            SyntheticConfig(
+                sequences=args.sequences,
+                organisms=args.organisms,
+                seed=args.seed,
+                batch_size=args.batch_size,
+            )
+        )
+    logging.info(f"Wrote {args.sequences:,} synthetic sequences to {args.db}")
+
+
+if __name__ == "__main__":
+    main()
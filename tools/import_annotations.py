@@ -0,0 +1,69 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Bulk-import UniProt and TmAlphaFold transmembrane annotations into TMvisDB.
+
+Examples:
+    python tools/import_annotations.py --db data/tmvis.db uniprot --format xml uniprot_sprot.xml.gz
+    python tools/import_annotations.py --db data/tmvis.db tmalphafold data/tmdet/
+"""
+import argparse
+import logging
+import sys
+from datetime import date
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import annotation_import  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--db", type=Path, default=Path("data/tmvis.db"))
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument(
+        "--date-added",
+        type=date.fromisoformat,
+        default=None,
+        help="Release date of the dump (default: today).",
+    )
+
+    sources = parser.add_subparsers(dest="source", required=True)
+
+    uniprot = sources.add_parser("uniprot", help="UniProtKB flat, XML or JSON dump.")
+    uniprot.add_argument("path", type=Path)
+    uniprot.add_argument("--format", choices=["flat", "xml", "json"], default="xml")
+
+    tmalphafold = sources.add_parser(
+        "tmalphafold", help="Directory of TMDET JSON results."
+    )
+    tmalphafold.add_argument("path", type=Path)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    DATABASE.init(args.db.resolve().as_posix())
+    kwargs = {"batch_size": args.batch_size, "date_added": args.date_added}
+
+    with DATABASE.connection_context():
+        if args.source == "uniprot":
+            num_sequences, num_annotations = annotation_import.import_uniprot(
+                args.path, args.format, **kwargs
+            )
+        else:
+            num_sequences, num_annotations = annotation_import.import_tmalphafold(
+                args.path, **kwargs
+            )
+
+    logging.info(
+        f"Done: {num_annotations} annotations for {num_sequences} sequences."
+    )
+
+
+if __name__ == "__main__":
+    main()
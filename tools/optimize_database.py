@@ -0,0 +1,57 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Write a read-optimized copy of a TMvisDB file.
+
+Replaces the REINDEX, VACUUM and ANALYZE steps of tools/optimize_db.ipynb.
+Proteins are clustered by organism and length in a file with a larger page
+size, indexes and statistics are built afterwards, and the file size and
+query times of both files are reported.
+
+Example:
+    python tools/optimize_database.py data/tmvis.db data/tmvis_optimized.db
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import db_layout, statistics  # noqa: E402
+from utils.database import DATABASE  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("source", type=Path)
+    parser.add_argument("target", type=Path)
+    parser.add_argument("--page-size", type=int, default=db_layout.PAGE_SIZE)
+    parser.add_argument("--buckets", type=int, default=statistics.NUM_BUCKETS)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Runs per benchmark query."
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    DATABASE.init(args.source.resolve().as_posix())
+    with DATABASE.connection_context():
+        before = db_layout.report(args.source, args.repeat)
+
+    after = db_layout.write_optimized(
+        args.source,
+        args.target,
+        page_size=args.page_size,
+        num_buckets=args.buckets,
+        repeat=args.repeat,
+    )
+    before.log()
+    after.log()
+
+
+if __name__ == "__main__":
+    main()
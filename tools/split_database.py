@@ -0,0 +1,45 @@
+# Copyright 2024 RostLab.
+# SPDX-License-Identifier: 	AGPL-3.0-or-later
+"""
+Split a TMvisDB file into one shard per super kingdom.
+
+The directory receives a shard file per super kingdom and catalog.db, which
+holds the organisms, the statistics, the list of shards and the shard of
+every protein. Point DATABASE_URL to the catalog to serve the sharded
+database; queries are only sent to the shards their filter can match. Build
+the statistics of the source (tools/build_statistics.py) before splitting.
+
+Example:
+    python tools/split_database.py data/tmvis.db data/shards
+    DATABASE_URL=sqlite:///data/shards/catalog.db streamlit run src/streamlitapp.py
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str((Path(__file__).parent / "../src").resolve().as_posix()))
+from utils import db_layout  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("source", type=Path)
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--page-size", type=int, default=db_layout.PAGE_SIZE)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    shards = db_layout.split_database(
+        args.source.resolve(), args.directory.resolve(), page_size=args.page_size
+    )
+    logging.info(f"Done: {len(shards)} shards")
+
+
+if __name__ == "__main__":
+    main()